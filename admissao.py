@@ -0,0 +1,184 @@
+"""
+Controle de admissão e descarte de carga na frente das rotas de validação.
+
+Cada worker mantém um limite de requisições simultâneas (em voo) que se
+adapta à latência observada, no estilo "gradient": enquanto a latência
+recente fica próxima da latência de referência o limite cresce; quando o
+Mongo fica lento e a latência sobe, o limite encolhe. Requisições acima do
+limite esperam numa fila curta e limitada; se a fila estiver cheia, ou a
+espera passar de `ADMISSAO_ESPERA_MAX_MS`, a resposta é um 503 imediato com
+`Retry-After`, em vez de acumular corrotinas na fila de espera do Motor.
+"""
+from collections import deque
+import asyncio
+import json
+import logging
+import math
+import os
+import time
+import metricas
+
+logger = logging.getLogger(__name__)
+
+# ─── Configuração ────────────────────────────
+ADMISSAO_ROTAS = tuple(r for r in os.getenv("ADMISSAO_ROTAS", "/validar").split(",") if r)  # prefixos de rota protegidos
+ADMISSAO_LIMITE_INICIAL = int(os.getenv("ADMISSAO_LIMITE_INICIAL", 50))    # limite de concorrência inicial por worker
+ADMISSAO_LIMITE_MIN = int(os.getenv("ADMISSAO_LIMITE_MIN", 5))             # piso do limite adaptativo
+ADMISSAO_LIMITE_MAX = int(os.getenv("ADMISSAO_LIMITE_MAX", 300))           # teto (não faz sentido passar de MONGO_MAX_POOL)
+ADMISSAO_FILA_MAX = int(os.getenv("ADMISSAO_FILA_MAX", 100))               # nº máx. de requisições aguardando vaga
+ADMISSAO_ESPERA_MAX_MS = int(os.getenv("ADMISSAO_ESPERA_MAX_MS", 500))     # tempo máx. aguardando vaga antes do 503
+ADMISSAO_TOLERANCIA = float(os.getenv("ADMISSAO_TOLERANCIA", 1.5))         # quanto a latência recente pode exceder a de referência
+ADMISSAO_RETRY_AFTER_S = int(os.getenv("ADMISSAO_RETRY_AFTER_S", 1))       # valor do header Retry-After nos 503
+
+
+class LimitadorAdaptativo:
+    """
+    Semáforo com limite adaptativo e fila limitada.
+
+    O limite segue `limite * gradiente + sqrt(limite)`, onde
+    `gradiente = clamp(tolerancia * rtt_longo / rtt_curto, 0.5, 1.0)`;
+    `rtt_curto` e `rtt_longo` são médias móveis exponenciais da latência.
+    """
+
+    def __init__(
+        self,
+        limite_inicial: int = ADMISSAO_LIMITE_INICIAL,
+        limite_min: int = ADMISSAO_LIMITE_MIN,
+        limite_max: int = ADMISSAO_LIMITE_MAX,
+        fila_max: int = ADMISSAO_FILA_MAX,
+        espera_max_ms: int = ADMISSAO_ESPERA_MAX_MS,
+        tolerancia: float = ADMISSAO_TOLERANCIA,
+    ):
+        self.limite = float(limite_inicial)
+        self.limite_min = limite_min
+        self.limite_max = limite_max
+        self.fila_max = fila_max
+        self.espera_max_s = espera_max_ms / 1000
+        self.tolerancia = tolerancia
+        self.em_voo = 0
+        self.rtt_curto = 0.0
+        self.rtt_longo = 0.0
+        self._fila = deque()
+
+    @property
+    def profundidade_fila(self) -> int:
+        return len(self._fila)
+
+    async def adquirir(self) -> bool:
+        """Obtém uma vaga; retorna False quando a requisição deve ser descartada."""
+        if self.em_voo < int(self.limite) and not self._fila:
+            self.em_voo += 1
+            return True
+
+        if len(self._fila) >= self.fila_max:
+            return False
+
+        futuro = asyncio.get_running_loop().create_future()
+        self._fila.append(futuro)
+        try:
+            # a vaga é transferida por `_acordar`, que já incrementa em_voo
+            await asyncio.wait_for(futuro, self.espera_max_s)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        except asyncio.CancelledError:
+            # cliente desistiu depois de já ter recebido a vaga: devolve sem medir latência
+            if futuro.done() and not futuro.cancelled():
+                self.em_voo -= 1
+                self._acordar()
+            raise
+        finally:
+            if not futuro.done() or futuro.cancelled():
+                try:
+                    self._fila.remove(futuro)
+                except ValueError:
+                    pass
+
+    def liberar(self, latencia_s: float) -> None:
+        """Devolve a vaga e alimenta o limite com a latência medida."""
+        self.em_voo -= 1
+        self._atualizar_limite(latencia_s)
+        self._acordar()
+
+    def _atualizar_limite(self, rtt: float) -> None:
+        if self.rtt_longo == 0:
+            self.rtt_curto = self.rtt_longo = rtt
+            return
+
+        self.rtt_curto += (rtt - self.rtt_curto) * 0.2
+        self.rtt_longo += (rtt - self.rtt_longo) * 0.01
+        # recuperação: se a referência ficou muito acima do atual, deixa ela cair mais rápido
+        if self.rtt_longo > 2 * self.rtt_curto:
+            self.rtt_longo *= 0.95
+
+        gradiente = max(0.5, min(1.0, self.tolerancia * self.rtt_longo / self.rtt_curto))
+        novo = self.limite * gradiente + math.sqrt(self.limite)
+        novo = self.limite * 0.8 + novo * 0.2
+        self.limite = max(self.limite_min, min(self.limite_max, novo))
+
+    def _acordar(self) -> None:
+        while self._fila and self.em_voo < int(self.limite):
+            futuro = self._fila.popleft()
+            if futuro.done():
+                continue
+            self.em_voo += 1
+            futuro.set_result(True)
+
+
+limitador = LimitadorAdaptativo()
+
+metricas.descrever("admissao_descartes_total", "counter", "Requisições recusadas com 503 pelo controle de admissão")
+metricas.registrar_gauge("admissao_em_voo", lambda: limitador.em_voo, "Requisições em processamento")
+metricas.registrar_gauge("admissao_fila", lambda: limitador.profundidade_fila, "Requisições aguardando vaga")
+metricas.registrar_gauge("admissao_limite", lambda: int(limitador.limite), "Limite de concorrência adaptativo atual")
+metricas.registrar_gauge("admissao_rtt_ms", lambda: {
+    (("janela", "curta"),): round(limitador.rtt_curto * 1000, 2),
+    (("janela", "longa"),): round(limitador.rtt_longo * 1000, 2),
+}, "Médias móveis da latência usadas no ajuste do limite")
+
+
+class AdmissaoMiddleware:
+    """
+    Middleware ASGI que passa pelas vagas de `limitador` as requisições cujo
+    path começa com um dos prefixos de `ADMISSAO_ROTAS`.
+    """
+
+    def __init__(self, app, rotas: tuple = ADMISSAO_ROTAS, limitador_: LimitadorAdaptativo = None):
+        self.app = app
+        self.rotas = rotas
+        self.limitador = limitador_ or limitador
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith(self.rotas):
+            await self.app(scope, receive, send)
+            return
+
+        if not await self.limitador.adquirir():
+            metricas.incrementar("admissao_descartes_total", rota=scope["path"])
+            # debug: sob tempestade de descarte o contador já conta a história, sem inundar errors.log
+            logger.debug(
+                f"[admissao] Descartando {scope['path']}: em_voo={self.limitador.em_voo} "
+                f"limite={int(self.limitador.limite)} fila={self.limitador.profundidade_fila}"
+            )
+            await _responder_503(send)
+            return
+
+        inicio = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.limitador.liberar(time.perf_counter() - inicio)
+
+
+async def _responder_503(send) -> None:
+    corpo = json.dumps({"detail": "Servidor sobrecarregado, tente novamente."}, ensure_ascii=False).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": 503,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(corpo)).encode()),
+            (b"retry-after", str(ADMISSAO_RETRY_AFTER_S).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": corpo})
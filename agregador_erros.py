@@ -0,0 +1,178 @@
+"""
+Telemetria agregada dos erros de validação (422 do `/validar`).
+
+Em vez de uma linha de `errors.log` por erro do Pydantic, cada erro só
+incrementa um contador em memória, chaveado por
+(CNPJ do cliente, `TpEvento`, campo, tipo do erro), guardando a última
+mensagem e até `ERROS_AMOSTRAS_POR_CHAVE` payloads de amostra (com os
+documentos anonimizados como na captura do `replay_trafego`).
+
+ - A cada `ERROS_FLUSH_INTERVALO_S` a janela é descarregada: uma linha por
+   chave no `errors.log` (contagem da janela + mensagem + amostras) e um
+   `$inc` na coleção `erros_validacao` (um documento por chave por dia),
+   que soma os workers. Com o Mongo fora, as atualizações ficam pendentes
+   para o próximo ciclo; numa falha parcial, só as que falharam (os `$inc`
+   aplicados não podem ser repetidos).
+ - O dia do documento é o dia UTC, tanto na gravação quanto no filtro de
+   `principais_regras`.
+ - `GET /admin/erros` lê essa coleção: as regras que mais falham por cliente.
+ - `ERROS_LOG_DETALHADO_CNPJ`: para esse cliente, o log continua linha a
+   linha como antes (um "Campo: ... | Erro: ..." por erro), para depuração.
+ - A janela tem no máximo `ERROS_MAX_CHAVES` chaves; além disso o erro só
+   conta em `erros_validacao_descartados_total`.
+"""
+from datetime import datetime, timedelta, timezone
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from database import db, breaker_mongo
+from replay_trafego import anonimizar, CAPTURA_SEGREDO
+import asyncio
+import logging
+import os
+import metricas
+
+logger = logging.getLogger(__name__)
+
+# ─── Configuração ────────────────────────────
+ERROS_FLUSH_INTERVALO_S = float(os.getenv("ERROS_FLUSH_INTERVALO_S", 60))   # período de descarga da janela
+ERROS_AMOSTRAS_POR_CHAVE = int(os.getenv("ERROS_AMOSTRAS_POR_CHAVE", 3))    # payloads de amostra por chave e janela
+ERROS_MAX_CHAVES = int(os.getenv("ERROS_MAX_CHAVES", 10000))                # limite de chaves distintas por janela
+ERROS_LOG_DETALHADO_CNPJ = os.getenv("ERROS_LOG_DETALHADO_CNPJ", "")        # cliente com log de cada erro (opt-in)
+
+COLECAO = "erros_validacao"
+
+
+def campo_do_erro(err: dict) -> str:
+    """Caminho do campo de um erro do Pydantic ("geral" para erros do modelo)."""
+    return "geral" if not err["loc"] else " -> ".join(str(loc) for loc in err["loc"])
+
+
+class AgregadorErros:
+    def __init__(self):
+        self._janela = {}        # (cliente, evento, campo, tipo_erro) → {"total", "mensagem", "amostras"}
+        self._pendentes = []     # UpdateOne que não chegaram ao Mongo
+        self._chave = CAPTURA_SEGREDO.encode() if CAPTURA_SEGREDO else os.urandom(32)
+
+    def detalhado(self, cliente: str) -> bool:
+        return bool(ERROS_LOG_DETALHADO_CNPJ) and cliente == ERROS_LOG_DETALHADO_CNPJ
+
+    def registrar(self, cliente: str, evento: str, erros: list, payload: dict) -> None:
+        """Conta os erros de uma validação na janela atual (só memória, sem I/O)."""
+        amostra = None
+        for err in erros:
+            chave = (cliente, evento, campo_do_erro(err), err["type"])
+            item = self._janela.get(chave)
+            if item is None:
+                if len(self._janela) >= ERROS_MAX_CHAVES:
+                    metricas.incrementar("erros_validacao_descartados_total")
+                    continue
+                item = self._janela[chave] = {"total": 0, "mensagem": err["msg"], "amostras": []}
+            item["total"] += 1
+            item["mensagem"] = err["msg"]
+            if len(item["amostras"]) < ERROS_AMOSTRAS_POR_CHAVE:
+                if amostra is None:
+                    amostra = anonimizar(payload, cliente, self._chave)[0]
+                item["amostras"].append(amostra)
+        metricas.incrementar("erros_validacao_total", len(erros), evento=evento)
+
+    # ─── descarga ────────────────────────────
+    async def descarregar(self) -> int:
+        """Loga e persiste a janela atual. Retorna o nº de chaves descarregadas."""
+        janela, self._janela = self._janela, {}
+        agora = datetime.now(timezone.utc)
+        dia = agora.strftime("%Y-%m-%d")
+        operacoes = []
+        for (cliente, evento, campo, tipo_erro), item in sorted(janela.items(), key=lambda kv: -kv[1]["total"]):
+            logger.error(
+                f"[erros] {evento} do cliente {cliente}: {item['total']} erro(s) no campo {campo} "
+                f"({tipo_erro}) | Erro: {item['mensagem']}",
+                extra={"amostras": item["amostras"]},
+            )
+            operacoes.append(UpdateOne(
+                {"_id": f"{dia}|{cliente}|{evento}|{campo}|{tipo_erro}"},
+                {
+                    "$inc": {"total": item["total"]},
+                    "$set": {"mensagem": item["mensagem"], "ultima_em": agora},
+                    "$setOnInsert": {"dia": dia, "cliente": cliente, "evento": evento,
+                                     "campo": campo, "tipo_erro": tipo_erro},
+                    "$push": {"amostras": {"$each": item["amostras"], "$slice": -ERROS_AMOSTRAS_POR_CHAVE}},
+                },
+                upsert=True,
+            ))
+
+        operacoes = self._pendentes + operacoes
+        self._pendentes = []
+        if operacoes:
+            try:
+                async with breaker_mongo.protegido():
+                    await db[COLECAO].bulk_write(operacoes, ordered=False)
+            except Exception as e:
+                if isinstance(e, BulkWriteError):
+                    # ordered=False: todas as operações foram tentadas e só as de writeErrors falharam
+                    falhas = {err["index"] for err in e.details.get("writeErrors", [])}
+                    operacoes = [op for i, op in enumerate(operacoes) if i in falhas]
+                # guarda as mais recentes para o próximo ciclo; os logs já saíram
+                self._pendentes = operacoes[-ERROS_MAX_CHAVES:]
+                metricas.incrementar("erros_validacao_descargas_falhas_total")
+                logger.warning(f"[erros] Contagens não gravadas no Mongo, nova tentativa no próximo ciclo: {e!r}")
+        metricas.incrementar("erros_validacao_descargas_total")
+        return len(janela)
+
+    async def loop_descarga(self):
+        """Tarefa de fundo: descarrega a janela a cada ERROS_FLUSH_INTERVALO_S (e uma última vez ao parar)."""
+        try:
+            while True:
+                await asyncio.sleep(ERROS_FLUSH_INTERVALO_S)
+                await self.descarregar()
+        except asyncio.CancelledError:
+            await self.descarregar()
+            raise
+
+    def chaves(self) -> int:
+        return len(self._janela)
+
+
+agregador = AgregadorErros()
+
+
+async def principais_regras(cliente: str = None, dias: int = 7, limite: int = 10) -> dict:
+    """
+    Regras (evento, campo, tipo do erro) que mais falharam nos últimos `dias`,
+    por cliente: {cliente: [{evento, campo, tipo_erro, total, mensagem, amostras}, ...]}.
+    """
+    hoje = datetime.now(timezone.utc).date()     # o mesmo dia UTC usado em `descarregar`
+    desde = (hoje - timedelta(days=dias - 1)).isoformat()
+    filtro = {"dia": {"$gte": desde}}
+    if cliente:
+        filtro["cliente"] = cliente
+    pipeline = [
+        {"$match": filtro},
+        {"$sort": {"dia": 1}},
+        {"$group": {
+            "_id": {"cliente": "$cliente", "evento": "$evento", "campo": "$campo", "tipo_erro": "$tipo_erro"},
+            "total": {"$sum": "$total"},
+            "mensagem": {"$last": "$mensagem"},
+            "amostras": {"$last": "$amostras"},
+            "ultima_em": {"$max": "$ultima_em"},
+        }},
+        {"$sort": {"total": -1}},
+    ]
+    por_cliente = {}
+    async with breaker_mongo.protegido():
+        async for doc in db[COLECAO].aggregate(pipeline):
+            regras = por_cliente.setdefault(doc["_id"]["cliente"], [])
+            if len(regras) < limite:
+                regras.append({**{k: v for k, v in doc["_id"].items() if k != "cliente"},
+                               "total": doc["total"], "mensagem": doc["mensagem"],
+                               "amostras": doc["amostras"], "ultima_em": doc["ultima_em"]})
+    return por_cliente
+
+
+metricas.descrever("erros_validacao_total", "counter", "Erros de validação por TpEvento (todos os clientes)")
+metricas.descrever("erros_validacao_descartados_total", "counter",
+                   "Erros de validação fora da janela por exceder ERROS_MAX_CHAVES")
+metricas.descrever("erros_validacao_descargas_total", "counter", "Descargas da janela de erros de validação")
+metricas.descrever("erros_validacao_descargas_falhas_total", "counter",
+                   "Descargas da janela de erros que não chegaram ao Mongo")
+metricas.registrar_gauge("erros_validacao_chaves", agregador.chaves,
+                         "Chaves (cliente, evento, campo, tipo) na janela atual deste worker")
@@ -0,0 +1,392 @@
+"""
+Arquivamento de períodos fechados: tira do Mongo os eventos de um
+cliente/mês encerrado e guarda em arquivos NDJSON comprimidos, fora das
+coleções quentes (`R2010`/`R4010`/`R4020`) e dos seus índices.
+
+ - Um arquivo por (evento, cliente, período): `ARQUIVO_DIR/<evento>/<cliente>/<AAAAMM>-<ts>.ndjson.gz`,
+   uma linha por documento exatamente como está no banco (v1 ou v2, com
+   `_cli`/`_per`), em JSON estendido do BSON — a restauração é fiel aos tipos.
+ - `ARQUIVO_DIR/manifesto.jsonl`: índice pequeno, uma linha por mudança de
+   estado de um arquivo (documentos, bytes, sha256, coleções de origem).
+   Vale a última linha de cada arquivo: "gravado" (arquivo conferido,
+   exclusão pendente), "arquivado" (excluído do Mongo) ou "restaurado".
+ - Fluxo do `arquivar`: cursor em lotes → gzip em streaming com sha256 →
+   releitura conferindo contagem e hash → manifesto "gravado" → exclusão
+   dos `_id` arquivados em lotes de `ARQUIVO_LOTE_EXCLUSAO`, com pausa de
+   `ARQUIVO_PAUSA_MS` entre lotes → manifesto "arquivado". Se o processo
+   cair no meio da exclusão, rodar de novo retoma do arquivo "gravado".
+   Só os `_id` arquivados são excluídos: um evento que chegue depois fica no banco.
+ - Só períodos fechados: anteriores aos `ARQUIVO_MESES_ABERTOS` meses mais
+   recentes (use `--forcar` para ignorar).
+ - `consultar` lê os arquivos direto (somente leitura), no formato da API
+   (`esquema.expandir`) e com a mesma serialização do `exportacao`.
+
+A seleção é por `_cli`/`_per`: documentos legados sem esses campos (gravados
+antes do particionamento) não seriam arquivados nem excluídos, e o período
+apareceria completo no manifesto. Por isso `arquivar` se recusa a rodar
+(`DocumentosSemParticao`) enquanto houver algum na coleção do evento; rode
+antes `migrar_esquema.py`, que grava `_cli`/`_per` ao converter para o v2.
+
+Uso:
+    python arquivamento.py arquivar --evento R4010 --ate 2024-12            # todos os clientes
+    python arquivamento.py arquivar --evento R4010 --cliente 09524519000143 --periodo 2024-06
+    python arquivamento.py consultar --evento R4010 --cliente 09524519000143 --de 2024-01 --ate 2024-06 \\
+        [--filtro cpfBenef=10551205997] [--formato csv]
+    python arquivamento.py restaurar --evento R4010 --cliente 09524519000143 --periodo 2024-06
+    python arquivamento.py listar | verificar
+"""
+from bson import json_util
+from datetime import date, datetime, timezone
+from database import EVENT_CONFIG, breaker_mongo, colecoes_evento, db, inserir_lote, nome_colecao, _PARTICIONA_PERIODO, _colecao_chaves
+from exportacao import EXPORT_LOTE, FORMATOS, periodo_para_int, serializar
+import argparse
+import asyncio
+import gzip
+import hashlib
+import json
+import logging
+import os
+import sys
+import time
+import zlib
+import esquema
+
+logger = logging.getLogger(__name__)
+
+# ─── Configuração ────────────────────────────
+ARQUIVO_DIR = os.getenv("ARQUIVO_DIR", "arquivo")                              # raiz dos arquivos e do manifesto
+ARQUIVO_MESES_ABERTOS = int(os.getenv("ARQUIVO_MESES_ABERTOS", 3))             # meses mais recentes que não são arquivados
+ARQUIVO_LOTE_EXCLUSAO = int(os.getenv("ARQUIVO_LOTE_EXCLUSAO", 1000))          # _ids por delete_many / insert na restauração
+ARQUIVO_PAUSA_MS = float(os.getenv("ARQUIVO_PAUSA_MS", 50))                    # pausa entre lotes de exclusão (alivia o primário)
+ARQUIVO_GZIP_NIVEL = int(os.getenv("ARQUIVO_GZIP_NIVEL", 6))
+
+MANIFESTO = "manifesto.jsonl"
+_JSON_OPCOES = json_util.RELAXED_JSON_OPTIONS
+
+
+class PeriodoAberto(Exception):
+    """O período ainda está dentro de ARQUIVO_MESES_ABERTOS."""
+
+
+class DocumentosSemParticao(Exception):
+    """Há documentos legados sem `_cli`/`_per`, que o arquivamento não enxergaria."""
+
+
+async def conferir_particao(tipo: str) -> None:
+    """
+    Levanta DocumentosSemParticao se alguma coleção do evento tem documento sem `_cli`.
+    `{_cli: null}` usa o índice {_cli, _per} (casa ausente ou nulo).
+    """
+    for col in await colecoes_evento(tipo):
+        async with breaker_mongo.protegido():
+            legado = await col.find_one({"_cli": None}, {"_id": 1})
+        if legado is not None:
+            raise DocumentosSemParticao(
+                f"{col.name} tem documentos sem _cli/_per (ex.: {legado['_id']}), que não seriam arquivados; "
+                f"rode antes: python migrar_esquema.py --tipo {tipo}"
+            )
+
+
+def primeiro_periodo_aberto(hoje: date = None) -> int:
+    """AAAAMM do mês mais antigo que ainda não pode ser arquivado."""
+    hoje = hoje or date.today()
+    meses = hoje.year * 12 + hoje.month - 1 - (ARQUIVO_MESES_ABERTOS - 1)
+    return (meses // 12) * 100 + meses % 12 + 1
+
+
+# ─── Manifesto ───────────────────────────────
+def _caminho_manifesto(raiz: str) -> str:
+    return os.path.join(raiz, MANIFESTO)
+
+
+def ler_manifesto(raiz: str = ARQUIVO_DIR) -> dict:
+    """Estado atual de cada arquivo: {arquivo: entrada}, aplicando as linhas em ordem."""
+    entradas = {}
+    try:
+        with open(_caminho_manifesto(raiz), encoding="utf-8") as f:
+            for linha in f:
+                if not linha.strip():
+                    continue
+                registro = json.loads(linha)
+                entradas.setdefault(registro["arquivo"], {}).update(registro)
+    except FileNotFoundError:
+        pass
+    return entradas
+
+
+def _anotar(raiz: str, registro: dict) -> None:
+    os.makedirs(raiz, exist_ok=True)
+    registro["em"] = datetime.now(timezone.utc).isoformat(timespec="seconds")
+    with open(_caminho_manifesto(raiz), "a", encoding="utf-8") as f:
+        f.write(json.dumps(registro, ensure_ascii=False) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def entradas_de(tipo: str, cliente: str = None, de: int = None, ate: int = None,
+                estados=("gravado", "arquivado"), raiz: str = ARQUIVO_DIR) -> list:
+    """Entradas do manifesto do evento/cliente/intervalo, por período."""
+    selecionadas = [
+        e for e in ler_manifesto(raiz).values()
+        if e["evento"] == tipo and e["estado"] in estados
+        and (cliente is None or e["cliente"] == cliente)
+        and (de is None or e["periodo"] >= de) and (ate is None or e["periodo"] <= ate)
+    ]
+    return sorted(selecionadas, key=lambda e: (e["cliente"], e["periodo"], e["arquivo"]))
+
+
+# ─── Arquivos ────────────────────────────────
+def ler_arquivo(caminho: str):
+    """Documentos de um arquivo, como estavam no Mongo."""
+    with gzip.open(caminho, "rt", encoding="utf-8") as f:
+        for linha in f:
+            yield json_util.loads(linha)
+
+
+def conferir_arquivo(caminho: str) -> tuple:
+    """(documentos, sha256 do arquivo comprimido), relendo do disco."""
+    h = hashlib.sha256()
+    with open(caminho, "rb") as f:
+        for bloco in iter(lambda: f.read(1 << 20), b""):
+            h.update(bloco)
+    with gzip.open(caminho, "rb") as f:
+        documentos = sum(1 for _ in f)
+    return documentos, h.hexdigest()
+
+
+async def _gravar_arquivo(colecoes: list, filtro: dict, destino: str) -> tuple:
+    """Copia os documentos do filtro para `destino` (gzip em streaming). Retorna (documentos, bytes, sha256)."""
+    parcial = destino + ".parcial"
+    os.makedirs(os.path.dirname(destino), exist_ok=True)
+    compressor = zlib.compressobj(ARQUIVO_GZIP_NIVEL, zlib.DEFLATED, 31)
+    h = hashlib.sha256()
+    documentos = tamanho = 0
+    with open(parcial, "wb") as f:
+        def _escrever(dados: bytes):
+            nonlocal tamanho
+            if dados:
+                h.update(dados)
+                f.write(dados)
+                tamanho += len(dados)
+
+        linhas = []
+        for col in colecoes:
+            async with breaker_mongo.protegido():
+                async for doc in col.find(filtro, batch_size=EXPORT_LOTE):
+                    linhas.append(json_util.dumps(doc, json_options=_JSON_OPCOES))
+                    documentos += 1
+                    if len(linhas) >= EXPORT_LOTE:
+                        _escrever(compressor.compress(("\n".join(linhas) + "\n").encode("utf-8")))
+                        linhas = []
+        if linhas:
+            _escrever(compressor.compress(("\n".join(linhas) + "\n").encode("utf-8")))
+        _escrever(compressor.flush())
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(parcial, destino)
+    return documentos, tamanho, h.hexdigest()
+
+
+# ─── Arquivar ────────────────────────────────
+async def _excluir_arquivados(entrada: dict, raiz: str) -> int:
+    """Exclui do Mongo, em lotes, os `_id` gravados no arquivo da entrada."""
+    tipo, cliente, periodo = entrada["evento"], entrada["cliente"], entrada["periodo"]
+    colecoes = [db[nome] for nome in entrada["colecoes"]]
+    excluidos = 0
+
+    async def _lote(ids):
+        nonlocal excluidos
+        async with breaker_mongo.protegido():
+            for col in colecoes:
+                resultado = await col.delete_many({"_id": {"$in": ids}, "_cli": cliente, "_per": periodo})
+                excluidos += resultado.deleted_count
+                if _PARTICIONA_PERIODO:
+                    await _colecao_chaves(tipo).delete_many({"_id": {"$in": ids}, "col": col.name})
+        if ARQUIVO_PAUSA_MS:
+            await asyncio.sleep(ARQUIVO_PAUSA_MS / 1000)
+
+    ids = []
+    for doc in ler_arquivo(os.path.join(raiz, entrada["arquivo"])):
+        ids.append(doc["_id"])
+        if len(ids) >= ARQUIVO_LOTE_EXCLUSAO:
+            await _lote(ids)
+            ids = []
+    if ids:
+        await _lote(ids)
+    _anotar(raiz, {"arquivo": entrada["arquivo"], "estado": "arquivado", "excluidos": excluidos})
+    return excluidos
+
+
+async def arquivar(tipo: str, cliente: str, periodo: int, forcar: bool = False, raiz: str = ARQUIVO_DIR) -> dict:
+    """
+    Arquiva os eventos `tipo` do cliente/período e os exclui do Mongo.
+    Retorna a entrada do manifesto (None se não havia nada a arquivar).
+    DocumentosSemParticao se a coleção ainda tem documentos legados sem `_cli`/`_per`.
+    """
+    if not forcar and periodo >= primeiro_periodo_aberto():
+        raise PeriodoAberto(f"Período {periodo} ainda aberto (ARQUIVO_MESES_ABERTOS={ARQUIVO_MESES_ABERTOS}).")
+    await conferir_particao(tipo)
+
+    for pendente in entradas_de(tipo, cliente, periodo, periodo, estados=("gravado",), raiz=raiz):
+        # execução anterior interrompida depois de gravar: só falta excluir
+        logger.info(f"[arquivo] Retomando exclusão de {pendente['arquivo']}")
+        await _excluir_arquivados(pendente, raiz)
+
+    filtro = {"_cli": cliente, "_per": periodo}
+    colecoes = []
+    for col in await colecoes_evento(tipo, cliente, [periodo]):
+        async with breaker_mongo.protegido():
+            if await col.find_one(filtro, {"_id": 1}) is not None:
+                colecoes.append(col)
+    if not colecoes:
+        return None
+
+    inicio = time.perf_counter()
+    relativo = os.path.join(tipo, cliente, f"{periodo}-{int(time.time())}.ndjson.gz")
+    destino = os.path.join(raiz, relativo)
+    documentos, tamanho, sha256 = await _gravar_arquivo(colecoes, filtro, destino)
+
+    conferidos, sha_disco = conferir_arquivo(destino)
+    if (conferidos, sha_disco) != (documentos, sha256):
+        os.remove(destino)
+        raise RuntimeError(f"Arquivo {relativo} não confere ({conferidos}/{documentos} documentos); nada excluído.")
+
+    entrada = {
+        "arquivo": relativo, "estado": "gravado", "evento": tipo, "cliente": cliente, "periodo": periodo,
+        "documentos": documentos, "bytes": tamanho, "sha256": sha256, "colecoes": [c.name for c in colecoes],
+    }
+    _anotar(raiz, dict(entrada))
+    entrada["excluidos"] = await _excluir_arquivados(entrada, raiz)
+    logger.info(f"[arquivo] {tipo} {cliente} {periodo}: {documentos} documentos, {tamanho / 1e6:.1f} MB, "
+                f"{entrada['excluidos']} excluídos em {time.perf_counter() - inicio:.1f}s")
+    return entrada
+
+
+async def pares_fechados(tipo: str, ate: int, cliente: str = None) -> list:
+    """(cliente, período) com eventos no Mongo até `ate`, limitado ao último período fechado."""
+    limite = min(ate, primeiro_periodo_aberto() - 1) if ate else primeiro_periodo_aberto() - 1
+    filtro = {"_per": {"$lte": limite}}
+    if cliente:
+        filtro["_cli"] = cliente
+    pares = set()
+    for col in await colecoes_evento(tipo, cliente):
+        async with breaker_mongo.protegido():
+            async for doc in col.aggregate([{"$match": filtro}, {"$group": {"_id": {"c": "$_cli", "p": "$_per"}}}]):
+                pares.add((doc["_id"]["c"], doc["_id"]["p"]))
+    return sorted(pares)
+
+
+# ─── Restaurar / consultar ───────────────────
+async def restaurar(tipo: str, cliente: str, periodo: int, raiz: str = ARQUIVO_DIR) -> tuple:
+    """Devolve ao Mongo os arquivos do cliente/período. Retorna (inseridos, duplicados)."""
+    inseridos = duplicados = 0
+    for entrada in entradas_de(tipo, cliente, periodo, periodo, raiz=raiz):
+        caminho = os.path.join(raiz, entrada["arquivo"])
+        if conferir_arquivo(caminho)[1] != entrada["sha256"]:
+            raise RuntimeError(f"sha256 de {entrada['arquivo']} não confere com o manifesto.")
+        itens = []
+        for doc in ler_arquivo(caminho):
+            itens.append((tipo, nome_colecao(tipo, doc["_cli"], doc["_per"]), doc))
+            if len(itens) >= ARQUIVO_LOTE_EXCLUSAO:
+                i, d = await inserir_lote(itens)
+                inseridos, duplicados, itens = inseridos + i, duplicados + d, []
+        if itens:
+            i, d = await inserir_lote(itens)
+            inseridos, duplicados = inseridos + i, duplicados + d
+        _anotar(raiz, {"arquivo": entrada["arquivo"], "estado": "restaurado"})
+    return inseridos, duplicados
+
+
+async def consultar(tipo: str, cliente: str, de: int = None, ate: int = None, filtro: dict = None,
+                    raiz: str = ARQUIVO_DIR):
+    """Gera os documentos arquivados no formato da API, lendo só os arquivos (sem Mongo)."""
+    cfg = EVENT_CONFIG[tipo]
+    for entrada in entradas_de(tipo, cliente, de, ate, raiz=raiz):
+        for doc in ler_arquivo(os.path.join(raiz, entrada["arquivo"])):
+            doc = esquema.expandir(doc, tipo, cfg)
+            if filtro and any(str(doc.get(campo)) != valor for campo, valor in filtro.items()):
+                continue
+            yield doc
+
+
+# ─── CLI ─────────────────────────────────────
+async def _main(args):
+    if args.comando == "arquivar":
+        try:
+            await conferir_particao(args.evento)
+        except DocumentosSemParticao as e:
+            sys.exit(str(e))
+        if args.periodo:
+            pares = [(args.cliente, periodo_para_int(args.periodo))]
+            if not args.cliente:
+                pares = [p for p in await pares_fechados(args.evento, pares[0][1]) if p[1] == pares[0][1]]
+        else:
+            pares = await pares_fechados(args.evento, periodo_para_int(args.ate), args.cliente)
+        for cliente, periodo in pares:
+            entrada = await arquivar(args.evento, cliente, periodo, forcar=args.forcar)
+            if entrada:
+                print(f"{entrada['arquivo']}: {entrada['documentos']} documentos, "
+                      f"{entrada['bytes'] / 1e6:.2f} MB, {entrada['excluidos']} excluídos do Mongo")
+    elif args.comando == "restaurar":
+        inseridos, duplicados = await restaurar(args.evento, args.cliente, periodo_para_int(args.periodo))
+        print(f"{inseridos} documentos restaurados ({duplicados} já estavam no banco)")
+    elif args.comando == "consultar":
+        filtro = dict(f.split("=", 1) for f in args.filtro or ())
+        docs = consultar(args.evento, args.cliente, periodo_para_int(args.de), periodo_para_int(args.ate), filtro)
+        async for bloco in serializar(docs, args.evento, args.formato):
+            sys.stdout.buffer.write(bloco)
+    elif args.comando == "listar":
+        for e in sorted(ler_manifesto().values(), key=lambda e: e["arquivo"]):
+            print(f"{e['estado']:>10} {e['evento']} {e['cliente']} {e['periodo']} "
+                  f"{e['documentos']:>9} docs {e['bytes'] / 1e6:>8.2f} MB  {e['arquivo']}")
+    else:
+        ruins = 0
+        for e in ler_manifesto().values():
+            if e["estado"] == "restaurado":
+                continue
+            try:
+                conferidos, sha = conferir_arquivo(os.path.join(ARQUIVO_DIR, e["arquivo"]))
+                ok = (conferidos, sha) == (e["documentos"], e["sha256"])
+            except (OSError, EOFError, zlib.error):
+                ok = False
+            ruins += not ok
+            print(f"{'ok' if ok else 'FALHOU':>6} {e['arquivo']}")
+        if ruins:
+            sys.exit(1)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Arquivamento de períodos fechados em NDJSON comprimido")
+    sub = parser.add_subparsers(dest="comando", required=True)
+
+    p = sub.add_parser("arquivar", help="Move eventos de períodos fechados do Mongo para arquivos")
+    p.add_argument("--evento", required=True, choices=sorted(EVENT_CONFIG))
+    p.add_argument("--cliente", help="CNPJ do cliente (padrão: todos)")
+    grupo = p.add_mutually_exclusive_group(required=True)
+    grupo.add_argument("--periodo", help="Um período AAAA-MM")
+    grupo.add_argument("--ate", help="Todos os períodos fechados até AAAA-MM")
+    p.add_argument("--forcar", action="store_true", help="Arquiva mesmo dentro de ARQUIVO_MESES_ABERTOS")
+
+    p = sub.add_parser("restaurar", help="Devolve ao Mongo os eventos arquivados de um cliente/período")
+    p.add_argument("--evento", required=True, choices=sorted(EVENT_CONFIG))
+    p.add_argument("--cliente", required=True)
+    p.add_argument("--periodo", required=True)
+
+    p = sub.add_parser("consultar", help="Lê os eventos arquivados (somente leitura) em NDJSON/CSV")
+    p.add_argument("--evento", required=True, choices=sorted(EVENT_CONFIG))
+    p.add_argument("--cliente", required=True)
+    p.add_argument("--de")
+    p.add_argument("--ate")
+    p.add_argument("--filtro", nargs="+", help="campo=valor (igualdade, formato da API)")
+    p.add_argument("--formato", choices=sorted(FORMATOS), default="ndjson")
+
+    sub.add_parser("listar", help="Lista o manifesto")
+    sub.add_parser("verificar", help="Confere contagem e sha256 de todos os arquivos do manifesto")
+
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)   # os validadores ligam DEBUG no import
+    asyncio.run(_main(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""
+Benchmark do cálculo/validação de DV de CNPJ: implementação anterior
+(int() por caractere, só numérica) contra o motor por tabelas de
+`utils.validadores_em_comum` (numérico e alfanumérico).
+
+Também confere que as duas dão o mesmo DV para todos os CNPJs numéricos sorteados.
+
+Uso:
+    python bench_cnpj.py --quantidade 200000
+"""
+import argparse
+import logging
+import random
+import time
+from utils.validadores_em_comum import calcular_dv_cnpj, limpar_cnpj, validar_cnpj
+
+logger = logging.getLogger("bench_cnpj")
+
+_ALFANUMERICOS = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+
+
+# ─── Implementação anterior (referência) ─────
+def calcular_dv_cnpj_anterior(cnpj_parcial: str) -> str:
+    logger.debug(f"Calculando DVs para CNPJ base de 12 dígitos: {cnpj_parcial}")
+
+    def _dv(cnpj_part, pesos):
+        soma = sum(int(d) * p for d, p in zip(cnpj_part, pesos))
+        resto = soma % 11
+        return '0' if resto < 2 else str(11 - resto)
+
+    dv1 = _dv(cnpj_parcial, [5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2])
+    dv2 = _dv(cnpj_parcial + dv1, [6, 5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2])
+    logger.debug(f"dv1={dv1}, dv2={dv2} (CNPJ)")
+    return dv1 + dv2
+
+
+def validar_cnpj_anterior(cnpj_digits: str) -> None:
+    logger.debug(f"Validando CNPJ: {cnpj_digits}")
+    if len(cnpj_digits) != 14:
+        raise ValueError("CNPJ deve conter 14 dígitos numéricos.")
+    dv_esperado = calcular_dv_cnpj_anterior(cnpj_digits[:12])
+    dv_informado = cnpj_digits[-2:]
+    logger.debug(f"dv_esperado={dv_esperado}, dv_informado={dv_informado}")
+    if dv_informado != dv_esperado:
+        raise ValueError("CNPJ inválido")
+
+
+def limpar_numeros_anterior(valor: str) -> str:
+    return ''.join(filter(str.isdigit, valor))
+
+
+# ─── Medição ─────────────────────────────────
+def _medir(nome: str, fn, entradas: list) -> float:
+    inicio = time.perf_counter()
+    for e in entradas:
+        fn(e)
+    decorrido = time.perf_counter() - inicio
+    print(f"{nome:>40}: {len(entradas) / decorrido:>12,.0f}/s  {decorrido / len(entradas) * 1e9:>7.0f} ns cada")
+    return decorrido
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark do DV de CNPJ (anterior x tabelas)")
+    parser.add_argument("--quantidade", type=int, default=200_000)
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)   # os validadores ligam DEBUG no import
+
+    rnd = random.Random(42)
+    bases = [f"{rnd.randrange(10 ** 12):012d}" for _ in range(args.quantidade)]
+    bases_alfa = ["".join(rnd.choice(_ALFANUMERICOS) for _ in range(12)) for _ in range(args.quantidade)]
+    numericos = [b + calcular_dv_cnpj(b) for b in bases]
+    alfanumericos = [b + calcular_dv_cnpj(b) for b in bases_alfa]
+    mascarados = [f"{c[:2]}.{c[2:5]}.{c[5:8]}/{c[8:12]}-{c[12:]}" for c in numericos]
+
+    divergentes = sum(calcular_dv_cnpj_anterior(b) != calcular_dv_cnpj(b) for b in bases)
+    print(f"DVs divergentes entre as implementações (numéricos): {divergentes}\n")
+
+    print("calcular_dv (base numérica)")
+    t_ant = _medir("anterior", calcular_dv_cnpj_anterior, bases)
+    t_nov = _medir("tabelas", calcular_dv_cnpj, bases)
+    print(f"{'ganho':>40}: {t_ant / t_nov:.1f}x\n")
+
+    print("validar_cnpj")
+    t_ant = _medir("anterior (numérico)", validar_cnpj_anterior, numericos)
+    t_nov = _medir("tabelas (numérico)", validar_cnpj, numericos)
+    _medir("tabelas (alfanumérico)", validar_cnpj, alfanumericos)
+    print(f"{'ganho':>40}: {t_ant / t_nov:.1f}x\n")
+
+    print("limpeza da máscara")
+    t_ant = _medir("limpar_numeros", limpar_numeros_anterior, mascarados)
+    t_nov = _medir("limpar_cnpj", limpar_cnpj, mascarados)
+    print(f"{'ganho':>40}: {t_ant / t_nov:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+"""
+Benchmark de upload comprimido: tempo ponta a ponta e custo de CPU por
+tamanho de lote e codificação (identity, gzip, zstd).
+
+Para cada lote (array JSON com N eventos variados) mede:
+ - CPU do cliente para comprimir;
+ - tamanho transmitido e tempo de envio num link de `--banda-mbps`;
+ - CPU do servidor para descomprimir em streaming (o mesmo `Descompressor`
+   do middleware, em pedaços de 64 KB) e para o `json.loads`.
+O tempo ponta a ponta é a soma das três etapas (a rede é modelada, não medida).
+
+Uso:
+    python bench_compressao.py --tamanhos 10 1000 10000 50000 --banda-mbps 2 10 100
+"""
+from itertools import cycle
+import argparse
+import json
+import time
+from compressao import CODIFICACOES, Descompressor, comprimir
+
+_PEDACO = 64 * 1024
+
+
+def gerar_lote(n: int) -> bytes:
+    from load_test import TEMPLATES, generate_payload
+    tipos = cycle(TEMPLATES)
+    return json.dumps([generate_payload(next(tipos), i) for i in range(n)]).encode("utf-8")
+
+
+def _cronometrar(fn, repeticoes: int):
+    melhor = float("inf")
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        resultado = fn()
+        melhor = min(melhor, time.perf_counter() - inicio)
+    return resultado, melhor
+
+
+def _descomprimir(dados: bytes, codificacao: str) -> bytes:
+    if codificacao == "identity":
+        return dados
+    d = Descompressor(codificacao, limite=len(dados) * 10_000)
+    partes = []
+    for i in range(0, len(dados), _PEDACO):
+        partes.extend(d.descomprimir(dados[i:i + _PEDACO]))
+    partes.append(d.finalizar())
+    return b"".join(partes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de upload comprimido (gzip/zstd)")
+    parser.add_argument('--tamanhos', type=int, nargs='+', default=[10, 1000, 10000, 50000], help="Eventos por lote")
+    parser.add_argument('--banda-mbps', type=float, nargs='+', default=[2, 10, 100], help="Bandas de upload simuladas")
+    parser.add_argument('--repeticoes', type=int, default=3)
+    args = parser.parse_args()
+
+    codificacoes = ("identity",) + tuple(c for c in CODIFICACOES if c != "deflate")
+    cab_banda = "".join(f"{f'@{b:g}Mbps ms':>13}" for b in args.banda_mbps)
+    print(f"{'eventos':>8} {'codif.':>8} {'bytes':>11} {'razão':>6} {'comp ms':>8} {'desc ms':>8} {'json ms':>8}{cab_banda}")
+    for n in args.tamanhos:
+        bruto = gerar_lote(n)
+        for codificacao in codificacoes:
+            if codificacao == "identity":
+                enviado, t_comp = bruto, 0.0
+            else:
+                enviado, t_comp = _cronometrar(lambda: comprimir(bruto, codificacao), args.repeticoes)
+            recebido, t_desc = _cronometrar(lambda: _descomprimir(enviado, codificacao), args.repeticoes)
+            assert recebido == bruto
+            _, t_json = _cronometrar(lambda: json.loads(recebido), args.repeticoes)
+            ponta_a_ponta = "".join(
+                f"{(t_comp + len(enviado) * 8 / (b * 1e6) + t_desc + t_json) * 1000:>13.1f}" for b in args.banda_mbps
+            )
+            print(f"{n:>8} {codificacao:>8} {len(enviado):>11} {len(bruto) / len(enviado):>6.1f} "
+                  f"{t_comp * 1000:>8.2f} {t_desc * 1000:>8.2f} {t_json * 1000:>8.2f}{ponta_a_ponta}")
+
+
+if __name__ == "__main__":
+    main()
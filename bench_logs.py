@@ -0,0 +1,114 @@
+"""
+Benchmark da escrita dos logs: configuração original (TimedRotatingFileHandler
+síncrono, JSON sem compressão) contra as opções de `logging_config`.
+
+Para cada cenário grava `--registros` registros com o mesmo perfil do tráfego
+real (recebido / inserido / erro de validação) e mede:
+ - custo na thread que loga (o que a requisição paga), em registros/s e µs;
+ - tempo total até tudo estar em disco (fila drenada e gzip concluído);
+ - espaço ocupado em disco no fim, com rotação por tamanho em `--max-mb`.
+
+Uso:
+    python bench_logs.py --registros 500000 --max-mb 16
+"""
+from logging.handlers import TimedRotatingFileHandler
+from pythonjsonlogger.json import JsonFormatter
+from tracing import TraceIdFilter
+import argparse
+import logging
+import os
+import random
+import tempfile
+import time
+import logging_config
+
+
+def _mensagens(n: int, seed: int = 3):
+    rnd = random.Random(seed)
+    for i in range(n):
+        tipo = rnd.choice(("R2010", "R4010", "R4020"))
+        sorteio = rnd.random()
+        if sorteio < 0.45:
+            yield logging.INFO, "main", f"Recebido evento {tipo} para validação."
+        elif sorteio < 0.9:
+            yield (logging.INFO, "database",
+                   f"[Mongo] Inserido {tipo} com _id={7000 + i}-12287133000170-{rnd.randrange(10 ** 11):011d}-09524519000143")
+        elif sorteio < 0.97:
+            yield logging.ERROR, "main", f"    Campo: natRend | Erro: Value error, Natureza de rendimento {rnd.randrange(99999)} inválida."
+        else:
+            yield logging.WARNING, "database", f"[Mongo] Registro {7000 + i}-12287133000170-49996377000131-09524519000143 já existe, Ignorando..."
+
+
+def _original(diretorio: str):
+    formatter = JsonFormatter('%(asctime)s %(levelname)s %(name)s %(message)s', json_ensure_ascii=False)
+    for nome, nivel in (("audit.log", logging.INFO), ("errors.log", logging.WARNING)):
+        h = TimedRotatingFileHandler(os.path.join(diretorio, nome), when="midnight", backupCount=30, encoding="utf-8")
+        h.setLevel(nivel)
+        if nivel == logging.INFO:
+            h.addFilter(lambda record: record.levelno == logging.INFO)
+        h.addFilter(TraceIdFilter())
+        h.setFormatter(formatter)
+        logging.getLogger().addHandler(h)
+
+
+def _tamanho_diretorio(diretorio: str) -> int:
+    return sum(os.path.getsize(os.path.join(diretorio, n)) for n in os.listdir(diretorio))
+
+
+def rodar(cenario: str, registros: int, max_bytes: int) -> dict:
+    root = logging.getLogger()
+    for h in list(root.handlers):
+        root.removeHandler(h)
+    root.setLevel(logging.INFO)
+    logging_config.compactador.atraso_s = 0      # um só processo: nenhuma escrita alheia em voo a esperar
+    with tempfile.TemporaryDirectory() as diretorio:
+        if cenario == "original":
+            _original(diretorio)
+            listener = None
+        else:
+            listener = logging_config.configure_logging(
+                log_dir=diretorio,
+                max_bytes=max_bytes,
+                assincrono=cenario != "sincrono",
+                formato_auditoria="colunar" if cenario == "colunar" else "json",
+            )
+        loggers = {nome: logging.getLogger(f"bench.{nome}") for nome in ("main", "database")}
+        mensagens = list(_mensagens(registros))
+
+        inicio = time.perf_counter()
+        for nivel, nome, texto in mensagens:
+            loggers[nome].log(nivel, texto)
+        chamador = time.perf_counter() - inicio
+        if listener is not None:
+            logging_config._parar_listener(listener)
+        for h in list(root.handlers):
+            h.close()
+            root.removeHandler(h)
+        for h in getattr(listener, "handlers", ()):
+            h.close()
+        logging_config.compactador.aguardar()
+        total = time.perf_counter() - inicio
+        arquivos = len(os.listdir(diretorio))
+        disco = _tamanho_diretorio(diretorio)
+    return {"cenario": cenario, "chamador_s": chamador, "total_s": total, "disco": disco, "arquivos": arquivos}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de escrita e rotação dos logs")
+    parser.add_argument("--registros", type=int, default=300_000)
+    parser.add_argument("--max-mb", type=float, default=16, help="LOG_MAX_BYTES dos cenários novos, em MB")
+    parser.add_argument("--cenarios", nargs="+", default=["original", "sincrono", "assincrono", "colunar"])
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)   # os validadores ligam DEBUG no import
+    for h in list(logging.getLogger().handlers):
+        logging.getLogger().removeHandler(h)       # nada de console durante a medição
+
+    print(f"{'cenário':>11} {'registros/s':>12} {'µs/log':>7} {'total s':>8} {'disco MB':>9} {'arquivos':>9}")
+    for cenario in args.cenarios:
+        r = rodar(cenario, args.registros, int(args.max_mb * 1024 * 1024))
+        print(f"{cenario:>11} {args.registros / r['chamador_s']:>12,.0f} {r['chamador_s'] / args.registros * 1e6:>7.1f} "
+              f"{r['total_s']:>8.2f} {r['disco'] / 1e6:>9.1f} {r['arquivos']:>9}")
+
+
+if __name__ == "__main__":
+    main()
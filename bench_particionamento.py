@@ -0,0 +1,125 @@
+"""
+Benchmark de inserção e consulta: layout plano x particionado.
+
+Cada layout roda num subprocesso com `MONGO_PARTICIONAMENTO` e `MONGO_DB`
+próprios (o layout é lido no import de `database`). O banco de benchmark é
+apagado no início e no fim de cada rodada, por isso `--db` precisa começar com
+`PREFIXO_BANCO` e nunca pode ser o banco da aplicação (`MONGO_DB` do ambiente,
+"Reinf" por padrão): nesses casos o benchmark se recusa a rodar.
+
+Uso:
+    python bench_particionamento.py --eventos 200000 --clientes 50 --meses 12
+"""
+from itertools import count
+import argparse
+import asyncio
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+
+LAYOUTS = ("nenhum", "cliente", "periodo", "cliente_periodo")
+PREFIXO_BANCO = "Reinf_bench"       # só bancos com este prefixo são apagados
+# os subprocessos recebem MONGO_DB=--db; o banco da aplicação vem do processo principal
+BANCO_PRODUCAO = os.getenv("BENCH_BANCO_PRODUCAO") or os.getenv("MONGO_DB", "Reinf")
+
+
+def conferir_banco(nome: str) -> None:
+    """ValueError se `nome` não for um banco descartável do benchmark."""
+    if nome in (BANCO_PRODUCAO, "Reinf") or not nome.startswith(PREFIXO_BANCO):
+        raise ValueError(f"banco {nome!r} recusado: o benchmark apaga o banco, "
+                         f"use um nome com o prefixo {PREFIXO_BANCO!r} (a aplicação usa {BANCO_PRODUCAO!r})")
+
+
+def gerar_payloads(eventos, clientes, meses, seed=42):
+    """Eventos R4010 sintéticos, distribuídos entre clientes e meses (clientes com peso Zipf)."""
+    from warmup import EVENTOS_VALIDOS
+    rnd = random.Random(seed)
+    pesos = [1 / (i + 1) for i in range(clientes)]
+    num = count(1)
+    for _ in range(eventos):
+        cliente = f"{rnd.choices(range(clientes), pesos)[0]:014d}"
+        mes = rnd.randrange(meses) + 1
+        payload = dict(EVENTOS_VALIDOS["R4010"], NumDoc=next(num), dtFG=f"2025-{mes:02d}-15")
+        yield cliente, payload
+
+
+async def rodar_layout(args) -> dict:
+    import database
+    import esquema
+
+    conferir_banco(args.db)
+    if database.MONGO_DB != args.db:
+        raise RuntimeError(f"database.MONGO_DB={database.MONGO_DB!r} difere de --db={args.db!r}")
+    await database.client.drop_database(args.db)
+    await database.garantir_indices()
+    resultado = esquema.resultado_valido("R4010")
+    payloads = list(gerar_payloads(args.eventos, args.clientes, args.meses))
+
+    sem = asyncio.Semaphore(args.concorrencia)
+
+    async def inserir(cliente, payload):
+        async with sem:
+            await database.save_if_valid(resultado, payload, cliente)
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*(inserir(c, p) for c, p in payloads))
+    t_insert = time.perf_counter() - inicio
+
+    # consultas: todos os eventos de um cliente/mês, como faria uma exportação
+    rnd = random.Random(7)
+    inicio = time.perf_counter()
+    lidos = 0
+    for _ in range(args.consultas):
+        cliente = f"{rnd.randrange(args.clientes):014d}"
+        periodo = 202500 + rnd.randrange(args.meses) + 1
+        for col in await database.colecoes_evento("R4010", cliente, [periodo]):
+            async for _doc in col.find({"_cli": cliente, "_per": periodo}, {"_id": 1}):
+                lidos += 1
+    t_query = time.perf_counter() - inicio
+
+    await database.client.drop_database(args.db)
+    return {
+        "layout": database.MONGO_PARTICIONAMENTO,
+        "insert_por_s": round(args.eventos / t_insert),
+        "consultas_por_s": round(args.consultas / t_query, 1),
+        "docs_lidos": lidos,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark do layout particionado")
+    parser.add_argument('--eventos', type=int, default=100_000)
+    parser.add_argument('--clientes', type=int, default=50)
+    parser.add_argument('--meses', type=int, default=12)
+    parser.add_argument('--consultas', type=int, default=500)
+    parser.add_argument('--concorrencia', type=int, default=100)
+    parser.add_argument('--db', default=f"{PREFIXO_BANCO}_particionamento",
+                        help=f"Banco descartável do benchmark (prefixo {PREFIXO_BANCO!r})")
+    parser.add_argument('--layout', choices=LAYOUTS, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    try:
+        conferir_banco(args.db)
+    except ValueError as e:
+        parser.error(str(e))
+
+    if args.layout:
+        print(json.dumps(asyncio.run(rodar_layout(args))))
+        return
+
+    for layout in LAYOUTS:
+        env = {**os.environ, "MONGO_PARTICIONAMENTO": layout, "MONGO_DB": args.db,
+               "BENCH_BANCO_PRODUCAO": BANCO_PRODUCAO}
+        saida = subprocess.run(
+            [sys.executable, __file__, "--layout", layout] + sys.argv[1:],
+            env=env, capture_output=True, text=True, check=True,
+        )
+        r = json.loads(saida.stdout.strip().splitlines()[-1])
+        print(f"{r['layout']:>16}: {r['insert_por_s']:>8} inserts/s | "
+              f"{r['consultas_por_s']:>8} consultas/s | {r['docs_lidos']} docs lidos")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+"""
+Circuit breaker assíncrono para as chamadas ao MongoDB.
+
+Estados:
+ - fechado: chamadas passam; erros e chamadas lentas são contados numa janela
+   deslizante de `CB_JANELA_S` segundos;
+ - aberto: após `CB_MIN_CHAMADAS` na janela com taxa de erro ≥ `CB_TAXA_ERRO`
+   ou taxa de lentas (> `CB_LATENCIA_MS`) ≥ `CB_TAXA_LENTAS`, toda chamada falha
+   na hora com `CircuitoAbertoError` durante `CB_TEMPO_ABERTO_S`;
+ - meio-aberto: depois disso, até `CB_SONDAS` chamadas simultâneas testam o
+   banco; `CB_SUCESSOS_FECHAR` sucessos fecham o circuito, uma falha reabre.
+
+Uso:
+    async with breaker.protegido():
+        await col.insert_one(doc)
+"""
+from contextlib import asynccontextmanager
+from collections import deque
+import asyncio
+import logging
+import os
+import time
+import metricas
+
+logger = logging.getLogger(__name__)
+
+# ─── Configuração ────────────────────────────
+CB_JANELA_S = float(os.getenv("CB_JANELA_S", 10))            # janela deslizante de observação
+CB_MIN_CHAMADAS = int(os.getenv("CB_MIN_CHAMADAS", 20))      # mínimo de chamadas na janela para avaliar as taxas
+CB_TAXA_ERRO = float(os.getenv("CB_TAXA_ERRO", 0.5))         # fração de erros que abre o circuito
+CB_LATENCIA_MS = float(os.getenv("CB_LATENCIA_MS", 1000))    # acima disso a chamada conta como lenta
+CB_TAXA_LENTAS = float(os.getenv("CB_TAXA_LENTAS", 0.8))     # fração de chamadas lentas que abre o circuito
+CB_TEMPO_ABERTO_S = float(os.getenv("CB_TEMPO_ABERTO_S", 5))  # quanto tempo fica aberto antes de sondar
+CB_SONDAS = int(os.getenv("CB_SONDAS", 2))                   # chamadas simultâneas permitidas no meio-aberto
+CB_SUCESSOS_FECHAR = int(os.getenv("CB_SUCESSOS_FECHAR", 3))  # sucessos no meio-aberto para fechar
+
+FECHADO, ABERTO, MEIO_ABERTO = "fechado", "aberto", "meio_aberto"
+_CODIGO_ESTADO = {FECHADO: 0, MEIO_ABERTO: 1, ABERTO: 2}
+_BREAKERS = []
+
+
+class CircuitoAbertoError(Exception):
+    """Chamada recusada sem tocar no banco porque o circuito está aberto."""
+
+    def __init__(self, nome: str, retry_after: float):
+        super().__init__(f"Circuito '{nome}' aberto")
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    def __init__(
+        self,
+        nome: str,
+        excecoes_falha: tuple = (Exception,),
+        janela_s: float = CB_JANELA_S,
+        min_chamadas: int = CB_MIN_CHAMADAS,
+        taxa_erro: float = CB_TAXA_ERRO,
+        latencia_ms: float = CB_LATENCIA_MS,
+        taxa_lentas: float = CB_TAXA_LENTAS,
+        tempo_aberto_s: float = CB_TEMPO_ABERTO_S,
+        sondas: int = CB_SONDAS,
+        sucessos_fechar: int = CB_SUCESSOS_FECHAR,
+    ):
+        self.nome = nome
+        self.excecoes_falha = excecoes_falha
+        self.janela_s = janela_s
+        self.min_chamadas = min_chamadas
+        self.taxa_erro = taxa_erro
+        self.latencia_s = latencia_ms / 1000
+        self.taxa_lentas = taxa_lentas
+        self.tempo_aberto_s = tempo_aberto_s
+        self.sondas = sondas
+        self.sucessos_fechar = sucessos_fechar
+
+        self.estado = FECHADO
+        self.desde = time.monotonic()
+        self._chamadas = deque()     # (instante, falhou, lenta)
+        self._sondas_em_voo = 0
+        self._sucessos_sonda = 0
+        self._geracao = 0            # muda a cada transição; identifica o meio-aberto de cada sonda
+
+        _BREAKERS.append(self)
+
+    # ─── transições ──────────────────────────
+    def _mudar(self, novo: str) -> None:
+        agora = time.monotonic()
+        duracao = agora - self.desde
+        metricas.incrementar("circuit_breaker_transicoes_total", nome=self.nome, de=self.estado, para=novo)
+        metricas.definir("circuit_breaker_ultima_duracao_s", round(duracao, 3), nome=self.nome, estado=self.estado)
+        log = logger.warning if novo == ABERTO else logger.info
+        log(f"[circuit_breaker] '{self.nome}' {self.estado} → {novo} (após {duracao:.1f}s)")
+        self.estado = novo
+        self.desde = agora
+        self._chamadas.clear()
+        self._sondas_em_voo = 0
+        self._sucessos_sonda = 0
+        self._geracao += 1
+
+    def _admitir(self):
+        """
+        Geração do meio-aberto se a chamada é uma sonda, None se não é; lança se estiver aberto.
+        """
+        if self.estado == ABERTO:
+            restante = self.tempo_aberto_s - (time.monotonic() - self.desde)
+            if restante > 0:
+                metricas.incrementar("circuit_breaker_rejeitadas_total", nome=self.nome)
+                raise CircuitoAbertoError(self.nome, restante)
+            self._mudar(MEIO_ABERTO)
+
+        if self.estado == MEIO_ABERTO:
+            if self._sondas_em_voo >= self.sondas:
+                metricas.incrementar("circuit_breaker_rejeitadas_total", nome=self.nome)
+                raise CircuitoAbertoError(self.nome, self.tempo_aberto_s)
+            self._sondas_em_voo += 1
+            return self._geracao
+        return None
+
+    def _sonda_atual(self, sonda) -> bool:
+        """A sonda é do meio-aberto em curso (e não de um anterior, já decidido por outra sonda)."""
+        return self.estado == MEIO_ABERTO and sonda == self._geracao
+
+    def _registrar(self, sonda, falhou: bool, duracao: float) -> None:
+        lenta = duracao > self.latencia_s
+        if sonda is not None:
+            if not self._sonda_atual(sonda):
+                return   # outra sonda já decidiu
+            self._sondas_em_voo -= 1
+            if falhou or lenta:
+                self._mudar(ABERTO)
+            else:
+                self._sucessos_sonda += 1
+                if self._sucessos_sonda >= self.sucessos_fechar:
+                    self._mudar(FECHADO)
+            return
+
+        if self.estado != FECHADO:
+            return
+        agora = time.monotonic()
+        self._chamadas.append((agora, falhou, lenta))
+        while self._chamadas and self._chamadas[0][0] < agora - self.janela_s:
+            self._chamadas.popleft()
+
+        total = len(self._chamadas)
+        if total < self.min_chamadas:
+            return
+        falhas = sum(1 for _, f, _ in self._chamadas if f)
+        lentas = sum(1 for _, _, l in self._chamadas if l)
+        if falhas / total >= self.taxa_erro or lentas / total >= self.taxa_lentas:
+            self._mudar(ABERTO)
+
+    # ─── uso ─────────────────────────────────
+    @asynccontextmanager
+    async def protegido(self):
+        """
+        Executa o bloco sob o circuito. Exceções de `excecoes_falha` contam como
+        falha; qualquer outra (ex.: DuplicateKeyError) mostra que o banco respondeu
+        e conta como sucesso. Cancelamento não conta.
+        """
+        sonda = self._admitir()
+        inicio = time.monotonic()
+        try:
+            yield
+        except asyncio.CancelledError:
+            if sonda is not None and self._sonda_atual(sonda):
+                self._sondas_em_voo -= 1
+            raise
+        except self.excecoes_falha as e:
+            if isinstance(e, CircuitoAbertoError):
+                raise
+            self._registrar(sonda, True, time.monotonic() - inicio)
+            raise
+        except BaseException:
+            self._registrar(sonda, False, time.monotonic() - inicio)
+            raise
+        else:
+            self._registrar(sonda, False, time.monotonic() - inicio)
+
+
+metricas.descrever("circuit_breaker_transicoes_total", "counter", "Transições de estado do circuit breaker")
+metricas.descrever("circuit_breaker_rejeitadas_total", "counter", "Chamadas recusadas com o circuito aberto")
+metricas.descrever("circuit_breaker_ultima_duracao_s", "gauge", "Duração do último período em cada estado")
+metricas.registrar_gauge(
+    "circuit_breaker_estado",
+    lambda: {(("nome", b.nome),): _CODIGO_ESTADO[b.estado] for b in _BREAKERS},
+    "Estado do circuito (0=fechado, 1=meio-aberto, 2=aberto)",
+)
+metricas.registrar_gauge(
+    "circuit_breaker_tempo_no_estado_s",
+    lambda: {(("nome", b.nome),): round(time.monotonic() - b.desde, 1) for b in _BREAKERS},
+    "Segundos desde a última transição",
+)
@@ -0,0 +1,240 @@
+"""
+Registro de clientes (escritórios): qual estabelecimento (`nrInscEstab`)
+pertence a qual cliente — o `CLIENTS_MAP` do README.
+
+ - Fonte da verdade: coleção `clientes` no Mongo, um documento por
+   estabelecimento `{_id: nrInscEstab, cliente: <CNPJ do escritório>}`.
+   Toda alteração (CLI abaixo) incrementa o contador em `clientes_versao`.
+ - Cada worker mantém o mapa inteiro em memória (`CLIENTS_MAP`). A checagem
+   por requisição (`registro.verificar`) é só um lookup no dict, sem ida ao banco.
+ - Invalidação: uma tarefa de fundo lê a versão a cada
+   `CLIENTES_VERSAO_INTERVALO_S` e recarrega o mapa quando ela muda; a cada
+   `CLIENTES_TTL_S` recarrega de qualquer forma (alterações feitas fora da CLI).
+ - Read-through: estabelecimento ausente do mapa é buscado uma vez no banco
+   (um cadastro recente ainda não visto pelo polling); a ausência fica em
+   cache negativo por `CLIENTES_NEGATIVO_TTL_S`, limitado aos
+   `CLIENTES_NEGATIVO_MAX` mais recentes (o nrInscEstab vem do payload, então
+   um cliente pode mandar quantos valores distintos quiser).
+ - Com o Mongo fora, o mapa em memória continua valendo até a próxima recarga.
+
+Uso da CLI:
+    python clientes.py adicionar 12287133000170 --estab 12287133000170 12287133000251
+    python clientes.py remover --estab 12287133000251
+    python clientes.py importar clientes.csv      # linhas "estab;cliente"
+    python clientes.py listar [--cliente 12287133000170]
+"""
+from collections import OrderedDict
+from pymongo import UpdateOne
+from database import db, breaker_mongo
+from utils.validadores_em_comum import limpar_cnpj
+import argparse
+import asyncio
+import csv
+import logging
+import os
+import time
+import metricas
+
+logger = logging.getLogger(__name__)
+
+# ─── Configuração ────────────────────────────
+CLIENTES_HABILITADO = os.getenv("CLIENTES_HABILITADO", "0") == "1"             # exige nrInscEstab cadastrado para o cliente do JWT
+CLIENTES_TTL_S = float(os.getenv("CLIENTES_TTL_S", 300))                        # recarga completa mesmo sem mudança de versão
+CLIENTES_VERSAO_INTERVALO_S = float(os.getenv("CLIENTES_VERSAO_INTERVALO_S", 5))  # intervalo do polling da versão
+CLIENTES_NEGATIVO_TTL_S = float(os.getenv("CLIENTES_NEGATIVO_TTL_S", 60))       # cache de estabelecimentos não cadastrados
+CLIENTES_NEGATIVO_MAX = int(os.getenv("CLIENTES_NEGATIVO_MAX", 10_000))         # entradas do cache negativo (LRU)
+
+COLECAO = "clientes"
+COLECAO_VERSAO = "clientes_versao"
+
+# nrInscEstab → CNPJ do cliente (escritório); substituído por inteiro a cada recarga
+CLIENTS_MAP = {}
+
+
+class EstabelecimentoNaoAutorizado(Exception):
+    """O estabelecimento não está cadastrado para o cliente do token."""
+
+
+class RegistroClientes:
+    def __init__(self):
+        self.versao = None
+        self.carregado_em = 0.0           # time.monotonic() da última recarga
+        self.ultima_recarga_ms = 0.0
+        self._ausentes = OrderedDict()    # nrInscEstab → expiração do cache negativo (LRU)
+        self._lock = asyncio.Lock()
+
+    # ─── carga ───────────────────────────────
+    async def _ler_versao(self) -> int:
+        async with breaker_mongo.protegido():
+            doc = await db[COLECAO_VERSAO].find_one({"_id": COLECAO})
+        return doc["versao"] if doc else 0
+
+    async def recarregar(self) -> int:
+        """Lê a coleção inteira e troca o mapa de uma vez. Retorna o nº de estabelecimentos."""
+        global CLIENTS_MAP
+        async with self._lock:
+            inicio = time.perf_counter()
+            versao = await self._ler_versao()
+            mapa = {}
+            async with breaker_mongo.protegido():
+                async for doc in db[COLECAO].find({}, {"cliente": 1}):
+                    mapa[doc["_id"]] = doc["cliente"]
+            CLIENTS_MAP = mapa
+            self._ausentes = OrderedDict()
+            self.versao = versao
+            self.carregado_em = time.monotonic()
+            self.ultima_recarga_ms = (time.perf_counter() - inicio) * 1000
+        metricas.incrementar("clientes_recargas_total")
+        metricas.incrementar("clientes_recarga_ms_total", self.ultima_recarga_ms)
+        logger.info(f"[clientes] {len(mapa)} estabelecimentos carregados (versão {versao}) "
+                    f"em {self.ultima_recarga_ms:.1f} ms")
+        return len(mapa)
+
+    async def loop_atualizacao(self):
+        """Tarefa de fundo: recarrega quando a versão muda ou o TTL vence."""
+        while True:
+            await asyncio.sleep(CLIENTES_VERSAO_INTERVALO_S)
+            try:
+                vencido = time.monotonic() - self.carregado_em >= CLIENTES_TTL_S
+                if vencido or await self._ler_versao() != self.versao:
+                    await self.recarregar()
+            except Exception as e:
+                metricas.incrementar("clientes_recargas_falhas_total")
+                logger.warning(f"[clientes] Recarga adiada, mantendo mapa em memória: {e!r}")
+
+    # ─── consulta ────────────────────────────
+    async def _buscar(self, estab: str):
+        """Read-through de um estabelecimento fora do mapa (cadastro mais novo que a última recarga)."""
+        expira = self._ausentes.get(estab)
+        if expira is not None and expira > time.monotonic():
+            self._ausentes.move_to_end(estab)
+            metricas.incrementar("clientes_cache_consultas_total", resultado="negativo")
+            return None
+        metricas.incrementar("clientes_cache_consultas_total", resultado="falta")
+        async with breaker_mongo.protegido():
+            doc = await db[COLECAO].find_one({"_id": estab}, {"cliente": 1})
+        if doc is None:
+            self._ausentes[estab] = time.monotonic() + CLIENTES_NEGATIVO_TTL_S
+            self._ausentes.move_to_end(estab)
+            while len(self._ausentes) > CLIENTES_NEGATIVO_MAX:
+                self._ausentes.popitem(last=False)
+            return None
+        CLIENTS_MAP[estab] = doc["cliente"]
+        return doc["cliente"]
+
+    async def cliente_de(self, nr_insc_estab: str):
+        """CNPJ do cliente dono do estabelecimento, ou None se não cadastrado."""
+        estab = limpar_cnpj(str(nr_insc_estab))
+        cliente = CLIENTS_MAP.get(estab)
+        if cliente is not None:
+            metricas.incrementar("clientes_cache_consultas_total", resultado="acerto")
+            return cliente
+        return await self._buscar(estab)
+
+    async def verificar(self, nr_insc_estab: str, client_cnpj: str) -> None:
+        """Lança EstabelecimentoNaoAutorizado se o estabelecimento não pertence a `client_cnpj`."""
+        cliente = await self.cliente_de(nr_insc_estab)
+        if cliente != limpar_cnpj(client_cnpj):
+            metricas.incrementar("clientes_recusas_total")
+            raise EstabelecimentoNaoAutorizado(
+                f"Estabelecimento {nr_insc_estab} não pertence ao cliente {client_cnpj}."
+            )
+
+    def taxa_acerto(self) -> float:
+        acertos = metricas.valor("clientes_cache_consultas_total", resultado="acerto")
+        total = acertos + metricas.valor("clientes_cache_consultas_total", resultado="falta") \
+            + metricas.valor("clientes_cache_consultas_total", resultado="negativo")
+        return round(acertos / total, 4) if total else 1.0
+
+
+registro = RegistroClientes()
+
+
+async def aquecer_clientes() -> int:
+    """Carga inicial do mapa no aquecimento do worker (0 se o registro estiver desligado)."""
+    if not CLIENTES_HABILITADO:
+        return 0
+    return await registro.recarregar()
+
+
+# ─── Manutenção (CLI) ────────────────────────
+async def _incrementar_versao():
+    await db[COLECAO_VERSAO].update_one({"_id": COLECAO}, {"$inc": {"versao": 1}}, upsert=True)
+
+
+async def cadastrar(pares: list) -> int:
+    """Grava [(nrInscEstab, cliente)] (upsert) e publica nova versão. Retorna o nº de estabelecimentos."""
+    operacoes = [
+        UpdateOne({"_id": limpar_cnpj(estab)}, {"$set": {"cliente": limpar_cnpj(cliente)}}, upsert=True)
+        for estab, cliente in pares
+    ]
+    for i in range(0, len(operacoes), 1000):
+        await db[COLECAO].bulk_write(operacoes[i:i + 1000], ordered=False)
+    if operacoes:
+        await _incrementar_versao()
+    return len(operacoes)
+
+
+async def descadastrar(estabs: list) -> int:
+    resultado = await db[COLECAO].delete_many({"_id": {"$in": [limpar_cnpj(e) for e in estabs]}})
+    if resultado.deleted_count:
+        await _incrementar_versao()
+    return resultado.deleted_count
+
+
+async def _main(args):
+    if args.comando == "adicionar":
+        n = await cadastrar([(estab, args.cliente) for estab in args.estab])
+        print(f"{n} estabelecimentos associados ao cliente {args.cliente}")
+    elif args.comando == "remover":
+        print(f"{await descadastrar(args.estab)} estabelecimentos removidos")
+    elif args.comando == "importar":
+        with open(args.arquivo, encoding="utf-8", newline="") as f:
+            pares = [(linha[0], linha[1]) for linha in csv.reader(f, delimiter=";") if len(linha) >= 2]
+        print(f"{await cadastrar(pares)} estabelecimentos importados")
+    else:
+        filtro = {"cliente": limpar_cnpj(args.cliente)} if args.cliente else {}
+        async for doc in db[COLECAO].find(filtro).sort("_id", 1):
+            print(f"{doc['_id']};{doc['cliente']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Registro estabelecimento → cliente (CLIENTS_MAP)")
+    sub = parser.add_subparsers(dest="comando", required=True)
+
+    p = sub.add_parser("adicionar", help="Associa estabelecimentos a um cliente")
+    p.add_argument("cliente", help="CNPJ do cliente (escritório), o mesmo do claim 'cnpj' do JWT")
+    p.add_argument("--estab", nargs="+", required=True, help="nrInscEstab dos estabelecimentos")
+
+    p = sub.add_parser("remover", help="Remove estabelecimentos do registro")
+    p.add_argument("--estab", nargs="+", required=True)
+
+    p = sub.add_parser("importar", help="Importa um CSV 'estab;cliente'")
+    p.add_argument("arquivo")
+
+    p = sub.add_parser("listar", help="Lista o registro (estab;cliente)")
+    p.add_argument("--cliente")
+
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)   # os validadores ligam DEBUG no import
+    asyncio.run(_main(args))
+
+
+metricas.descrever("clientes_cache_consultas_total", "counter",
+                   "Consultas ao CLIENTS_MAP por resultado (acerto, falta = ida ao banco, negativo)")
+metricas.descrever("clientes_recargas_total", "counter", "Recargas completas do registro de clientes")
+metricas.descrever("clientes_recarga_ms_total", "counter", "Tempo acumulado das recargas do registro de clientes")
+metricas.descrever("clientes_recargas_falhas_total", "counter", "Recargas do registro de clientes que falharam")
+metricas.descrever("clientes_recusas_total", "counter", "Requisições recusadas por estabelecimento de outro cliente")
+metricas.registrar_gauge("clientes_cache_taxa_acerto", registro.taxa_acerto,
+                         "Fração das consultas ao registro de clientes atendidas pela memória")
+metricas.registrar_gauge("clientes_cache_estabelecimentos", lambda: len(CLIENTS_MAP),
+                         "Estabelecimentos no CLIENTS_MAP deste worker")
+metricas.registrar_gauge("clientes_ultima_recarga_ms", lambda: round(registro.ultima_recarga_ms, 1),
+                         "Duração da última recarga do registro de clientes")
+metricas.registrar_gauge("clientes_idade_s", lambda: round(time.monotonic() - registro.carregado_em, 1)
+                         if registro.carregado_em else 0, "Tempo desde a última recarga do registro de clientes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+"""
+CLI do índice local da base pública de CNPJ (ver `utils/registro_cnpj.py`).
+
+ - `construir`: lê os arquivos "Estabelecimentos" dos Dados Abertos do CNPJ
+   (CSV `;` em latin-1, soltos ou dentro dos .zip oficiais) em streaming,
+   ordena em blocos de `--lote` registros gravados em arquivos temporários e
+   junta tudo com `heapq.merge` no índice final. A memória fica limitada ao
+   bloco, qualquer que seja o tamanho da base (~60 milhões de estabelecimentos).
+ - `consultar`: mostra a situação de CNPJs no índice.
+ - `bench`: mede consultas por segundo (acertos e ausentes) no índice.
+ - `amostra`: gera um CSV sintético no leiaute da Receita, para testes.
+
+Uso:
+    python cnpj_registro.py construir Estabelecimentos*.zip -o cnpj.idx
+    python cnpj_registro.py consultar cnpj.idx 10490181000135
+    python cnpj_registro.py bench cnpj.idx --consultas 1000000
+    CNPJ_REGISTRO_PATH=cnpj.idx uvicorn main:app --workers 4
+"""
+from utils.registro_cnpj import (
+    CABECALHO, FLAG_MATRIZ, MAGICO, SITUACOES, TAMANHO_CHAVE, TAMANHO_REGISTRO, IndiceCnpj,
+)
+from utils.validadores_em_comum import calcular_dv_cnpj, limpar_cnpj
+import argparse
+import csv
+import heapq
+import io
+import logging
+import os
+import random
+import sys
+import tempfile
+import time
+import zipfile
+
+# Colunas do arquivo Estabelecimentos (leiaute dos Dados Abertos do CNPJ)
+_COL_BASICO, _COL_ORDEM, _COL_DV, _COL_MATRIZ, _COL_SITUACAO = 0, 1, 2, 3, 5
+
+
+def _linhas_csv(caminho: str):
+    """Linhas (listas de campos) de um CSV da Receita ou de todos os CSVs dentro de um .zip."""
+    if zipfile.is_zipfile(caminho):
+        with zipfile.ZipFile(caminho) as z:
+            for nome in z.namelist():
+                with z.open(nome) as bruto:
+                    yield from csv.reader(io.TextIOWrapper(bruto, encoding="latin-1", newline=""), delimiter=";")
+    else:
+        with open(caminho, encoding="latin-1", newline="") as f:
+            yield from csv.reader(f, delimiter=";")
+
+
+def registros_estabelecimentos(caminhos: list):
+    """Gera os registros de 16 bytes (CNPJ + situação + flags) dos arquivos, na ordem de leitura."""
+    for caminho in caminhos:
+        for campos in _linhas_csv(caminho):
+            try:
+                cnpj = (campos[_COL_BASICO] + campos[_COL_ORDEM] + campos[_COL_DV]).upper()   # CNPJ alfanumérico
+                situacao = int(campos[_COL_SITUACAO])
+            except (IndexError, ValueError):
+                continue     # linha fora do leiaute
+            if len(cnpj) != TAMANHO_CHAVE:
+                continue
+            flags = FLAG_MATRIZ if campos[_COL_MATRIZ] == "1" else 0
+            yield cnpj.encode("ascii") + bytes((situacao, flags))
+
+
+def _gravar_bloco(registros: list, diretorio: str) -> str:
+    registros.sort()
+    fd, caminho = tempfile.mkstemp(suffix=".run", dir=diretorio)
+    with os.fdopen(fd, "wb") as f:
+        f.write(b"".join(registros))
+    return caminho
+
+
+def _ler_bloco(caminho: str, buffer: int = 1 << 20):
+    with open(caminho, "rb") as f:
+        while True:
+            dados = f.read(buffer - buffer % TAMANHO_REGISTRO)
+            if not dados:
+                return
+            for i in range(0, len(dados), TAMANHO_REGISTRO):
+                yield dados[i:i + TAMANHO_REGISTRO]
+
+
+def construir_indice(caminhos: list, saida: str, lote: int = 2_000_000) -> int:
+    """
+    Ordenação externa: blocos de `lote` registros ordenados em disco e
+    intercalados com heapq.merge. Chaves repetidas ficam com o último registro lido.
+    Retorna o número de CNPJs no índice.
+    """
+    diretorio = os.path.dirname(os.path.abspath(saida))
+    blocos = []
+    atual = []
+    try:
+        for registro in registros_estabelecimentos(caminhos):
+            atual.append(registro)
+            if len(atual) >= lote:
+                blocos.append(_gravar_bloco(atual, diretorio))
+                atual = []
+        if atual:
+            blocos.append(_gravar_bloco(atual, diretorio))
+        atual = []
+
+        temporario = saida + ".tmp"
+        quantidade = 0
+        with open(temporario, "wb") as f:
+            f.write(CABECALHO.pack(MAGICO, 0))
+            anterior = None
+            pendente = []
+            for registro in heapq.merge(*(_ler_bloco(b) for b in blocos), key=lambda r: r[:TAMANHO_CHAVE]):
+                if anterior is not None and registro[:TAMANHO_CHAVE] == anterior[:TAMANHO_CHAVE]:
+                    pendente[-1] = registro
+                else:
+                    pendente.append(registro)
+                    quantidade += 1
+                anterior = registro
+                if len(pendente) >= 65536:
+                    f.write(b"".join(pendente[:-1]))
+                    pendente = pendente[-1:]
+            f.write(b"".join(pendente))
+            f.seek(0)
+            f.write(CABECALHO.pack(MAGICO, quantidade))
+            f.flush()
+            os.fsync(f.fileno())
+        # troca atômica: workers que já mapearam o índice antigo continuam com ele até reiniciar
+        os.replace(temporario, saida)
+        return quantidade
+    finally:
+        for bloco in blocos:
+            os.remove(bloco)
+
+
+def _cnpj_aleatorio(rnd: random.Random) -> str:
+    base = f"{rnd.randrange(10 ** 8):08d}{rnd.choice(('0001', '0002', '0003'))}"
+    return base + calcular_dv_cnpj(base)
+
+
+def gerar_amostra(caminho: str, quantidade: int, seed: int = 42) -> None:
+    """CSV sintético no leiaute Estabelecimentos (só as colunas usadas têm conteúdo real)."""
+    rnd = random.Random(seed)
+    situacoes = [2] * 8 + [4, 8]
+    with open(caminho, "w", encoding="latin-1", newline="") as f:
+        escritor = csv.writer(f, delimiter=";", quoting=csv.QUOTE_ALL)
+        for _ in range(quantidade):
+            cnpj = _cnpj_aleatorio(rnd)
+            escritor.writerow([cnpj[:8], cnpj[8:12], cnpj[12:], "1" if cnpj[8:12] == "0001" else "2",
+                               "", f"{rnd.choice(situacoes):02d}", "20200101", "00"])
+
+
+def _bench(caminho: str, consultas: int) -> None:
+    idx = IndiceCnpj(caminho)
+    rnd = random.Random(7)
+    mm = idx._mm
+    presentes = []
+    for _ in range(min(consultas, 100_000)):
+        pos = CABECALHO.size + rnd.randrange(idx.quantidade) * TAMANHO_REGISTRO
+        presentes.append(mm[pos:pos + TAMANHO_CHAVE].decode("ascii"))
+    ausentes = [_cnpj_aleatorio(rnd) for _ in range(min(consultas, 100_000))]
+
+    for nome, chaves in (("presentes", presentes), ("ausentes", ausentes)):
+        inicio = time.perf_counter()
+        achados = 0
+        for i in range(consultas):
+            achados += idx.consultar(chaves[i % len(chaves)]) is not None
+        decorrido = time.perf_counter() - inicio
+        print(f"{nome:>9}: {consultas} consultas em {decorrido:.2f}s "
+              f"({consultas / decorrido:,.0f}/s, {decorrido / consultas * 1e6:.2f} µs cada, {achados} encontrados)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Índice local da base pública de CNPJ")
+    sub = parser.add_subparsers(dest="comando", required=True)
+
+    p = sub.add_parser("construir", help="Gera o índice a partir dos arquivos Estabelecimentos")
+    p.add_argument("arquivos", nargs="+", help="CSVs ou .zip dos Dados Abertos do CNPJ")
+    p.add_argument("-o", "--output", required=True, help="Arquivo do índice")
+    p.add_argument("--lote", type=int, default=2_000_000, help="Registros por bloco ordenado em memória")
+
+    p = sub.add_parser("consultar", help="Mostra a situação de CNPJs")
+    p.add_argument("indice")
+    p.add_argument("cnpjs", nargs="+")
+
+    p = sub.add_parser("bench", help="Mede a vazão de consultas")
+    p.add_argument("indice")
+    p.add_argument("--consultas", type=int, default=1_000_000)
+
+    p = sub.add_parser("amostra", help="Gera um CSV sintético no leiaute da Receita")
+    p.add_argument("saida")
+    p.add_argument("--quantidade", type=int, default=1_000_000)
+
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)   # os validadores ligam DEBUG no import
+    if args.comando == "construir":
+        inicio = time.perf_counter()
+        quantidade = construir_indice(args.arquivos, args.output, args.lote)
+        print(f"{quantidade} CNPJs indexados em {time.perf_counter() - inicio:.1f}s "
+              f"({os.path.getsize(args.output) / 1e6:.1f} MB)", file=sys.stderr)
+    elif args.comando == "consultar":
+        idx = IndiceCnpj(args.indice)
+        for cnpj in args.cnpjs:
+            encontrado = idx.consultar(limpar_cnpj(cnpj))
+            if encontrado is None:
+                print(f"{cnpj}: não encontrado")
+            else:
+                situacao, flags = encontrado
+                print(f"{cnpj}: {SITUACOES.get(situacao, situacao)}{' (matriz)' if flags & FLAG_MATRIZ else ''}")
+    elif args.comando == "bench":
+        _bench(args.indice, args.consultas)
+    else:
+        gerar_amostra(args.saida, args.quantidade)
+
+
+if __name__ == "__main__":
+    main()
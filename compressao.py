@@ -0,0 +1,260 @@
+"""
+Compressão dos corpos HTTP para tráfego em lote.
+
+Requisições:
+ - `DescompressaoMiddleware` aceita `Content-Encoding: gzip` (ou `deflate`) e
+   `zstd` e descomprime em streaming, à medida que o corpo chega, sem
+   acumular o corpo comprimido.
+ - Proteção contra zip bomb: cada chamada ao descompressor produz no máximo
+   `_SAIDA_MAX_CHAMADA` bytes, e o total passa por `COMPRESSAO_MAX_BYTES`.
+   Acima disso a resposta é 413, antes de a memória crescer.
+ - zstd depende do pacote opcional `zstandard`; sem ele, `zstd` recebe 415.
+
+Respostas:
+ - `CompressaoRespostaMiddleware` comprime respostas a partir de
+   `COMPRESSAO_RESPOSTA_MIN_BYTES` conforme o `Accept-Encoding` do cliente
+   (zstd, se disponível, senão gzip), inclusive respostas em streaming
+   como `/exportar`. Conteúdo já comprimido (`application/gzip`, ou com
+   `Content-Encoding`) passa direto.
+"""
+from fastapi import HTTPException
+import json
+import logging
+import os
+import zlib
+import metricas
+
+try:
+    import zstandard
+except ImportError:    # opcional: sem ele, só gzip/deflate
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+# ─── Configuração ────────────────────────────
+COMPRESSAO_MAX_BYTES = int(os.getenv("COMPRESSAO_MAX_BYTES", 50 * 1024 * 1024))          # limite do corpo descomprimido
+COMPRESSAO_RESPOSTA_MIN_BYTES = int(os.getenv("COMPRESSAO_RESPOSTA_MIN_BYTES", 1024))   # respostas menores vão sem compressão
+COMPRESSAO_NIVEL_GZIP = int(os.getenv("COMPRESSAO_NIVEL_GZIP", 6))
+COMPRESSAO_NIVEL_ZSTD = int(os.getenv("COMPRESSAO_NIVEL_ZSTD", 3))
+
+_SAIDA_MAX_CHAMADA = 256 * 1024   # bytes descomprimidos por chamada (gzip/deflate)
+_FATIA_ZSTD = 1024                # entrada por chamada no zstd, que não limita a saída (razão máx. ~32000:1 → 32 MB)
+
+CODIFICACOES = ("gzip", "deflate", "zstd") if zstandard else ("gzip", "deflate")
+
+
+class CorpoMuitoGrande(HTTPException):
+    def __init__(self, limite: int):
+        super().__init__(status_code=413, detail=f"Corpo descomprimido excede o limite de {limite} bytes.")
+
+
+class Descompressor:
+    """Descompressão incremental com limite total de saída."""
+
+    def __init__(self, codificacao: str, limite: int = COMPRESSAO_MAX_BYTES):
+        self.codificacao = codificacao
+        self.limite = limite
+        self.total = 0
+        if codificacao == "zstd":
+            self._obj = zstandard.ZstdDecompressor().decompressobj()
+        else:
+            # 47 = detecção automática do cabeçalho gzip ou zlib ("deflate" no HTTP)
+            self._obj = zlib.decompressobj(47)
+
+    def _contar(self, dados: bytes) -> bytes:
+        self.total += len(dados)
+        if self.total > self.limite:
+            raise CorpoMuitoGrande(self.limite)
+        return dados
+
+    def descomprimir(self, pedaco: bytes):
+        """Gera os blocos descomprimidos de `pedaco`, nunca mais que `_SAIDA_MAX_CHAMADA` por vez (gzip)."""
+        try:
+            if self.codificacao == "zstd":
+                for i in range(0, len(pedaco), _FATIA_ZSTD):
+                    saida = self._obj.decompress(pedaco[i:i + _FATIA_ZSTD])
+                    if saida:
+                        yield self._contar(saida)
+                return
+
+            dados = pedaco
+            while dados:
+                saida = self._obj.decompress(dados, _SAIDA_MAX_CHAMADA)
+                if saida:
+                    yield self._contar(saida)
+                dados = self._obj.unconsumed_tail
+        except (zlib.error, getattr(zstandard, "ZstdError", zlib.error)) as e:
+            raise HTTPException(status_code=400, detail=f"Corpo {self.codificacao} inválido: {e}")
+
+    def finalizar(self) -> bytes:
+        if self.codificacao == "zstd":
+            return b""
+        return self._contar(self._obj.flush())
+
+
+def comprimir(dados: bytes, codificacao: str) -> bytes:
+    """Compressão de um corpo inteiro (clientes, benchmark)."""
+    if codificacao == "zstd":
+        return zstandard.ZstdCompressor(level=COMPRESSAO_NIVEL_ZSTD).compress(dados)
+    if codificacao == "deflate":
+        return zlib.compress(dados, COMPRESSAO_NIVEL_GZIP)
+    compressor = zlib.compressobj(COMPRESSAO_NIVEL_GZIP, zlib.DEFLATED, 31)
+    return compressor.compress(dados) + compressor.flush()
+
+
+def _cabecalho(headers: list, nome: bytes):
+    for chave, valor in headers:
+        if chave == nome:
+            return valor.decode("latin-1")
+    return None
+
+
+async def _responder_erro(send, status: int, detalhe: str) -> None:
+    corpo = json.dumps({"detail": detalhe}, ensure_ascii=False).encode("utf-8")
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(corpo)).encode())],
+    })
+    await send({"type": "http.response.body", "body": corpo})
+
+
+class DescompressaoMiddleware:
+    """Middleware ASGI que entrega ao app o corpo já descomprimido."""
+
+    def __init__(self, app, limite: int = COMPRESSAO_MAX_BYTES):
+        self.app = app
+        self.limite = limite
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        codificacao = (_cabecalho(scope["headers"], b"content-encoding") or "identity").strip().lower()
+        if codificacao == "identity":
+            await self.app(scope, receive, send)
+            return
+        if codificacao not in CODIFICACOES:
+            await _responder_erro(send, 415, f"Content-Encoding '{codificacao}' não suportado. Use: {list(CODIFICACOES)}")
+            return
+
+        descompressor = Descompressor(codificacao, self.limite)
+        pendentes = []
+        fim = False
+
+        async def receive_descomprimido():
+            nonlocal fim
+            while not pendentes and not fim:
+                mensagem = await receive()
+                if mensagem["type"] != "http.request":
+                    return mensagem
+                pendentes.extend(descompressor.descomprimir(mensagem.get("body", b"")))
+                if not mensagem.get("more_body", False):
+                    resto = descompressor.finalizar()
+                    if resto:
+                        pendentes.append(resto)
+                    fim = True
+            corpo = pendentes.pop(0) if pendentes else b""
+            return {"type": "http.request", "body": corpo, "more_body": bool(pendentes) or not fim}
+
+        # o app vê o corpo como se tivesse chegado sem compressão
+        scope = dict(scope)
+        scope["headers"] = [(k, v) for k, v in scope["headers"] if k not in (b"content-encoding", b"content-length")]
+        metricas.incrementar("requisicoes_comprimidas_total", codificacao=codificacao)
+        try:
+            await self.app(scope, receive_descomprimido, send)
+        finally:
+            metricas.incrementar("bytes_descomprimidos_total", descompressor.total, codificacao=codificacao)
+
+
+class CompressaoRespostaMiddleware:
+    """Compressão negociada (Accept-Encoding) de respostas grandes, inclusive em streaming."""
+
+    _JA_COMPRIMIDOS = ("application/gzip", "application/zstd", "application/zip", "text/event-stream")
+
+    def __init__(self, app, minimo: int = COMPRESSAO_RESPOSTA_MIN_BYTES):
+        self.app = app
+        self.minimo = minimo
+
+    @staticmethod
+    def _negociar(accept: str):
+        aceitas = {}
+        for item in (accept or "").split(","):
+            partes = item.strip().split(";")
+            nome = partes[0].strip().lower()
+            q = 1.0
+            for p in partes[1:]:
+                if p.strip().startswith("q="):
+                    try:
+                        q = float(p.strip()[2:])
+                    except ValueError:
+                        q = 0.0
+            aceitas[nome] = q
+        for codificacao in ("zstd", "gzip"):
+            if codificacao == "zstd" and not zstandard:
+                continue
+            if aceitas.get(codificacao, aceitas.get("*", 0)) > 0:
+                return codificacao
+        return None
+
+    async def __call__(self, scope, receive, send):
+        codificacao = self._negociar(_cabecalho(scope["headers"], b"accept-encoding")) if scope["type"] == "http" else None
+        if codificacao is None:
+            await self.app(scope, receive, send)
+            return
+
+        inicio = None
+        compressor = None
+        passar_direto = False
+
+        def _comprimir(dados: bytes, final: bool) -> bytes:
+            if codificacao == "zstd":
+                saida = compressor.compress(dados)
+                modo = zstandard.COMPRESSOBJ_FLUSH_FINISH if final else zstandard.COMPRESSOBJ_FLUSH_BLOCK
+                return saida + compressor.flush(modo)
+            saida = compressor.compress(dados)
+            return saida + (compressor.flush() if final else compressor.flush(zlib.Z_SYNC_FLUSH))
+
+        async def send_comprimido(mensagem):
+            nonlocal inicio, compressor, passar_direto
+            if mensagem["type"] == "http.response.start":
+                inicio = mensagem
+                headers = mensagem.get("headers", [])
+                tipo = (_cabecalho(headers, b"content-type") or "").split(";")[0].strip().lower()
+                passar_direto = _cabecalho(headers, b"content-encoding") is not None or tipo in self._JA_COMPRIMIDOS
+                if passar_direto:
+                    await send(mensagem)
+                return
+            if mensagem["type"] != "http.response.body" or passar_direto:
+                await send(mensagem)
+                return
+
+            corpo = mensagem.get("body", b"")
+            mais = mensagem.get("more_body", False)
+            if inicio is not None:
+                start, inicio = inicio, None
+                if not mais and len(corpo) < self.minimo:
+                    passar_direto = True
+                    await send(start)
+                    await send(mensagem)
+                    return
+                compressor = (zstandard.ZstdCompressor(level=COMPRESSAO_NIVEL_ZSTD).compressobj()
+                              if codificacao == "zstd"
+                              else zlib.compressobj(COMPRESSAO_NIVEL_GZIP, zlib.DEFLATED, 31))
+                headers = [(k, v) for k, v in start.get("headers", []) if k != b"content-length"]
+                headers += [(b"content-encoding", codificacao.encode()), (b"vary", b"Accept-Encoding")]
+                saida = _comprimir(corpo, not mais)
+                if not mais:
+                    headers.append((b"content-length", str(len(saida)).encode()))
+                await send({**start, "headers": headers})
+                await send({"type": "http.response.body", "body": saida, "more_body": mais})
+                metricas.incrementar("respostas_comprimidas_total", codificacao=codificacao)
+                return
+            await send({"type": "http.response.body", "body": _comprimir(corpo, not mais), "more_body": mais})
+
+        await self.app(scope, receive, send_comprimido)
+
+
+metricas.descrever("requisicoes_comprimidas_total", "counter", "Requisições recebidas com corpo comprimido")
+metricas.descrever("bytes_descomprimidos_total", "counter", "Bytes de corpo de requisição após descompressão")
+metricas.descrever("respostas_comprimidas_total", "counter", "Respostas comprimidas por codificação negociada")
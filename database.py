@@ -1,12 +1,21 @@
 from motor.motor_asyncio import AsyncIOMotorClient
-from pymongo.errors import DuplicateKeyError
+from pymongo.errors import BulkWriteError, ConnectionFailure, DuplicateKeyError
+from journal import journal, JOURNAL_HABILITADO, JOURNAL_DESVIO_MS
+from circuit_breaker import CircuitBreaker, CircuitoAbertoError
+from collections import defaultdict
+from datetime import date
+import esquema
+import tracing
+import asyncio
 import os
+import re
 import logging
 
 logger = logging.getLogger(__name__)
 
 # ─── Configuração MongoDB ────────────────────
 MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017/")
+MONGO_DB = os.getenv("MONGO_DB", "Reinf")  # nome do banco (benchmarks usam um banco separado)
 MONGO_MAX_POOL = int(os.getenv("MONGO_MAX_POOL", 300))  # nº máx. de conexões simultâneas que podem
 MONGO_MIN_POOL = int(os.getenv("MONGO_MIN_POOL", 0))    # nº  mín. de conexões que o driver mantém sempre abertas no pool
 MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", 30_000))  # tempo limite (ms) que uma coroutine espera na fila quando o pool lota antes de lançar erro(30 segundos).
@@ -14,6 +23,9 @@ MONGO_MAX_CONNECTING = int(os.getenv("MONGO_MAX_CONNECTING", 10))    # nº máx.
 MONGO_MAX_IDLE_MS = int(os.getenv("MONGO_MAX_IDLE_MS", 300_000))    # quanto tempo uma conexão pode ficar ociosa antes de encerrar(5 minuto).
 MONGO_SERVER_SELECTION_MS = int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", 10_000))   # quanto tempo (ms) o driver tenta encontrar um servidor elegível antes de desistir(10 segndos).
 MONGO_CONNECT_TIMEOUT_MS = int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", 10_000))   # tempo limite (ms) para estabelecer o socket TCP com o servidor, diz quanto tempo o driver espera para criar esse canal antes de desistir e declarar o servidor indisponível.(10 segundos).
+MONGO_WARMUP_CONNECTIONS = int(os.getenv("MONGO_WARMUP_CONNECTIONS", 10))  # nº de conexões abertas antecipadamente no startup de cada worker (0 desliga).
+MONGO_ESQUEMA = os.getenv("MONGO_ESQUEMA", "legado")  # formato dos novos documentos: "legado" (v1) ou "compacto" (v2, ver esquema.py).
+MONGO_PARTICIONAMENTO = os.getenv("MONGO_PARTICIONAMENTO", "nenhum")  # layout das coleções: "nenhum", "cliente", "periodo" ou "cliente_periodo".
 
 # ─── Cliente com pool configurado ────────────
 client = AsyncIOMotorClient(
@@ -27,7 +39,11 @@ client = AsyncIOMotorClient(
     connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
 )
 
-db = client["Reinf"]
+db = client[MONGO_DB]
+
+# Circuit breaker de todas as chamadas ao banco: com o Mongo fora, falha na hora
+# (ou desvia para o journal) em vez de segurar o worker pelos timeouts do driver.
+breaker_mongo = CircuitBreaker("mongo", excecoes_falha=(ConnectionFailure, asyncio.TimeoutError))
 
 # Mapeamento evento → coleção
 _COLLECTIONS = {
@@ -41,26 +57,128 @@ EVENT_CONFIG = {
     "R2010": {
         "id_field":      "numDocto",
         "pessoa_fields": ["cnpjPrestador"],
+        "periodo_field": "dtEmissaoNF",
     },
     "R4010": {
         "id_field":      "NumDoc",
         "pessoa_fields": ["cpfBenef", "cnpjBenef"],
+        "periodo_field": "dtFG",
     },
     "R4020": {
         "id_field":      "NumDoc",
         "pessoa_fields": ["cpfBenef", "cnpjBenef"],
+        "periodo_field": "dtFG",
     },
 }
 
 
-def get_collection(tipo_evento: str):
+async def aquecer_pool(conexoes: int = MONGO_WARMUP_CONNECTIONS) -> int:
     """
-        Converte o código do evento (ex: "R4010") no objeto collection correspondente.
+        Abre `conexoes` conexões do pool antes da primeira requisição.
+        Dispara pings simultâneos para que o driver precise de uma conexão por ping;
+        a abertura respeita `MONGO_MAX_CONNECTING`. Retorna o nº de pings concluídos.
+    """
+    conexoes = min(max(conexoes, 0), MONGO_MAX_POOL)
+    if conexoes == 0:
+        return 0
+    await asyncio.gather(*(client.admin.command("ping") for _ in range(conexoes)))
+    logger.info(f"[Mongo] Pool aquecido com {conexoes} conexões")
+    return conexoes
+
+
+# ─── Particionamento ─────────────────────────
+# Com MONGO_PARTICIONAMENTO != "nenhum", cada evento vai para uma coleção
+# "<evento>[.c<cliente>][.p<AAAAMM>]". Arquivar um período fechado vira um
+# `drop` da coleção, e o backfill de um escritório não mexe nos índices dos outros.
+#
+# Todo documento novo leva `_cli` (CNPJ do cliente) e `_per` (AAAAMM), tanto no
+# layout plano quanto no particionado. Para sharding, a chave recomendada é
+# {_cli: 1, _id: 1}: os dois campos derivam do `_id`, então um reenvio sempre cai
+# no mesmo chunk e a unicidade do `_id` (duplicidade → 409) continua garantida;
+# o índice {_cli: 1, _per: 1} atende as consultas por cliente/período.
+#
+# Quando o período faz parte da partição, o mesmo `_id` com outra data cairia em
+# outra coleção. Por isso esses layouts registram cada `_id` em "<evento>.chaves"
+# ({_id, col}), que garante a unicidade global e resolve a partição nas buscas.
+_PARTICIONA_CLIENTE = MONGO_PARTICIONAMENTO in ("cliente", "cliente_periodo")
+_PARTICIONA_PERIODO = MONGO_PARTICIONAMENTO in ("periodo", "cliente_periodo")
+
+
+def periodo_evento(payload: dict):
+    """
+        Período (AAAAMM, int) do evento, a partir do campo `periodo_field` do EVENT_CONFIG.
+    """
+    cfg = EVENT_CONFIG.get(payload.get("TpEvento"), {})
+    valor = payload.get(cfg.get("periodo_field"))
+    if isinstance(valor, date):
+        return valor.year * 100 + valor.month
+    if isinstance(valor, str) and len(valor) >= 7 and valor[:4].isdigit() and valor[5:7].isdigit():
+        return int(valor[:4]) * 100 + int(valor[5:7])
+    return None
+
+
+def nome_colecao(tipo_evento: str, client_cnpj: str = None, periodo: int = None) -> str:
+    """
+        Nome da coleção (partição) onde um evento do cliente/período é gravado.
     """
     colecao = _COLLECTIONS.get(tipo_evento)
     if not colecao:
         raise ValueError(f"Evento desconhecido: {tipo_evento}")
-    return db[colecao]
+    if _PARTICIONA_CLIENTE and client_cnpj:
+        colecao += f".c{re.sub(r'[^0-9A-Za-z]', '', client_cnpj)}"
+    if _PARTICIONA_PERIODO and periodo:
+        colecao += f".p{periodo}"
+    return colecao
+
+
+def get_collection(tipo_evento: str, client_cnpj: str = None, periodo: int = None):
+    """
+        Converte o código do evento (ex: "R4010") no objeto collection correspondente.
+        Com particionamento ativo, `client_cnpj`/`periodo` escolhem a partição.
+    """
+    return db[nome_colecao(tipo_evento, client_cnpj, periodo)]
+
+
+def _colecao_chaves(tipo_evento: str):
+    return db[f"{_COLLECTIONS[tipo_evento]}.chaves"]
+
+
+async def colecoes_evento(tipo_evento: str, client_cnpj: str = None, periodos=None) -> list:
+    """
+        Lista as coleções de um evento que podem conter documentos do cliente/períodos
+        informados (None = qualquer). No layout plano é sempre a coleção única; o filtro
+        por `_cli`/`_per` dentro dela fica a cargo de quem consulta.
+    """
+    base = nome_colecao(tipo_evento)
+    if MONGO_PARTICIONAMENTO == "nenhum":
+        return [db[base]]
+
+    periodos = set(periodos) if periodos else None
+    cliente = re.sub(r"[^0-9A-Za-z]", "", client_cnpj) if client_cnpj else None
+    nomes = await db.list_collection_names(filter={"name": {"$regex": f"^{re.escape(base)}(\\.|$)"}})
+
+    selecionadas = []
+    for nome in sorted(nomes):
+        partes = nome.split(".")[1:]
+        if partes == ["chaves"]:
+            continue
+        c = next((x[1:] for x in partes if x.startswith("c")), None)
+        p = next((int(x[1:]) for x in partes if x.startswith("p")), None)
+        if cliente and c is not None and c != cliente:
+            continue
+        if periodos and p is not None and p not in periodos:
+            continue
+        selecionadas.append(db[nome])
+    return selecionadas
+
+
+async def garantir_indices() -> None:
+    """
+        Cria os índices de apoio do layout atual (idempotente; chamado no aquecimento).
+    """
+    if MONGO_PARTICIONAMENTO == "nenhum":
+        for tipo in _COLLECTIONS:
+            await get_collection(tipo).create_index([("_cli", 1), ("_per", 1)], name="cliente_periodo")
 
 
 def build_id(payload: dict, client_cnpj: str) -> str:
@@ -88,23 +206,207 @@ def build_id(payload: dict, client_cnpj: str) -> str:
     return f"{numdoc}-{estab_cnpj}-{pessoa_id}-{client_cnpj}"
 
 
+def montar_documento(resultado: dict, payload: dict, idx: str) -> dict:
+    """
+        Monta o documento a gravar conforme `MONGO_ESQUEMA`.
+    """
+    if MONGO_ESQUEMA == "compacto":
+        return esquema.compactar(payload, idx, EVENT_CONFIG[payload["TpEvento"]])
+    return {**payload, **resultado, "_id": idx}
+
+
+async def buscar_evento(tipo_evento: str, idx: str, client_cnpj: str = None):
+    """
+        Lê um evento pelo _id e o devolve no formato da API, qualquer que seja a versão
+        gravada e a partição em que estiver.
+    """
+    async with breaker_mongo.protegido():
+        if _PARTICIONA_PERIODO:
+            chave = await _colecao_chaves(tipo_evento).find_one({"_id": idx})
+            if chave is None:
+                return None
+            col = db[chave["col"]]
+        else:
+            # o cliente é o último componente do _id
+            col = get_collection(tipo_evento, client_cnpj or idx.rsplit("-", 1)[-1])
+        doc = await col.find_one({"_id": idx})
+    if doc is None:
+        return None
+    return esquema.expandir(doc, tipo_evento, EVENT_CONFIG[tipo_evento])
+
+
+async def _inserir_documento(tipo_evento: str, colecao: str, doc: dict):
+    """
+        Insere um documento na partição `colecao`, registrando a chave quando o layout exige.
+    """
+    col = db[colecao]
+    if _PARTICIONA_PERIODO:
+        await _colecao_chaves(tipo_evento).insert_one({"_id": doc["_id"], "col": colecao})
+    try:
+        result = await col.insert_one(doc)
+    except BaseException as e:
+        # desfaz o registro da chave para não bloquear o reenvio (também no cancelamento)
+        if _PARTICIONA_PERIODO and not isinstance(e, DuplicateKeyError):
+            await _colecao_chaves(tipo_evento).delete_one({"_id": doc["_id"], "col": colecao})
+        raise
+    return result.inserted_id
+
+
+async def _inserir_muitos(col, docs: list) -> set:
+    """
+        insert_many não ordenado; retorna os _ids que eram duplicados (código 11000).
+        Qualquer outro erro de escrita é propagado.
+    """
+    if not docs:
+        return set()
+    try:
+        await col.insert_many(docs, ordered=False)
+        return set()
+    except BulkWriteError as e:
+        erros = e.details.get("writeErrors", [])
+        if any(err.get("code") != 11000 for err in erros):
+            raise
+        return {docs[err["index"]]["_id"] for err in erros}
+
+
+async def inserir_lote(itens: list, duplicados_ids: set = None) -> tuple:
+    """
+        Insere em lote [(tipo, coleção, doc)], respeitando a unicidade do _id do build_id.
+        Retorna (inseridos, duplicados); duplicados são descartados como em save_if_valid.
+        Se `duplicados_ids` for passado, recebe os _ids descartados (resultado por item).
+    """
+    por_colecao = defaultdict(list)
+    for tipo_evento, colecao, doc in itens:
+        por_colecao[(tipo_evento, colecao)].append(doc)
+
+    async with breaker_mongo.protegido():
+        return await _inserir_por_colecao(por_colecao, duplicados_ids)
+
+
+async def _inserir_por_colecao(por_colecao: dict, duplicados_ids: set = None) -> tuple:
+    inseridos = duplicados = 0
+    for (tipo_evento, colecao), docs in por_colecao.items():
+        if _PARTICIONA_PERIODO:
+            chaves = _colecao_chaves(tipo_evento)
+            dups_chave = await _inserir_muitos(chaves, [{"_id": d["_id"], "col": colecao} for d in docs])
+            docs = [d for d in docs if d["_id"] not in dups_chave]
+            duplicados += len(dups_chave)
+            if duplicados_ids is not None:
+                duplicados_ids.update(dups_chave)
+        try:
+            dups = await _inserir_muitos(db[colecao], docs)
+        except BaseException:
+            # também no cancelamento (shutdown de um worker de jobs), senão a retomada veria duplicados
+            if _PARTICIONA_PERIODO:
+                await chaves.delete_many({"_id": {"$in": [d["_id"] for d in docs]}, "col": colecao})
+            raise
+        duplicados += len(dups)
+        inseridos += len(docs) - len(dups)
+        if duplicados_ids is not None:
+            duplicados_ids.update(dups)
+    return inseridos, duplicados
+
+
+async def ids_existentes(itens: list) -> set:
+    """
+        _ids de [(tipo, coleção, doc)] que já estão gravados (onde `inserir_lote` os
+        acusaria como duplicados): no índice de chaves quando o layout particiona por
+        período, senão na própria coleção.
+    """
+    por_colecao = defaultdict(list)
+    for tipo_evento, colecao, doc in itens:
+        col = _colecao_chaves(tipo_evento) if _PARTICIONA_PERIODO else db[colecao]
+        por_colecao[col.name].append(doc["_id"])
+    existentes = set()
+    async with breaker_mongo.protegido():
+        for nome, ids in por_colecao.items():
+            async for doc in db[nome].find({"_id": {"$in": ids}}, {"_id": 1}):
+                existentes.add(doc["_id"])
+    return existentes
+
+
+async def verificar_conexao():
+    """
+        Ping curto, usado para saber se o Mongo voltou antes de reprocessar o journal.
+    """
+    async with breaker_mongo.protegido():
+        await asyncio.wait_for(client.admin.command("ping"), JOURNAL_DESVIO_MS / 1000)
+
+
+def _recolher(tarefa: asyncio.Task) -> None:
+    if not tarefa.cancelled() and tarefa.exception() is not None:
+        logger.warning(f"[Mongo] Inserção abandonada por lentidão falhou: {tarefa.exception()!r}")
+
+
+async def _inserir_com_desvio(tipo: str, colecao: str, doc: dict):
+    """
+        `_inserir_documento` com limite de JOURNAL_DESVIO_MS. O timeout fica fora da
+        inserção (shield): ela não é cancelada no meio, com a chave da partição já
+        registrada. Se terminar depois, o reenvio do journal a vê como duplicada; se
+        falhar, ela mesma desfaz a chave.
+    """
+    tarefa = asyncio.ensure_future(_inserir_documento(tipo, colecao, doc))
+    try:
+        return await asyncio.wait_for(asyncio.shield(tarefa), JOURNAL_DESVIO_MS / 1000)
+    except (asyncio.TimeoutError, asyncio.CancelledError):
+        tarefa.add_done_callback(_recolher)
+        raise
+
+
+def preparar_documento(resultado: dict, payload: dict, client_cnpj: str) -> tuple:
+    """
+        (tipo, coleção, documento) de um evento válido, no formato de `inserir_lote`.
+    """
+    tipo = payload["TpEvento"]
+    with tracing.span("build_id", evento=tipo):
+        idx = build_id(payload, client_cnpj)
+    periodo = periodo_evento(payload)
+    doc = montar_documento(resultado, payload, idx)
+    doc["_cli"] = client_cnpj
+    doc["_per"] = periodo
+    return tipo, nome_colecao(tipo, client_cnpj, periodo), doc
+
+
 async def save_if_valid(resultado: dict, payload: dict, client_cnpj: str):
     """
     Insere no Mongo apenas se resultado['status']=='valido'.
     Ignora DuplicateKeyError para chaves já existentes.
+    Se o Mongo estiver fora, demorar mais que JOURNAL_DESVIO_MS ou o circuit
+    breaker estiver aberto, grava no journal local (ver journal.py), que reenvia
+    ao banco quando ele voltar.
     """
     if resultado.get("status") != "valido":
         return None
 
-    idx = build_id(payload, client_cnpj)
-    doc = {**payload, **resultado, "_id": idx}
-    col = get_collection(payload["TpEvento"])
+    tipo, colecao, doc = preparar_documento(resultado, payload, client_cnpj)
+    idx = doc["_id"]
+
+    if JOURNAL_HABILITADO and journal.desviando:
+        # banco já conhecido como indisponível: não espera timeout, mantém a ordem do journal
+        with tracing.span("journal.anexar", colecao=colecao):
+            await journal.anexar(tipo, colecao, doc)
+        logger.info(f"[Journal] {tipo} com _id={idx} gravado no journal")
+        return idx
 
     try:
-        result = await col.insert_one(doc)
-        logger.info(f"[Mongo] Inserido {payload['TpEvento']} com _id={idx}")
-        return result.inserted_id
+        with tracing.span("mongo.insert", colecao=colecao):
+            async with breaker_mongo.protegido():
+                if JOURNAL_HABILITADO:
+                    inserted_id = await _inserir_com_desvio(tipo, colecao, doc)
+                else:
+                    inserted_id = await _inserir_documento(tipo, colecao, doc)
+        logger.info(f"[Mongo] Inserido {tipo} com _id={idx}")
+        return inserted_id
 
     except DuplicateKeyError:
         logger.warning(f"[Mongo] Registro {idx} já existe, Ignorando...")
         return None
+
+    except (ConnectionFailure, asyncio.TimeoutError, CircuitoAbertoError) as e:
+        # sem journal, o CircuitoAbertoError sobe e vira 503 na API
+        if not JOURNAL_HABILITADO:
+            raise
+        logger.warning(f"[Mongo] Falha/lentidão ao inserir {idx} ({type(e).__name__}), desviando para o journal")
+        with tracing.span("journal.anexar", colecao=colecao):
+            await journal.anexar(tipo, colecao, doc)
+        return idx
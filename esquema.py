@@ -0,0 +1,146 @@
+"""
+Formatos de documento gravados no MongoDB:
+
+ - versão 1 (legado, sem `_v`): `{**payload, **resultado, "_id": idx}`;
+ - versão 2 (compacto, `_v: 2`):
+     * sem `evento`/`status`/`mensagem` (constantes para todo evento gravado)
+       e sem `TpEvento` (implícito na coleção);
+     * sem número do documento, `nrInscEstab` e CPF/CNPJ da pessoa, que já
+       estão no `_id` — só quando nenhum componente do `_id` contém "-",
+       para que a decomposição seja exata;
+     * valores (`float` nos modelos) como inteiros em centavos, quando não há
+       fração abaixo de centavo;
+     * datas (`date` nos modelos) como datas nativas do BSON.
+
+`compactar` gera a versão 2 e `expandir` devolve, a partir de qualquer
+versão, o formato atual da API (payload + resultado).
+"""
+from datetime import date, datetime
+from functools import lru_cache
+from eventos.modelos import MODELOS
+
+SCHEMA_VERSAO = 2
+
+_CAMPOS_RESULTADO = ("evento", "status", "mensagem")
+_CAMPOS_PARTICAO = ("_cli", "_per")   # chaves de partição/shard gravadas por database.save_if_valid
+
+
+@lru_cache(maxsize=None)
+def _campos_por_tipo(tipo: str) -> tuple:
+    """Retorna (campos de valor, campos de data) do modelo Pydantic do evento."""
+    campos = MODELOS[tipo].model_fields
+    valores = frozenset(nome for nome, f in campos.items() if f.annotation is float)
+    datas = frozenset(nome for nome, f in campos.items() if f.annotation is date)
+    return valores, datas
+
+
+def resultado_valido(tipo: str) -> dict:
+    """Resultado devolvido pela API para um evento válido (o que o v1 gravava junto)."""
+    return {
+        "evento": tipo,
+        "status": "valido",
+        "mensagem": f"Evento {tipo} validado com sucesso!",
+    }
+
+
+def _para_centavos(valor):
+    if isinstance(valor, bool) or not isinstance(valor, (int, float)):
+        return valor
+    centavos = round(valor * 100)
+    if abs(valor * 100 - centavos) > 1e-6:
+        # fração abaixo de centavo: mantém o float para não perder informação
+        return float(valor)
+    return centavos
+
+
+def _para_data(valor):
+    if isinstance(valor, str):
+        try:
+            d = date.fromisoformat(valor)
+        except ValueError:
+            return valor
+        return datetime(d.year, d.month, d.day)
+    return valor
+
+
+def _componentes_id(payload: dict, cfg: dict):
+    """Campos cujo valor compõe o `_id`, na ordem do build_id; None se não houver pessoa."""
+    pessoa = next((fld for fld in cfg["pessoa_fields"] if fld in payload), None)
+    return cfg["id_field"], "nrInscEstab", pessoa
+
+
+def compactar(payload: dict, idx: str, cfg: dict) -> dict:
+    """
+    Converte o payload já validado no documento compacto (v2) com `_id` = idx.
+    `cfg` é a entrada de `EVENT_CONFIG` do tipo do evento.
+    """
+    tipo = payload["TpEvento"]
+    valores, datas = _campos_por_tipo(tipo)
+    campo_num, campo_estab, campo_pessoa = _componentes_id(payload, cfg)
+
+    componentes = [str(payload[campo_num]), str(payload[campo_estab])]
+    if campo_pessoa:
+        componentes.append(str(payload[campo_pessoa]))
+    decomponivel = (
+        isinstance(payload[campo_num], int)
+        and isinstance(payload[campo_estab], str)
+        and (campo_pessoa is None or isinstance(payload[campo_pessoa], str))
+        and not any("-" in c for c in componentes)
+    )
+    omitidos = {"TpEvento", *_CAMPOS_RESULTADO}
+    if decomponivel:
+        omitidos.update({campo_num, campo_estab})
+        if campo_pessoa:
+            omitidos.add(campo_pessoa)
+
+    doc = {"_id": idx, "_v": SCHEMA_VERSAO}
+    if decomponivel and campo_pessoa and campo_pessoa != cfg["pessoa_fields"][0]:
+        doc["_pf"] = cfg["pessoa_fields"].index(campo_pessoa)
+
+    for campo, valor in payload.items():
+        if campo in omitidos:
+            continue
+        if campo in valores:
+            valor = _para_centavos(valor)
+        elif campo in datas:
+            valor = _para_data(valor)
+        doc[campo] = valor
+    return doc
+
+
+def expandir(doc: dict, tipo: str, cfg: dict) -> dict:
+    """
+    Devolve o documento no formato da API (payload + resultado, com `_id`),
+    seja ele v1 (legado) ou v2 (compacto).
+    """
+    versao = doc.get("_v", 1)
+    if versao == 1:
+        return {k: v for k, v in doc.items() if k not in _CAMPOS_PARTICAO}
+    if versao != SCHEMA_VERSAO:
+        raise ValueError(f"Versão de esquema desconhecida: {versao}")
+
+    valores, datas = _campos_por_tipo(tipo)
+    idx = doc["_id"]
+    saida = {"TpEvento": tipo}
+
+    campo_num = cfg["id_field"]
+    if campo_num not in doc:
+        # documento decomponível: reconstrói os campos a partir do _id
+        partes = idx.split("-", 3)
+        saida[campo_num] = int(partes[0])
+        saida["nrInscEstab"] = partes[1]
+        if partes[2]:
+            saida[cfg["pessoa_fields"][doc.get("_pf", 0)]] = partes[2]
+
+    for campo, valor in doc.items():
+        if campo in ("_id", "_v", "_pf") or campo in _CAMPOS_PARTICAO:
+            continue
+        if campo in valores and isinstance(valor, int) and not isinstance(valor, bool):
+            valor = valor / 100
+        elif campo in datas and isinstance(valor, datetime):
+            valor = valor.date().isoformat()
+        saida[campo] = valor
+
+    saida.update(resultado_valido(tipo))
+    saida["_id"] = idx
+    return saida
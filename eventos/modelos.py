@@ -0,0 +1,13 @@
+"""
+Mapeamento TpEvento → modelo Pydantic, usado pela API e pelas rotinas de
+startup para despachar cada payload ao validador correto.
+"""
+from eventos.validador_2010 import Evt2010
+from eventos.validador_4010 import Evt4010
+from eventos.validador_4020 import Evt4020
+
+MODELOS = {
+    "R2010": Evt2010,
+    "R4010": Evt4010,
+    "R4020": Evt4020,
+}
@@ -3,7 +3,9 @@ from pydantic import BaseModel, StrictInt, field_validator, model_validator
 from typing import Literal
 from datetime import date
 from dicionarios import tp_servico
-from utils.validadores_em_comum import validar_cnpj, validar_cno, limpar_numeros
+from utils import tabelas
+from utils.registro_cnpj import verificar_cnpj_registro
+from utils.validadores_em_comum import validar_cnpj, validar_cno, limpar_cnpj, limpar_numeros
 
 logging.basicConfig(
     level=logging.DEBUG,
@@ -37,29 +39,31 @@ class Evt2010(BaseModel):
     @field_validator("cnpjPrestador")
     def validar_cnpj_prestador(cls, v):
         """
-        Valida que 'cnpjPrestador' seja um CNPJ válido com 14 dígitos.
+        Valida que 'cnpjPrestador' seja um CNPJ válido (numérico ou alfanumérico)
+        e, com CNPJ_REGISTRO_PATH configurado, ativo na base da Receita.
         """
         logger.debug(f"[field_validator] Validando cnpjPrestador: {v}")
-        cnpj_digits = limpar_numeros(v)
+        cnpj_digits = limpar_cnpj(v)
         validar_cnpj(cnpj_digits)
+        verificar_cnpj_registro(cnpj_digits)
         return cnpj_digits
 
     @model_validator(mode="after")
     def validar_nrinscestab_e_indobra(cls, model):
         """
         Valida o campo nrInscEstab de acordo com o valor de indObra:
-          - Se indObra == 0, nrInscEstab deve ser um CNPJ (14 dígitos).
+          - Se indObra == 0, nrInscEstab deve ser um CNPJ (14 caracteres, numérico ou alfanumérico).
           - Se indObra == 1 ou 2, nrInscEstab deve ser um CNO (12 dígitos).
         """
         logger.debug(
             f"[model_validator 'after'] Validando nrInscEstab e indObra: "
             f"indObra={model.indObra}, nrInscEstab={model.nrInscEstab}"
         )
-        nr_insc_estab = limpar_numeros(model.nrInscEstab)
-
         if model.indObra == 0:
+            nr_insc_estab = limpar_cnpj(model.nrInscEstab)
             validar_cnpj(nr_insc_estab)
         else:
+            nr_insc_estab = limpar_numeros(model.nrInscEstab)
             validar_cno(nr_insc_estab)
         model.nrInscEstab = nr_insc_estab
         return model
@@ -86,8 +90,8 @@ class Evt2010(BaseModel):
           Verifica se o valor informado está entre os valores definidos
           em tp_servico.TpServicoEnum. Se não estiver, lança ValueError.
         """
-        validos = list(tp_servico.TpServicoEnum.values())
-        if v not in validos:
+        if v not in tabelas.tp_servico_validos():
+            validos = list(tp_servico.TpServicoEnum.values())
             raise ValueError(
                 f"Valor inválido para tpServico: {v}. Deve ser um dos: {validos}"
             )
@@ -128,7 +132,7 @@ class Evt2010(BaseModel):
     def validar_nrinsc(cls, model):
         """
         Valida o campo nrInsc:
-          - Se indObra == 0, nrInsc deve ser um CNPJ (14 dígitos) ou os 8 primeiros dígitos devem bater com nrInscEstab.
+          - Se indObra == 0, nrInsc deve ser um CNPJ (14 caracteres) ou os 8 primeiros caracteres devem bater com nrInscEstab.
         """
         logger.debug(
             f"[model_validator 'after'] Validando nrInsc e indObra: "
@@ -136,9 +140,9 @@ class Evt2010(BaseModel):
         )
 
         if model.indObra == 0:
-            # Se indObra for 0, valida nrInsc como CNPJ (14 dígitos) ou 8 primeiros dígitos
-            nr_insc = limpar_numeros(model.nrInsc)
-            nr_insc_estab = limpar_numeros(model.nrInscEstab)
+            # Se indObra for 0, valida nrInsc como CNPJ (14 caracteres) ou a raiz (8 primeiros)
+            nr_insc = limpar_cnpj(model.nrInsc)
+            nr_insc_estab = limpar_cnpj(model.nrInscEstab)
 
             if len(nr_insc) == 14:
                 # Se for CNPJ completo, valida o CNPJ
@@ -153,7 +157,7 @@ class Evt2010(BaseModel):
                 validar_cnpj(nr_insc_estab)
                 model.nrInsc = nr_insc_estab
             else:
-                raise ValueError("nrInsc deve ser um CNPJ com 14 dígitos ou os 8 primeiros dígitos de um CNPJ.")
+                raise ValueError("nrInsc deve ser um CNPJ com 14 caracteres ou os 8 primeiros caracteres de um CNPJ.")
 
         return model
 
@@ -2,8 +2,8 @@ import logging
 from pydantic import BaseModel, StrictInt, field_validator, model_validator
 from typing import Literal
 from datetime import date
-from dicionarios import nat_rend_pf
-from utils.validadores_em_comum import validar_cnpj, limpar_numeros, validar_cpf
+from utils import tabelas
+from utils.validadores_em_comum import validar_cnpj, limpar_cnpj, limpar_numeros, validar_cpf
 
 logging.basicConfig(
     level=logging.DEBUG,
@@ -37,7 +37,7 @@ class Evt4010(BaseModel):
             f"[model_validator 'after'] Validando nrInscEstab e indObra: "
             f"nrInscEstab={model.nrInscEstab}"
         )
-        nr_insc_estab = limpar_numeros(model.nrInscEstab)
+        nr_insc_estab = limpar_cnpj(model.nrInscEstab)
         validar_cnpj(nr_insc_estab)
         model.nrInscEstab = nr_insc_estab
 
@@ -59,8 +59,7 @@ class Evt4010(BaseModel):
         Valida a natureza do rendimento de pessoa física.
         Garante que v esteja entre os valores definidos em nat_rend_pf.NatRendEnum.
         """
-        validos = list(nat_rend_pf.NatRendEnum.values())
-        if v not in validos:
+        if v not in tabelas.nat_rend_pf_validos():
             raise ValueError(
                 f"Valor inválido para NatRend: {v}."
                 f" Conferir tabela Natureza de Rendimentos Anexo I dos leiautes da EFD-Reinf"
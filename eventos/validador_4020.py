@@ -2,8 +2,9 @@ import logging
 from pydantic import BaseModel, StrictInt, field_validator, model_validator
 from typing import Literal
 from datetime import date
-from dicionarios import nat_rend_pj
-from utils.validadores_em_comum import validar_cnpj, limpar_numeros
+from utils import tabelas
+from utils.registro_cnpj import verificar_cnpj_registro
+from utils.validadores_em_comum import validar_cnpj, limpar_cnpj
 
 logging.basicConfig(
     level=logging.DEBUG,
@@ -33,11 +34,13 @@ class Evt4020(BaseModel):
     @field_validator("cnpjBenef")
     def validar_cnpj_benef(cls, v):
         """
-        Valida que 'cnpjPrestador' seja um CNPJ válido com 14 dígitos.
+        Valida que 'cnpjBenef' seja um CNPJ válido (numérico ou alfanumérico)
+        e, com CNPJ_REGISTRO_PATH configurado, ativo na base da Receita.
         """
         logger.debug(f"[field_validator] Validando cnpjBenef: {v}")
-        cnpj_digits = limpar_numeros(v)
+        cnpj_digits = limpar_cnpj(v)
         validar_cnpj(cnpj_digits)
+        verificar_cnpj_registro(cnpj_digits)
         return cnpj_digits
 
     @model_validator(mode="after")
@@ -49,7 +52,7 @@ class Evt4020(BaseModel):
             f"[model_validator 'after'] Validando nrInscEstab e indObra: "
             f"nrInscEstab={model.nrInscEstab}"
         )
-        nr_insc_estab = limpar_numeros(model.nrInscEstab)
+        nr_insc_estab = limpar_cnpj(model.nrInscEstab)
         validar_cnpj(nr_insc_estab)
         model.nrInscEstab = nr_insc_estab
         return model
@@ -97,8 +100,7 @@ class Evt4020(BaseModel):
          Valida a natureza do rendimento.
          - Garante que o código esteja entre os valores definidos em nat_rend_pj.NatRendEnum.
         """
-        validos = list(nat_rend_pj.NatRendEnum.values())
-        if v not in validos:
+        if v not in tabelas.nat_rend_pj_validos():
             raise ValueError(
                 f"Valor inválido para NatRend: {v}."
                 f" Conferir tabela Natureza de Rendimentos Anexo I dos leiautes da EFD-Reinf"
@@ -0,0 +1,190 @@
+"""
+Exportação em streaming dos eventos gravados de um cliente (NDJSON ou CSV),
+com compressão gzip opcional feita sob demanda.
+
+A leitura usa cursores em lotes (`EXPORT_LOTE`) sobre o índice {_cli, _per}
+e a saída é emitida em blocos de ~`EXPORT_BLOCO_BYTES`, então a memória
+fica constante qualquer que seja o volume exportado. Cada documento passa
+por `esquema.expandir`, logo o formato é o da API para v1 e v2.
+Documentos legados sem `_cli`/`_per` só aparecem depois de `migrar_esquema.py`.
+
+Uso (CLI):
+    python exportacao.py --evento R4010 --cliente 09524519000143 --de 2025-01 --ate 2025-03 \\
+        --formato csv --gzip -o R4010_2025T1.csv.gz
+"""
+from database import EVENT_CONFIG, breaker_mongo, colecoes_evento
+from functools import lru_cache
+from eventos.modelos import MODELOS
+import argparse
+import asyncio
+import csv
+import io
+import json
+import os
+import sys
+import time
+import zlib
+import esquema
+
+EXPORT_LOTE = int(os.getenv("EXPORT_LOTE", 2000))                   # documentos por lote do cursor
+EXPORT_BLOCO_BYTES = int(os.getenv("EXPORT_BLOCO_BYTES", 64 * 1024))  # tamanho aproximado de cada bloco emitido
+
+FORMATOS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+}
+
+
+def periodo_para_int(periodo: str):
+    """'AAAA-MM' → AAAAMM (int); None passa direto."""
+    if periodo is None:
+        return None
+    ano, mes = periodo.split("-")
+    if not (1 <= int(mes) <= 12):
+        raise ValueError(f"Período inválido: {periodo}")
+    return int(ano) * 100 + int(mes)
+
+
+def meses_entre(de: int, ate: int) -> list:
+    """Lista de períodos AAAAMM de `de` até `ate`, inclusive."""
+    meses = []
+    atual = de
+    while atual <= ate:
+        meses.append(atual)
+        ano, mes = divmod(atual, 100)
+        atual = (ano + 1) * 100 + 1 if mes == 12 else atual + 1
+    return meses
+
+
+def colunas_csv(tipo: str) -> list:
+    """Cabeçalho do CSV: `_id` seguido dos campos do modelo, na ordem da declaração."""
+    return ["_id", *MODELOS[tipo].model_fields]
+
+
+def _filtro(client_cnpj: str, de: int = None, ate: int = None) -> dict:
+    filtro = {"_cli": client_cnpj}
+    if de or ate:
+        filtro["_per"] = {}
+        if de:
+            filtro["_per"]["$gte"] = de
+        if ate:
+            filtro["_per"]["$lte"] = ate
+    return filtro
+
+
+@lru_cache(maxsize=None)
+def projecao(tipo: str) -> dict:
+    """
+    Campos lidos do banco: os do modelo, os do resultado (gravados no v1) e os
+    de controle do v2 (`_v`, `_pf`); `_cli`/`_per` e o que mais houver ficam no servidor.
+    """
+    campos = [*MODELOS[tipo].model_fields, *esquema.resultado_valido(tipo), "_v", "_pf"]
+    return {campo: 1 for campo in campos}
+
+
+async def documentos(tipo: str, client_cnpj: str, de: int = None, ate: int = None, lote: int = EXPORT_LOTE):
+    """
+    Gera os documentos do cliente/período já no formato da API. Cada lote do
+    cursor é lido sob o `breaker_mongo`, sem prendê-lo enquanto o consumidor
+    processa os documentos.
+    """
+    cfg = EVENT_CONFIG[tipo]
+    periodos = meses_entre(de, ate) if de and ate else None
+    async with breaker_mongo.protegido():
+        colecoes = await colecoes_evento(tipo, client_cnpj, periodos)
+    for col in colecoes:
+        cursor = col.find(_filtro(client_cnpj, de, ate), projecao(tipo), batch_size=lote)
+        while True:
+            async with breaker_mongo.protegido():
+                docs = await cursor.to_list(lote)
+            if not docs:
+                break
+            for doc in docs:
+                yield esquema.expandir(doc, tipo, cfg)
+
+
+class _Serializador:
+    """Acumula linhas num buffer e devolve blocos (comprimidos ou não) de tamanho limitado."""
+
+    def __init__(self, tipo: str, formato: str, gzip: bool):
+        self.formato = formato
+        self.buffer = io.StringIO()
+        self.compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if gzip else None
+        if formato == "csv":
+            self.colunas = colunas_csv(tipo)
+            self.escritor = csv.DictWriter(self.buffer, self.colunas, extrasaction="ignore", lineterminator="\n")
+            self.escritor.writeheader()
+
+    def escrever(self, doc: dict) -> None:
+        if self.formato == "csv":
+            self.escritor.writerow(doc)
+        else:
+            self.buffer.write(json.dumps(doc, ensure_ascii=False, default=str))
+            self.buffer.write("\n")
+
+    def tamanho(self) -> int:
+        return self.buffer.tell()
+
+    def bloco(self, final: bool = False) -> bytes:
+        dados = self.buffer.getvalue().encode("utf-8")
+        self.buffer.seek(0)
+        self.buffer.truncate()
+        if self.compressor:
+            dados = self.compressor.compress(dados)
+            if final:
+                dados += self.compressor.flush()
+        return dados
+
+
+async def serializar(docs, tipo: str, formato: str = "ndjson", gzip: bool = False):
+    """Converte um iterador assíncrono de documentos em blocos de bytes."""
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato desconhecido: {formato}")
+    saida = _Serializador(tipo, formato, gzip)
+    async for doc in docs:
+        saida.escrever(doc)
+        if saida.tamanho() >= EXPORT_BLOCO_BYTES:
+            bloco = saida.bloco()
+            if bloco:
+                yield bloco
+    yield saida.bloco(final=True)
+
+
+def exportar_eventos(tipo: str, client_cnpj: str, de: int = None, ate: int = None,
+                     formato: str = "ndjson", gzip: bool = False):
+    """Gerador assíncrono de bytes com a exportação completa (usado pela API e pela CLI)."""
+    return serializar(documentos(tipo, client_cnpj, de, ate), tipo, formato, gzip)
+
+
+async def _exportar_para_arquivo(args):
+    de, ate = periodo_para_int(args.de), periodo_para_int(args.ate)
+    destino = open(args.output, "wb") if args.output else sys.stdout.buffer
+    bytes_escritos = 0
+    inicio = time.perf_counter()
+    try:
+        async for bloco in exportar_eventos(args.evento, args.cliente, de, ate, args.formato, args.gzip):
+            destino.write(bloco)
+            bytes_escritos += len(bloco)
+    finally:
+        if args.output:
+            destino.close()
+    decorrido = time.perf_counter() - inicio
+    print(f"{bytes_escritos / 1e6:.1f} MB em {decorrido:.1f}s "
+          f"({bytes_escritos / 1e6 / decorrido:.1f} MB/s)", file=sys.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Exporta eventos gravados de um cliente em NDJSON/CSV")
+    parser.add_argument('--evento', required=True, choices=sorted(EVENT_CONFIG))
+    parser.add_argument('--cliente', required=True, help="CNPJ do cliente (claim 'cnpj' do JWT)")
+    parser.add_argument('--de', help="Período inicial AAAA-MM")
+    parser.add_argument('--ate', help="Período final AAAA-MM")
+    parser.add_argument('--formato', choices=sorted(FORMATOS), default="ndjson")
+    parser.add_argument('--gzip', action='store_true', help="Comprime a saída com gzip")
+    parser.add_argument('-o', '--output', help="Arquivo de saída (padrão: stdout)")
+    args = parser.parse_args()
+    asyncio.run(_exportar_para_arquivo(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,349 @@
+"""
+Gerador de eventos EFD-Reinf sintéticos para benchmarks e testes de carga.
+
+O `load_test.generate_payload` repete sempre os mesmos templates e números de
+documento, então a partir da segunda execução quase tudo vira 409 (duplicado)
+e o caminho de inserção deixa de ser medido. Aqui cada evento é único e
+coerente com as regras dos modelos de `eventos/`:
+
+ - CNPJs/CPFs com dígitos verificadores válidos (CNPJ alfanumérico opcional,
+   fração `alfanumerico`), CNO com 12 dígitos, códigos de `dicionarios/`
+   (via `utils.tabelas`), datas dentro de um intervalo de períodos;
+ - valores com distribuição log-normal e as relações exigidas pelos
+   validadores (base ≤ bruto, retenção de 11%/3,5% no R2010, imposto > 0 e
+   ≤ base quando há base, ...);
+ - `NumDoc`/`numDocto` sequenciais a partir de um início sorteado pela
+   semente: execuções com sementes diferentes não colidem no `_id`;
+ - injeção de erros: com probabilidade `taxa_invalidos`, o evento recebe
+   exatamente uma violação de uma das `REGRAS_INVALIDAS` (devolvida junto
+   com o payload, para conferir o 422 esperado);
+ - mesma semente → mesma sequência de eventos.
+
+Para ficar barato por evento (um processo precisa saturar a API), os
+documentos são sorteados de pools pré-calculados (estabelecimentos do
+cliente, prestadores/beneficiários) e os dias do intervalo são
+pré-formatados; por evento só há sorteios e a montagem do dict.
+
+Com `CLIENTES_HABILITADO=1` na API, cadastre antes os estabelecimentos
+(`--estabs-csv` gera o arquivo para `clientes.py importar`); com
+`CNPJ_REGISTRO_PATH`, os CNPJs aleatórios não estarão na base da Receita.
+
+Uso:
+    python gerador_eventos.py --quantidade 1000000 --bench
+    python gerador_eventos.py --quantidade 10000 --taxa-invalidos 0.05 --semente 7 --verificar
+    python gerador_eventos.py --quantidade 100000 -o eventos.ndjson --estabs-csv estabs.csv
+"""
+from datetime import date, timedelta
+from utils import tabelas
+from utils.validadores_em_comum import calcular_dv_cnpj, calcular_dv_cpf
+import argparse
+import json
+import logging
+import random
+import sys
+import time
+
+TIPOS = ("R2010", "R4010", "R4020")
+
+_ALFANUMERICOS = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+_CODIGO_INEXISTENTE = 99999
+
+
+# ─── Documentos ──────────────────────────────
+def cnpj_aleatorio(rnd: random.Random, alfanumerico: bool = False, raiz: str = None) -> str:
+    """CNPJ com DV válido; `raiz` (8 caracteres) fixa a empresa, a ordem é sorteada."""
+    if raiz is None:
+        raiz = "".join(rnd.choices(_ALFANUMERICOS, k=8)) if alfanumerico else f"{rnd.randrange(1, 10 ** 8):08d}"
+    base = raiz + f"{rnd.randrange(1, 10 ** 4):04d}"
+    return base + calcular_dv_cnpj(base)
+
+
+def cpf_aleatorio(rnd: random.Random) -> str:
+    while True:
+        base = f"{rnd.randrange(10 ** 9):09d}"
+        if base != base[0] * 9:
+            return base + calcular_dv_cpf(base)
+
+
+def cno_aleatorio(rnd: random.Random) -> str:
+    return f"{rnd.randrange(10 ** 11, 10 ** 12):012d}"
+
+
+def _trocar_dv(documento: str) -> str:
+    return documento[:-1] + str((int(documento[-1]) + 1) % 10)
+
+
+def _dias(de: str, ate: str) -> list:
+    """'AAAA-MM-DD' de todos os dias entre os períodos AAAA-MM `de` e `ate` (inclusive)."""
+    ano, mes = map(int, ate.split("-"))
+    fim = date(ano + mes // 12, mes % 12 + 1, 1)
+    dia = date(*map(int, de.split("-")), 1)
+    dias = []
+    while dia < fim:
+        dias.append(dia.isoformat())
+        dia += timedelta(days=1)
+    return dias
+
+
+# ─── Regras violadas na injeção ──────────────
+# nome → {evento: função(payload, rnd) que quebra só essa regra}
+def _base_maior(campo_base: str, campo_bruto: str):
+    def mutar(p, rnd):
+        p[campo_base] = round(p[campo_bruto] * rnd.uniform(1.01, 2), 2)
+    return mutar
+
+
+def _r2010_base_maior(p, rnd):
+    # retenção recalculada sobre a nova base: só a regra base ≤ bruto falha
+    p["vlrBaseRet"] = round(p["vlrBruto"] * rnd.uniform(1.01, 2), 2)
+    p["vlrRetencao"] = round(p["vlrBaseRet"] * (0.11 if p["indCPRB"] == 0 else 0.035), 2)
+
+
+def _r2010_retencao(p, rnd):
+    p["vlrRetencao"] = round(p["vlrRetencao"] * rnd.uniform(1.2, 1.8) + 0.05, 2)
+
+
+def _r2010_raiz(p, rnd):
+    if p["indObra"] != 0:
+        # obra (CNO): passa a estabelecimento CNPJ da própria empresa
+        p["indObra"] = 0
+        p["nrInscEstab"] = cnpj_aleatorio(rnd, raiz=p["nrInsc"])
+    raiz = p["nrInsc"]
+    p["nrInsc"] = raiz[:7] + ("1" if raiz[7] != "1" else "2")
+
+
+def _imposto_maior(campo_imposto: str, campo_base: str, campo_bruto: str):
+    def mutar(p, rnd):
+        if p[campo_base] <= 0:
+            p[campo_base] = round(p[campo_bruto] * 0.5, 2)
+        p[campo_imposto] = round(p[campo_base] * rnd.uniform(1.01, 1.5) + 0.01, 2)
+    return mutar
+
+
+def _dv(campo: str):
+    def mutar(p, rnd):
+        p[campo] = _trocar_dv(p[campo])
+    return mutar
+
+
+def _codigo(campo: str):
+    def mutar(p, rnd):
+        p[campo] = _CODIGO_INEXISTENTE
+    return mutar
+
+
+REGRAS_INVALIDAS = {
+    "cnpj_dv": {"R2010": _dv("cnpjPrestador"), "R4010": _dv("nrInscEstab"), "R4020": _dv("cnpjBenef")},
+    "cpf_dv": {"R4010": _dv("cpfBenef")},
+    "codigo_tabela": {"R2010": _codigo("tpServico"), "R4010": _codigo("natRend"), "R4020": _codigo("natRend")},
+    "base_maior_que_bruto": {"R2010": _r2010_base_maior, "R4010": _base_maior("vlrRendTrib", "vlrRendBruto"),
+                             "R4020": _base_maior("vlrBaseIR", "vlrBruto")},
+    "imposto_inconsistente": {"R2010": _r2010_retencao, "R4010": _imposto_maior("vlrIR", "vlrRendTrib", "vlrRendBruto"),
+                              "R4020": _imposto_maior("vlrIR", "vlrBaseIR", "vlrBruto")},
+    "raiz_nrinsc": {"R2010": _r2010_raiz},
+}
+
+
+class GeradorEventos:
+    """
+    Sequência reprodutível de eventos únicos. `evento()` devolve
+    (payload, regra violada ou None).
+    """
+
+    def __init__(
+        self,
+        semente: int = None,
+        taxa_invalidos: float = 0.0,
+        regras: list = None,
+        tipos: tuple = TIPOS,
+        estabelecimentos: int = 50,
+        contrapartes: int = 5000,
+        periodo_de: str = "2025-01",
+        periodo_ate: str = "2025-12",
+        alfanumerico: float = 0.0,
+        inicio_doc: int = None,
+    ):
+        self.semente = semente if semente is not None else random.SystemRandom().randrange(2 ** 32)
+        self._rnd = rnd = random.Random(self.semente)
+        self.taxa_invalidos = taxa_invalidos
+        self.tipos = tuple(tipos)
+
+        regras = list(regras) if regras else list(REGRAS_INVALIDAS)
+        desconhecidas = set(regras) - set(REGRAS_INVALIDAS)
+        if desconhecidas:
+            raise ValueError(f"Regras desconhecidas: {sorted(desconhecidas)}")
+        self._regras_por_tipo = {
+            tipo: [(nome, REGRAS_INVALIDAS[nome][tipo]) for nome in regras if tipo in REGRAS_INVALIDAS[nome]]
+            for tipo in self.tipos
+        }
+
+        # pools pré-calculados: por evento só há sorteio
+        self.estabelecimentos = [cnpj_aleatorio(rnd, rnd.random() < alfanumerico) for _ in range(estabelecimentos)]
+        self._cnpjs = [cnpj_aleatorio(rnd, rnd.random() < alfanumerico) for _ in range(contrapartes)]
+        self._cpfs = [cpf_aleatorio(rnd) for _ in range(contrapartes)]
+        self._cnos = [cno_aleatorio(rnd) for _ in range(max(1, estabelecimentos // 5))]
+        self._dias = _dias(periodo_de, periodo_ate)
+        self._tp_servico = sorted(tabelas.tp_servico_validos())
+        self._nat_pf = sorted(tabelas.nat_rend_pf_validos())
+        self._nat_pj = sorted(tabelas.nat_rend_pj_validos())
+        self._proximo_doc = inicio_doc if inicio_doc is not None else rnd.randrange(10 ** 6, 10 ** 12)
+        self._montar = {"R2010": self._r2010, "R4010": self._r4010, "R4020": self._r4020}
+
+    # ─── valores ─────────────────────────────
+    def _bruto(self) -> float:
+        return round(max(10.0, self._rnd.lognormvariate(8, 1.2)), 2)
+
+    def _base_e_imposto(self, bruto: float, aliquota: float, zerada: float = 0.1) -> tuple:
+        """(base, imposto) com imposto ≤ base e os dois zerados juntos em `zerada` dos casos."""
+        rnd = self._rnd
+        if rnd.random() < zerada:
+            return 0, 0
+        base = round(bruto * rnd.uniform(0.2, 1.0), 2)
+        return base, min(base, max(0.01, round(base * aliquota, 2)))
+
+    def _numero(self) -> int:
+        self._proximo_doc += 1
+        return self._proximo_doc
+
+    # ─── eventos ─────────────────────────────
+    def _r2010(self) -> dict:
+        rnd = self._rnd
+        estab = rnd.choice(self.estabelecimentos)
+        ind_obra = 0 if rnd.random() < 0.9 else rnd.choice((1, 2))
+        ind_cprb = 0 if rnd.random() < 0.8 else 1
+        bruto = self._bruto()
+        base = round(bruto * rnd.uniform(0.3, 1.0), 2)
+        return {
+            "TpEvento": "R2010",
+            "nrInsc": estab[:8],
+            "indObra": ind_obra,
+            "nrInscEstab": estab if ind_obra == 0 else rnd.choice(self._cnos),
+            "cnpjPrestador": rnd.choice(self._cnpjs),
+            "indCPRB": ind_cprb,
+            "numDocto": self._numero(),
+            "serie": rnd.randrange(1, 10),
+            "dtEmissaoNF": rnd.choice(self._dias),
+            "vlrBruto": bruto,
+            "tpServico": rnd.choice(self._tp_servico),
+            "vlrBaseRet": base,
+            "vlrRetencao": round(base * (0.11 if ind_cprb == 0 else 0.035), 2),
+        }
+
+    def _r4010(self) -> dict:
+        rnd = self._rnd
+        bruto = self._bruto()
+        trib, ir = self._base_e_imposto(bruto, rnd.uniform(0.075, 0.275))
+        return {
+            "TpEvento": "R4010",
+            "nrInscEstab": rnd.choice(self.estabelecimentos),
+            "cpfBenef": rnd.choice(self._cpfs),
+            "NumDoc": self._numero(),
+            "natRend": rnd.choice(self._nat_pf),
+            "dtFG": rnd.choice(self._dias),
+            "vlrRendBruto": bruto,
+            "vlrRendTrib": trib,
+            "vlrIR": ir,
+        }
+
+    def _r4020(self) -> dict:
+        rnd = self._rnd
+        bruto = self._bruto()
+        base_ir, ir = self._base_e_imposto(bruto, 0.015)
+        base_agreg, agreg = self._base_e_imposto(bruto, 0.0465, zerada=0.3)
+        return {
+            "TpEvento": "R4020",
+            "nrInscEstab": rnd.choice(self.estabelecimentos),
+            "cnpjBenef": rnd.choice(self._cnpjs),
+            "NumDoc": self._numero(),
+            "natRend": rnd.choice(self._nat_pj),
+            "dtFG": rnd.choice(self._dias),
+            "vlrBruto": bruto,
+            "vlrBaseIR": base_ir,
+            "vlrIR": ir,
+            "vlrBaseAgreg": base_agreg,
+            "vlrAgreg": agreg,
+        }
+
+    def evento(self, tipo: str = None) -> tuple:
+        """(payload, regra violada ou None) do próximo evento (`tipo` sorteado se None)."""
+        tipo = tipo or self._rnd.choice(self.tipos)
+        payload = self._montar[tipo]()
+        regra = None
+        if self.taxa_invalidos and self._rnd.random() < self.taxa_invalidos:
+            candidatas = self._regras_por_tipo[tipo]
+            if candidatas:
+                regra, mutar = self._rnd.choice(candidatas)
+                mutar(payload, self._rnd)
+        return payload, regra
+
+    def gerar(self, quantidade: int, tipo: str = None):
+        for _ in range(quantidade):
+            yield self.evento(tipo)
+
+
+# ─── CLI ─────────────────────────────────────
+def _verificar(gerador: GeradorEventos, quantidade: int) -> int:
+    """Valida cada evento com os modelos; retorna quantos divergiram do esperado."""
+    from pydantic import ValidationError
+    from eventos.modelos import MODELOS
+
+    divergentes = 0
+    for payload, regra in gerador.gerar(quantidade):
+        try:
+            MODELOS[payload["TpEvento"]](**payload)
+            erro = None
+        except ValidationError as e:
+            erro = e.errors()[0]["msg"]
+        if (erro is None) != (regra is None):
+            divergentes += 1
+            if divergentes <= 10:
+                print(f"divergente: regra={regra} erro={erro} payload={payload}", file=sys.stderr)
+    return divergentes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gerador de eventos EFD-Reinf sintéticos")
+    parser.add_argument("--quantidade", type=int, default=100_000)
+    parser.add_argument("--semente", type=int, help="Padrão: aleatória (impressa para reproduzir)")
+    parser.add_argument("--taxa-invalidos", type=float, default=0.0, help="Fração de eventos com uma regra violada")
+    parser.add_argument("--regras", nargs="+", choices=sorted(REGRAS_INVALIDAS), help="Regras usadas na injeção")
+    parser.add_argument("--tipos", nargs="+", choices=TIPOS, default=list(TIPOS))
+    parser.add_argument("--alfanumerico", type=float, default=0.0, help="Fração de CNPJs alfanuméricos")
+    parser.add_argument("--de", default="2025-01", help="Primeiro período AAAA-MM das datas")
+    parser.add_argument("--ate", default="2025-12", help="Último período AAAA-MM das datas")
+    parser.add_argument("-o", "--output", help="Grava os eventos em NDJSON")
+    parser.add_argument("--estabs-csv", help="Grava 'estab;cliente' para `clientes.py importar`")
+    parser.add_argument("--cliente", default="09524519000143", help="Cliente do --estabs-csv")
+    parser.add_argument("--bench", action="store_true", help="Só mede a taxa de geração")
+    parser.add_argument("--verificar", action="store_true", help="Valida cada evento com os modelos")
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)   # os validadores ligam DEBUG no import
+
+    gerador = GeradorEventos(args.semente, args.taxa_invalidos, args.regras, args.tipos,
+                             periodo_de=args.de, periodo_ate=args.ate, alfanumerico=args.alfanumerico)
+    print(f"semente={gerador.semente}", file=sys.stderr)
+
+    if args.estabs_csv:
+        with open(args.estabs_csv, "w", encoding="utf-8") as f:
+            f.writelines(f"{estab};{args.cliente}\n" for estab in gerador.estabelecimentos)
+
+    if args.verificar:
+        divergentes = _verificar(gerador, args.quantidade)
+        print(f"{args.quantidade} eventos validados, {divergentes} divergentes do esperado")
+        sys.exit(1 if divergentes else 0)
+
+    inicio = time.perf_counter()
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            for payload, _ in gerador.gerar(args.quantidade):
+                f.write(json.dumps(payload, ensure_ascii=False) + "\n")
+    else:
+        for _ in gerador.gerar(args.quantidade):
+            pass
+    decorrido = time.perf_counter() - inicio
+    print(f"{args.quantidade} eventos em {decorrido:.2f}s ({args.quantidade / decorrido:,.0f} eventos/s, "
+          f"{decorrido / args.quantidade * 1e6:.1f} µs cada)")
+
+
+if __name__ == "__main__":
+    main()
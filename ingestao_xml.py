@@ -0,0 +1,305 @@
+"""
+Ingestão em streaming de arquivos XML da EFD-Reinf (lotes devolvidos, exportações
+de outros sistemas ou os gerados por `xml_reinf.py`) para revalidação.
+
+ - `iterparse` com eventos start/end: só a subárvore do evento em andamento
+   fica em memória; ao terminar cada `evtServTom`/`evtRetPF`/`evtRetPJ` (e
+   qualquer elemento fora de um evento) ele é limpo e desligado do pai, então
+   o pico de memória não depende do tamanho do arquivo.
+ - Cada evento vira um ou mais payloads no formato do `/validar`: um por
+   `nfs`/`infoTpServ` no R-2010 e um por `infoPgto` no R-4010/R-4020.
+ - Os payloads passam pelo mesmo modelo (`MODELOS`) e por `save_if_valid`.
+ - Com `reter`/`--reter`, os eventos válidos também ficam em memória em
+   `registro_compacto.BlocoColunar` (um por tipo), para conferências depois da
+   ingestão sem guardar um modelo Pydantic por evento.
+
+Sem `NumDoc` no leiaute do R-4010/R-4020, o número vem de `observ` ("NumDoc <n>",
+como grava `xml_reinf.py`) ou, na falta dele, de um hash de 63 bits do Id do evento
+com a posição do pagamento (um `_id` por pagamento, dentro do int64 do BSON).
+
+Uso (CLI):
+    python ingestao_xml.py lotes/*.xml --cliente 09524519000143
+    python ingestao_xml.py retorno.xml --cliente 09524519000143 --dry-run --memoria
+"""
+from xml.etree.ElementTree import iterparse
+from pydantic import ValidationError
+from collections import Counter
+from functools import lru_cache
+from database import save_if_valid
+from eventos.modelos import MODELOS
+from registro_compacto import BlocoColunar
+from xml_reinf import ELEMENTOS, _CAMPOS_VALOR
+import argparse
+import asyncio
+import hashlib
+import logging
+import os
+import sys
+import time
+
+logger = logging.getLogger(__name__)
+
+INGESTAO_CONCORRENCIA = int(os.getenv("INGESTAO_CONCORRENCIA", 32))   # gravações simultâneas no Mongo
+
+_TIPO_POR_ELEMENTO = {elemento: tipo for tipo, elemento in ELEMENTOS.items()}
+
+
+@lru_cache(maxsize=None)
+def _local(tag: str) -> str:
+    """Nome do elemento sem o namespace ('{ns}evtRetPF' → 'evtRetPF'); poucas tags distintas, então fica em cache."""
+    return tag.rsplit("}", 1)[-1]
+
+
+def _filhos(elem) -> dict:
+    """Texto dos filhos diretos, por nome local."""
+    return {_local(f.tag): (f.text or "").strip() for f in elem}
+
+
+def _achar(elem, nome: str):
+    for e in elem.iter():
+        if _local(e.tag) == nome:
+            return e
+    return None
+
+
+def _achar_todos(elem, nome: str) -> list:
+    return [e for e in elem.iter() if _local(e.tag) == nome]
+
+
+def _inteiro(valor: str):
+    """Converte para int quando for só dígitos; senão devolve o texto para o modelo rejeitar."""
+    return int(valor) if valor and valor.isdigit() else valor
+
+
+_INT64_MAX = 2 ** 63 - 1      # o BSON só grava inteiros de até 8 bytes
+
+
+def _numero_documento(observ: str, id_evento: str, indice: int):
+    """
+    NumDoc do `observ` ("NumDoc <n>", como grava o xml_reinf.py); na falta dele,
+    um número estável derivado do Id do evento e da posição do pagamento, que
+    cabe em int64 e difere entre os pagamentos do mesmo evento.
+    """
+    if observ and observ.startswith("NumDoc "):
+        numero = _inteiro(observ[len("NumDoc "):])
+        # fora do int64 segue como texto e o modelo rejeita (NumDoc é StrictInt)
+        return str(numero) if isinstance(numero, int) and numero > _INT64_MAX else numero
+    if not id_evento:
+        return None
+    resumo = hashlib.blake2b(f"{id_evento}|{indice}".encode(), digest_size=8).digest()
+    return int.from_bytes(resumo, "big") & _INT64_MAX
+
+
+def _valores(tipo: str, campos: dict) -> dict:
+    """Campos monetários presentes, de '1234,56' para float."""
+    valores = {}
+    for campo in _CAMPOS_VALOR[tipo]:
+        texto = campos.get(campo)
+        if texto:
+            try:
+                valores[campo] = float(texto.replace(",", "."))
+            except ValueError:
+                valores[campo] = texto
+    return valores
+
+
+def _payloads_2010(evt, id_evento: str):
+    contri = _filhos(_achar(evt, "ideContri"))
+    estab = _achar(evt, "ideEstabObra")
+    campos_estab = _filhos(estab)
+    for prest in _achar_todos(estab, "idePrestServ"):
+        campos_prest = _filhos(prest)
+        for nfs in _achar_todos(prest, "nfs"):
+            campos_nfs = _filhos(nfs)
+            for serv in _achar_todos(nfs, "infoTpServ"):
+                campos = {**campos_nfs, **_filhos(serv)}
+                payload = {
+                    "TpEvento": "R2010",
+                    "nrInsc": contri.get("nrInsc"),
+                    "indObra": _inteiro(campos_estab.get("indObra")),
+                    "nrInscEstab": campos_estab.get("nrInscEstab"),
+                    "cnpjPrestador": campos_prest.get("cnpjPrestador"),
+                    "indCPRB": _inteiro(campos_prest.get("indCPRB")),
+                    "numDocto": _inteiro(campos.get("numDocto")),
+                    "serie": _inteiro(campos.get("serie")),
+                    "dtEmissaoNF": campos.get("dtEmissaoNF"),
+                    "tpServico": _inteiro(campos.get("tpServico")),
+                }
+                payload.update(_valores("R2010", campos))
+                yield payload
+
+
+def _payloads_40xx(tipo: str, evt, id_evento: str):
+    campo_pessoa = "cpfBenef" if tipo == "R4010" else "cnpjBenef"
+    estab = _achar(evt, "ideEstab")
+    nr_insc_estab = _filhos(estab).get("nrInscEstab")
+    indice = 0      # posição do infoPgto no evento, para o NumDoc derivado do Id
+    for benef in _achar_todos(estab, "ideBenef"):
+        pessoa = _filhos(benef).get(campo_pessoa)
+        for pgto in _achar_todos(benef, "idePgto"):
+            nat_rend = _inteiro(_filhos(pgto).get("natRend"))
+            for info in _achar_todos(pgto, "infoPgto"):
+                campos = _filhos(info)
+                retencoes = _achar(info, "retencoes")
+                if retencoes is not None:
+                    campos.update(_filhos(retencoes))
+                payload = {
+                    "TpEvento": tipo,
+                    "nrInscEstab": nr_insc_estab,
+                    campo_pessoa: pessoa,
+                    "NumDoc": _numero_documento(campos.get("observ"), id_evento, indice),
+                    "natRend": nat_rend,
+                    "dtFG": campos.get("dtFG"),
+                }
+                payload.update(_valores(tipo, campos))
+                indice += 1
+                yield payload
+
+
+def payloads_do_evento(tipo: str, evt) -> list:
+    """Payloads (formato do `/validar`) de um elemento de evento já completo."""
+    id_evento = evt.get("id") or evt.get("Id")
+    if tipo == "R2010":
+        return list(_payloads_2010(evt, id_evento))
+    return list(_payloads_40xx(tipo, evt, id_evento))
+
+
+def ler_eventos(fonte):
+    """
+    Gera (tipo, payload) de um arquivo XML (caminho ou arquivo binário) sem
+    carregar o documento inteiro.
+    """
+    pilha = []
+    empilhar, desempilhar = pilha.append, pilha.pop
+    em_evento = 0
+    for acao, elem in iterparse(fonte, events=("start", "end")):
+        if acao == "start":
+            empilhar(elem)
+            if _local(elem.tag) in _TIPO_POR_ELEMENTO:
+                em_evento += 1
+            continue
+
+        desempilhar()
+        if em_evento:
+            tipo = _TIPO_POR_ELEMENTO.get(_local(elem.tag))
+            if not tipo:
+                continue        # parte de um evento ainda aberto
+            em_evento -= 1
+            for payload in payloads_do_evento(tipo, elem):
+                yield tipo, payload
+            if em_evento:
+                continue
+        # fora de um evento nada precisa ficar na árvore
+        elem.clear()
+        if pilha:
+            pilha[-1].remove(elem)
+
+
+def _mensagens(e: ValidationError) -> list:
+    return [
+        f"Campo: {'geral' if not err['loc'] else ' -> '.join(str(l) for l in err['loc'])} | Erro: {err['msg']}"
+        for err in e.errors()
+    ]
+
+
+async def ingerir(fontes, client_cnpj: str, gravar: bool = True, concorrencia: int = INGESTAO_CONCORRENCIA,
+                  reter: bool = False) -> dict:
+    """
+    Valida e grava os eventos dos arquivos. Retorna o resumo
+    {eventos, validos, invalidos, gravados, duplicados, falhas, erros: Counter, duracao_s}
+    (`falhas`: válidos que não chegaram ao banco) e, com `reter`,
+    `registros`: {tipo: BlocoColunar} com os eventos válidos.
+    """
+    resumo = {"eventos": 0, "validos": 0, "invalidos": 0, "gravados": 0, "duplicados": 0, "falhas": 0,
+              "erros": Counter()}
+    if reter:
+        resumo["registros"] = {}
+    semaforo = asyncio.Semaphore(concorrencia)
+    tarefas = set()
+
+    async def _gravar(resposta, payload):
+        # a falha fica no resumo aqui mesmo: as tarefas saem do conjunto ao terminar
+        # e ninguém mais recolheria a exceção
+        try:
+            async with semaforo:
+                inserido = await save_if_valid(resposta, payload, client_cnpj)
+        except Exception as e:
+            resumo["falhas"] += 1
+            resumo["erros"][f"{payload['TpEvento']} Falha ao gravar: {type(e).__name__}: {e}"] += 1
+            logger.warning(f"[ingestao] Falha ao gravar {payload['TpEvento']}: {e!r}")
+            return
+        resumo["gravados" if inserido is not None else "duplicados"] += 1
+
+    inicio = time.perf_counter()
+    try:
+        for fonte in fontes:
+            for tipo, payload in ler_eventos(fonte):
+                resumo["eventos"] += 1
+                try:
+                    modelo = MODELOS[tipo](**payload)
+                except ValidationError as e:
+                    resumo["invalidos"] += 1
+                    for mensagem in _mensagens(e):
+                        resumo["erros"][f"{tipo} {mensagem}"] += 1
+                    continue
+                resumo["validos"] += 1
+                if reter:
+                    bloco = resumo["registros"].get(tipo)
+                    if bloco is None:
+                        bloco = resumo["registros"][tipo] = BlocoColunar(tipo)
+                    bloco.anexar(modelo)
+                if not gravar:
+                    continue
+
+                resposta = {"evento": tipo, "status": "valido", "mensagem": f"Evento {tipo} validado com sucesso!"}
+                tarefa = asyncio.create_task(_gravar(resposta, payload))
+                tarefas.add(tarefa)
+                tarefa.add_done_callback(tarefas.discard)
+                if len(tarefas) >= concorrencia:
+                    await asyncio.wait(tarefas, return_when=asyncio.FIRST_COMPLETED)
+            logger.info(f"[ingestao] {fonte} processado ({resumo['eventos']} eventos até aqui)")
+    finally:
+        # também numa exceção no meio da leitura: nenhuma gravação fica em voo sem dono
+        if tarefas:
+            await asyncio.gather(*tarefas)
+
+    resumo["duracao_s"] = time.perf_counter() - inicio
+    return resumo
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Revalida (e grava) eventos de arquivos XML da EFD-Reinf")
+    parser.add_argument('arquivos', nargs='+', help="Arquivos XML (eventos avulsos ou lotes)")
+    parser.add_argument('--cliente', required=True, help="CNPJ do cliente dono dos eventos")
+    parser.add_argument('--dry-run', action='store_true', help="Só valida, sem gravar no Mongo")
+    parser.add_argument('--memoria', action='store_true', help="Mede o pico de memória com tracemalloc")
+    parser.add_argument('--reter', action='store_true',
+                        help="Mantém os eventos válidos em memória (registros compactos) e mostra o espaço ocupado")
+    parser.add_argument('--top-erros', type=int, default=10, help="Quantas mensagens de erro mais frequentes exibir")
+    parser.add_argument('--log-level', default="WARNING", help="Nível de log durante a ingestão")
+    args = parser.parse_args()
+    logging.getLogger().setLevel(args.log_level.upper())
+
+    if args.memoria:
+        import tracemalloc
+        tracemalloc.start()
+
+    resumo = asyncio.run(ingerir(args.arquivos, args.cliente, gravar=not args.dry_run, reter=args.reter))
+
+    taxa = resumo["eventos"] / resumo["duracao_s"] if resumo["duracao_s"] else 0
+    print(f"{resumo['eventos']} eventos em {resumo['duracao_s']:.2f}s ({taxa:.0f} eventos/s): "
+          f"{resumo['validos']} válidos, {resumo['invalidos']} inválidos, "
+          f"{resumo['gravados']} gravados, {resumo['duplicados']} duplicados, "
+          f"{resumo['falhas']} falhas de gravação", file=sys.stderr)
+    for mensagem, qtd in resumo["erros"].most_common(args.top_erros):
+        print(f"  {qtd:>7}  {mensagem}", file=sys.stderr)
+    for tipo, bloco in resumo.get("registros", {}).items():
+        print(f"Retidos {len(bloco)} eventos {tipo} em {bloco.nbytes() / 1e6:.1f} MB "
+              f"({bloco.nbytes() / max(len(bloco), 1):.0f} bytes/evento)", file=sys.stderr)
+    if args.memoria:
+        _, pico = tracemalloc.get_traced_memory()
+        print(f"Pico de memória: {pico / 1e6:.1f} MB", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,558 @@
+"""
+Jobs assíncronos de validação em lote (`POST /jobs`).
+
+O upload só grava os eventos em blocos de `JOBS_BLOCO` na coleção
+`jobs_blocos` e responde 202 com o id do job; validação e gravação ficam com
+os workers de fundo (`JOBS_WORKERS` por processo da API, ou processos
+dedicados com `python jobs.py worker`):
+
+ - cada bloco é alugado com `find_one_and_update` por `JOBS_LEASE_S`; um bloco
+   com o aluguel vencido (worker reiniciado ou morto no meio) volta a ser
+   elegível, então jobs inacabados continuam sozinhos depois de um restart;
+ - escalonamento justo: os workers alternam (round-robin) entre os clientes
+   com blocos elegíveis, um bloco por vez, então o job de 1 milhão de eventos
+   de um cliente não segura o job de 100 de outro;
+ - cada bloco é validado com os `MODELOS`, gravado com `inserir_lote` e guarda
+   o resultado de cada item, as contagens e os erros por (campo, tipo). O
+   progresso do job é a soma dos blocos concluídos, então um bloco refeito
+   depois de um restart não conta duas vezes;
+ - antes de gravar, cada tentativa anota no bloco (`planejados`) os `_id` que
+   ainda não existiam no banco e que ela vai inserir. Numa retomada, um
+   duplicado anotado por uma tentativa anterior foi gravado pelo próprio
+   bloco ("gravado"); os demais já existiam antes do job ("duplicado").
+
+Consulta (só o cliente dono do job): `GET /jobs/{id}` (progresso e resumo dos
+erros), `GET /jobs/{id}/progresso` (Server-Sent Events até o fim) e
+`GET /jobs/{id}/resultados` (NDJSON em streaming, um resultado por item).
+Jobs concluídos e seus blocos expiram após `JOBS_RETENCAO_H` (índice TTL).
+
+Uso (CLI):
+    python jobs.py worker --workers 4
+    python jobs.py status 3f2a...
+    python jobs.py listar --cliente 09524519000143
+"""
+from collections import Counter, deque
+from datetime import datetime, timedelta, timezone
+from pydantic import ValidationError
+from pymongo import ReturnDocument
+from database import db, breaker_mongo, ids_existentes, inserir_lote, preparar_documento
+from eventos.modelos import MODELOS
+from clientes import registro, CLIENTES_HABILITADO, EstabelecimentoNaoAutorizado
+from agregador_erros import agregador, campo_do_erro
+import argparse
+import asyncio
+import json
+import logging
+import os
+import socket
+import time
+import uuid
+import metricas
+
+logger = logging.getLogger(__name__)
+
+# ─── Configuração ────────────────────────────
+JOBS_WORKERS = int(os.getenv("JOBS_WORKERS", 2))                 # workers de fundo por processo da API (0: só recebe jobs)
+JOBS_BLOCO = int(os.getenv("JOBS_BLOCO", 500))                   # eventos por bloco (unidade de aluguel e de gravação)
+JOBS_LEASE_S = float(os.getenv("JOBS_LEASE_S", 60))              # aluguel de um bloco; vencido, outro worker retoma
+JOBS_MAX_TENTATIVAS = int(os.getenv("JOBS_MAX_TENTATIVAS", 5))   # depois disso os itens do bloco ficam com status "erro"
+JOBS_MAX_ITENS = int(os.getenv("JOBS_MAX_ITENS", 1_000_000))     # eventos por job
+JOBS_OCIOSO_S = float(os.getenv("JOBS_OCIOSO_S", 0.5))           # espera sem blocos elegíveis / validade da fila de clientes
+JOBS_PROGRESSO_S = float(os.getenv("JOBS_PROGRESSO_S", 1.0))     # intervalo dos eventos de `/jobs/{id}/progresso`
+JOBS_RESUMO_ERROS = int(os.getenv("JOBS_RESUMO_ERROS", 20))      # (campo, tipo) mais frequentes no resumo do job
+JOBS_RETENCAO_H = float(os.getenv("JOBS_RETENCAO_H", 168))       # horas que um job concluído fica consultável
+
+JOBS = "jobs"
+BLOCOS = "jobs_blocos"
+STATUS_ITEM = ("gravado", "duplicado", "invalido", "recusado", "erro")
+ESTADOS_FINAIS = ("concluido", "cancelado")
+
+_resumos = {}                   # job em andamento -> (instante, resumo); ver `_resumo_recente`
+_ITENS_ENTRE_PAUSAS = 50        # validações seguidas antes de devolver o event loop à API
+_ESPERA_FALHA_S = 5.0           # espera de um worker depois de falha no Mongo
+
+
+class JobInvalido(ValueError):
+    """Upload rejeitado (vazio, grande demais ou linha NDJSON inválida)."""
+
+
+def _agora() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+async def garantir_indices_jobs() -> None:
+    """Índices de apoio (idempotente): escalonamento, leitura em ordem e expiração."""
+    await db[BLOCOS].create_index([("estado", 1), ("cliente", 1), ("criado_em", 1)], name="elegiveis")
+    await db[BLOCOS].create_index([("job", 1), ("n", 1)], name="job_ordem")
+    await db[BLOCOS].create_index("expira_em", name="expiracao", expireAfterSeconds=0)
+    await db[JOBS].create_index([("cliente", 1), ("criado_em", -1)], name="cliente_recentes")
+    await db[JOBS].create_index("expira_em", name="expiracao", expireAfterSeconds=0)
+
+
+# ─── Upload ──────────────────────────────────
+async def linhas_ndjson(partes):
+    """Eventos de um corpo NDJSON em streaming (`request.stream()`), sem ler tudo em memória."""
+    resto = b""
+    numero = 0
+    async for parte in partes:
+        resto += parte
+        *linhas, resto = resto.split(b"\n")
+        for linha in linhas:
+            numero += 1
+            if linha.strip():
+                yield _carregar_linha(linha, numero)
+    if resto.strip():
+        yield _carregar_linha(resto, numero + 1)
+
+
+def _carregar_linha(linha: bytes, numero: int):
+    try:
+        return json.loads(linha)
+    except ValueError as e:
+        raise JobInvalido(f"Linha {numero} do NDJSON não é um JSON válido: {e}")
+
+
+async def _iterar(itens):
+    if hasattr(itens, "__aiter__"):
+        async for item in itens:
+            yield item
+    else:
+        for item in itens:
+            yield item
+
+
+async def submeter(cliente: str, itens) -> dict:
+    """
+    Cria um job com os eventos de `itens` (lista ou iterável assíncrono), gravando
+    um bloco a cada `JOBS_BLOCO` eventos. Os workers já podem processar os
+    primeiros blocos enquanto o upload continua. Se o upload falhar no meio, o
+    job é cancelado e seus blocos removidos (eventos de blocos já processados
+    continuam gravados).
+    """
+    job_id = uuid.uuid4().hex
+    async with breaker_mongo.protegido():
+        await db[JOBS].insert_one({
+            "_id": job_id, "cliente": cliente, "estado": "recebendo",
+            "total": None, "blocos": None, "criado_em": _agora(),
+        })
+    total = n = 0
+    bloco = []
+    try:
+        async for item in _iterar(itens):
+            if total >= JOBS_MAX_ITENS:
+                raise JobInvalido(f"Job excede JOBS_MAX_ITENS ({JOBS_MAX_ITENS}) eventos.")
+            bloco.append(item)
+            total += 1
+            if len(bloco) == JOBS_BLOCO:
+                await _gravar_bloco(job_id, cliente, n, total - len(bloco), bloco)
+                n, bloco = n + 1, []
+        if bloco:
+            await _gravar_bloco(job_id, cliente, n, total - len(bloco), bloco)
+            n += 1
+        if total == 0:
+            raise JobInvalido("Nenhum evento enviado.")
+    except BaseException:
+        await _cancelar(job_id)
+        raise
+
+    await db[JOBS].update_one({"_id": job_id},
+                              {"$set": {"estado": "processando", "total": total, "blocos": n}})
+    # os workers podem ter terminado todos os blocos antes do fim do upload
+    await _talvez_concluir(job_id)
+    metricas.incrementar("jobs_submetidos_total")
+    metricas.incrementar("jobs_itens_recebidos_total", total)
+    logger.info(f"[jobs] Job {job_id} do cliente {cliente} recebido: {total} evento(s) em {n} bloco(s)")
+    return {"job_id": job_id, "estado": "processando", "total": total, "blocos": n}
+
+
+async def _gravar_bloco(job_id: str, cliente: str, n: int, inicio: int, itens: list) -> None:
+    async with breaker_mongo.protegido():
+        await db[BLOCOS].insert_one({
+            "_id": f"{job_id}:{n:06d}", "job": job_id, "cliente": cliente, "n": n,
+            "inicio": inicio, "itens": itens, "estado": "pendente", "tentativas": 0,
+            "criado_em": _agora(),
+        })
+
+
+async def _cancelar(job_id: str) -> None:
+    try:
+        await db[BLOCOS].delete_many({"job": job_id})
+        await db[JOBS].update_one({"_id": job_id}, {"$set": {
+            "estado": "cancelado", "expira_em": _agora() + timedelta(hours=JOBS_RETENCAO_H)}})
+    except Exception as e:
+        logger.warning(f"[jobs] Falha ao cancelar o job {job_id}: {e!r}")
+
+
+# ─── Escalonamento e workers ─────────────────
+def _filtro_elegiveis(agora: datetime) -> dict:
+    return {"$or": [
+        {"estado": "pendente"},
+        {"estado": "processando", "lease_ate": {"$lt": agora}},
+    ]}
+
+
+class Escalonador:
+    """
+    Round-robin entre os clientes com blocos elegíveis, compartilhado pelos
+    workers do processo. A lista de clientes é relida do Mongo no máximo a cada
+    `JOBS_OCIOSO_S`; clientes novos entram no fim da fila.
+    """
+
+    def __init__(self):
+        self._fila = deque()
+        self._lida_em = 0.0
+
+    async def _atualizar(self) -> None:
+        clientes = await db[BLOCOS].distinct("cliente", _filtro_elegiveis(_agora()))
+        presentes = set(clientes)
+        mantidos = [c for c in self._fila if c in presentes]
+        novos = sorted(presentes.difference(mantidos))
+        self._fila = deque(mantidos + novos)
+        self._lida_em = time.monotonic()
+
+    async def alugar(self, worker: str):
+        """Próximo bloco (o mais antigo do próximo cliente da vez), já alugado para `worker`; None se não houver."""
+        if not self._fila or time.monotonic() - self._lida_em > JOBS_OCIOSO_S:
+            await self._atualizar()
+        for _ in range(len(self._fila)):
+            cliente = self._fila[0]
+            self._fila.rotate(-1)
+            agora = _agora()
+            bloco = await db[BLOCOS].find_one_and_update(
+                {"cliente": cliente, **_filtro_elegiveis(agora)},
+                {"$set": {"estado": "processando", "worker": worker,
+                          "lease_ate": agora + timedelta(seconds=JOBS_LEASE_S)},
+                 "$inc": {"tentativas": 1}},
+                sort=[("criado_em", 1), ("n", 1)],
+                return_document=ReturnDocument.AFTER,
+            )
+            if bloco is not None:
+                return bloco
+        return None
+
+
+_em_processamento = 0
+
+
+async def _worker(nome: str, escalonador: Escalonador) -> None:
+    global _em_processamento
+    while True:
+        try:
+            async with breaker_mongo.protegido():
+                bloco = await escalonador.alugar(nome)
+        except Exception as e:
+            logger.warning(f"[jobs] {nome}: falha ao buscar blocos ({e!r}), nova tentativa em {_ESPERA_FALHA_S:.0f}s")
+            await asyncio.sleep(_ESPERA_FALHA_S)
+            continue
+        if bloco is None:
+            await asyncio.sleep(JOBS_OCIOSO_S)
+            continue
+
+        _em_processamento += 1
+        try:
+            await processar_bloco(bloco, nome)
+        except asyncio.CancelledError:
+            # shutdown: devolve o bloco em vez de esperar o aluguel vencer
+            await _devolver(bloco, nome)
+            raise
+        except Exception as e:
+            # o aluguel vence e outro worker (ou este) tenta de novo
+            metricas.incrementar("jobs_blocos_falhas_total")
+            logger.warning(f"[jobs] {nome}: falha no bloco {bloco['_id']} "
+                           f"(tentativa {bloco['tentativas']}): {e!r}")
+            await asyncio.sleep(_ESPERA_FALHA_S)
+        finally:
+            _em_processamento -= 1
+
+
+async def _devolver(bloco: dict, worker: str) -> None:
+    try:
+        await db[BLOCOS].update_one(
+            {"_id": bloco["_id"], "worker": worker, "estado": "processando"},
+            {"$set": {"estado": "pendente"}, "$unset": {"lease_ate": "", "worker": ""},
+             "$inc": {"tentativas": -1}},
+        )
+    except Exception as e:
+        logger.warning(f"[jobs] Bloco {bloco['_id']} não devolvido, será retomado quando o aluguel vencer: {e!r}")
+
+
+async def executar_workers(n: int = JOBS_WORKERS) -> None:
+    """
+    Tarefa do lifespan (ou da CLI `worker`): cria os índices e roda `n` workers
+    até ser cancelada. Blocos em andamento são devolvidos no cancelamento.
+    """
+    if n <= 0:
+        return
+    while True:
+        try:
+            await garantir_indices_jobs()
+            break
+        except Exception as e:
+            logger.warning(f"[jobs] Falha ao criar índices ({e!r}), nova tentativa em {_ESPERA_FALHA_S:.0f}s")
+            await asyncio.sleep(_ESPERA_FALHA_S)
+    escalonador = Escalonador()
+    base = f"{socket.gethostname()}:{os.getpid()}"
+    logger.info(f"[jobs] {n} worker(s) de jobs iniciados em {base}")
+    await asyncio.gather(*(_worker(f"{base}:{k}", escalonador) for k in range(n)))
+
+
+# ─── Processamento de um bloco ───────────────
+async def _validar_item(i: int, payload, cliente: str, erros: Counter):
+    """Resultado do item e, se válido, o (tipo, coleção, documento) a gravar."""
+    if not isinstance(payload, dict):
+        return {"i": i, "status": "invalido", "erros": ["Item não é um objeto JSON."]}, None
+    tipo = payload.get("TpEvento")
+    if not tipo:
+        return {"i": i, "status": "invalido", "erros": ["Campo 'TpEvento' não encontrado no JSON."]}, None
+    modelo = MODELOS.get(tipo)
+    if modelo is None:
+        return {"i": i, "status": "invalido", "evento": tipo,
+                "erros": [f"Evento '{tipo}' não reconhecido."]}, None
+
+    if CLIENTES_HABILITADO and "nrInscEstab" in payload:
+        try:
+            await registro.verificar(payload["nrInscEstab"], cliente)
+        except EstabelecimentoNaoAutorizado as e:
+            return {"i": i, "status": "recusado", "evento": tipo, "erros": [str(e)]}, None
+
+    try:
+        modelo(**payload)
+    except ValidationError as e:
+        lista = e.errors()
+        agregador.registrar(cliente, tipo, lista, payload)
+        for err in lista:
+            erros[(tipo, campo_do_erro(err), err["type"], err["msg"])] += 1
+        return {"i": i, "status": "invalido", "evento": tipo,
+                "erros": [f"Campo: {campo_do_erro(err)} | Erro: {err['msg']}" for err in lista]}, None
+
+    resultado = {"evento": tipo, "status": "valido", "mensagem": f"Evento {tipo} validado com sucesso!"}
+    return {"i": i, "status": "gravado", "evento": tipo}, preparar_documento(resultado, payload, cliente)
+
+
+async def processar_bloco(bloco: dict, worker: str) -> None:
+    """
+    Valida e grava um bloco alugado e registra o resultado de cada item. Só
+    conclui se o aluguel ainda for deste worker (senão outro já o retomou).
+    """
+    cliente = bloco["cliente"]
+    erros = Counter()
+    resultados = []
+    if bloco["tentativas"] > JOBS_MAX_TENTATIVAS:
+        mensagem = f"Bloco não processado após {JOBS_MAX_TENTATIVAS} tentativas."
+        resultados = [{"i": bloco["inicio"] + k, "status": "erro", "erros": [mensagem]}
+                      for k in range(len(bloco["itens"]))]
+        logger.error(f"[jobs] Bloco {bloco['_id']} do cliente {cliente} desistido após {JOBS_MAX_TENTATIVAS} tentativas")
+    else:
+        validos = []
+        vistos = set()
+        for k, payload in enumerate(bloco["itens"]):
+            item, documento = await _validar_item(bloco["inicio"] + k, payload, cliente, erros)
+            resultados.append(item)
+            if documento is not None:
+                item["_id"] = documento[2]["_id"]
+                if item["_id"] in vistos:
+                    item["status"] = "duplicado"    # repetido dentro do próprio bloco
+                else:
+                    vistos.add(item["_id"])
+                    validos.append((item, documento))
+            if k % _ITENS_ENTRE_PAUSAS == _ITENS_ENTRE_PAUSAS - 1:
+                await asyncio.sleep(0)
+
+        if validos:
+            documentos = [documento for _, documento in validos]
+            anteriores = set(bloco.get("planejados", ()))      # inseridos (ou tentados) por tentativas anteriores
+            novos = [item["_id"] for item, _ in validos if item["_id"] not in anteriores]
+            existentes = await ids_existentes(documentos) if novos else set()
+            async with breaker_mongo.protegido():
+                anotado = await db[BLOCOS].update_one(
+                    {"_id": bloco["_id"], "worker": worker, "tentativas": bloco["tentativas"]},
+                    {"$addToSet": {"planejados": {"$each": [i for i in novos if i not in existentes]}}},
+                )
+            if anotado.matched_count == 0:
+                logger.warning(f"[jobs] Aluguel do bloco {bloco['_id']} perdido para outro worker antes de gravar")
+                return
+            duplicados = set()
+            await inserir_lote(documentos, duplicados)
+            for item, _ in validos:
+                if item["_id"] in duplicados and item["_id"] not in anteriores:
+                    item["status"] = "duplicado"
+
+    contagens = Counter(item["status"] for item in resultados)
+    lista_erros = [{"evento": evento, "campo": campo, "tipo_erro": tipo_erro, "mensagem": mensagem, "total": total}
+                   for (evento, campo, tipo_erro, mensagem), total in erros.items()]
+    async with breaker_mongo.protegido():
+        concluido = await db[BLOCOS].update_one(
+            {"_id": bloco["_id"], "worker": worker, "tentativas": bloco["tentativas"]},
+            {"$set": {"estado": "concluido", "resultados": resultados, "contagens": dict(contagens),
+                      "erros": lista_erros, "concluido_em": _agora()},
+             "$unset": {"itens": "", "lease_ate": "", "planejados": ""}},
+        )
+    if concluido.matched_count == 0:
+        logger.warning(f"[jobs] Aluguel do bloco {bloco['_id']} perdido para outro worker; resultado descartado")
+        return
+
+    metricas.incrementar("jobs_blocos_total")
+    for status, total in contagens.items():
+        metricas.incrementar("jobs_itens_total", total, status=status)
+    await _talvez_concluir(bloco["job"])
+
+
+# ─── Consulta ────────────────────────────────
+async def resumir(job_id: str) -> dict:
+    """Soma das contagens e dos erros dos blocos concluídos do job."""
+    contagens = Counter({status: 0 for status in STATUS_ITEM})
+    erros = Counter()
+    mensagens = {}
+    blocos = 0
+    cursor = db[BLOCOS].find({"job": job_id, "estado": "concluido"}, {"contagens": 1, "erros": 1})
+    async for bloco in cursor:
+        blocos += 1
+        contagens.update(bloco.get("contagens", {}))
+        for err in bloco.get("erros", []):
+            chave = (err["evento"], err["campo"], err["tipo_erro"])
+            erros[chave] += err["total"]
+            mensagens[chave] = err["mensagem"]
+    return {
+        "blocos_concluidos": blocos,
+        "processados": sum(contagens.values()),
+        "contagens": dict(contagens),
+        "erros": [{"evento": evento, "campo": campo, "tipo_erro": tipo_erro,
+                   "mensagem": mensagens[(evento, campo, tipo_erro)], "total": total}
+                  for (evento, campo, tipo_erro), total in erros.most_common(JOBS_RESUMO_ERROS)],
+    }
+
+
+async def _resumo_recente(job_id: str) -> dict:
+    """
+    `resumir` com validade de JOBS_PROGRESSO_S: vários streams de progresso (e
+    consultas) do mesmo job em andamento dividem uma agregação por intervalo.
+    """
+    agora = time.monotonic()
+    guardado = _resumos.get(job_id)
+    if guardado is not None and agora - guardado[0] < JOBS_PROGRESSO_S:
+        return guardado[1]
+    resumo = await resumir(job_id)
+    for antigo in [j for j, (instante, _) in _resumos.items() if agora - instante >= JOBS_PROGRESSO_S]:
+        del _resumos[antigo]
+    _resumos[job_id] = (agora, resumo)
+    return resumo
+
+
+async def _talvez_concluir(job_id: str) -> None:
+    """Fecha o job quando o upload terminou e todos os blocos foram concluídos (idempotente)."""
+    job = await db[JOBS].find_one({"_id": job_id})
+    if job is None or job["estado"] != "processando":
+        return
+    if await db[BLOCOS].count_documents({"job": job_id, "estado": "concluido"}) < job["blocos"]:
+        return
+    resumo = await resumir(job_id)
+    agora = _agora()
+    expira_em = agora + timedelta(hours=JOBS_RETENCAO_H)
+    fechado = await db[JOBS].update_one(
+        {"_id": job_id, "estado": "processando"},
+        {"$set": {"estado": "concluido", "concluido_em": agora, "resumo": resumo, "expira_em": expira_em}},
+    )
+    if fechado.modified_count:
+        await db[BLOCOS].update_many({"job": job_id}, {"$set": {"expira_em": expira_em}})
+        metricas.incrementar("jobs_concluidos_total")
+        segundos = (agora - job["criado_em"].replace(tzinfo=timezone.utc)).total_seconds()
+        logger.info(f"[jobs] Job {job_id} do cliente {job['cliente']} concluído em {segundos:.1f}s: "
+                    f"{resumo['contagens']}")
+
+
+async def consultar(job_id: str, cliente: str = None):
+    """Estado e progresso do job (None se não existir ou for de outro cliente)."""
+    filtro = {"_id": job_id}
+    if cliente is not None:
+        filtro["cliente"] = cliente
+    async with breaker_mongo.protegido():
+        job = await db[JOBS].find_one(filtro)
+        if job is None:
+            return None
+        resumo = job.get("resumo") or await _resumo_recente(job_id)
+    return {
+        "job_id": job_id,
+        "cliente": job["cliente"],
+        "estado": job["estado"],
+        "total": job["total"],
+        "blocos": job["blocos"],
+        **resumo,
+        "criado_em": job["criado_em"],
+        "concluido_em": job.get("concluido_em"),
+    }
+
+
+async def progresso(job_id: str, intervalo: float = JOBS_PROGRESSO_S):
+    """Server-Sent Events com o estado do job a cada `intervalo` s, até ele terminar."""
+    while True:
+        estado = await consultar(job_id)
+        yield f"event: progresso\ndata: {json.dumps(estado, default=str, ensure_ascii=False)}\n\n".encode()
+        if estado is None or estado["estado"] in ESTADOS_FINAIS:
+            return
+        await asyncio.sleep(intervalo)
+
+
+async def resultados(job_id: str, somente_erros: bool = False):
+    """NDJSON com o resultado de cada item dos blocos já concluídos, na ordem do envio."""
+    cursor = db[BLOCOS].find({"job": job_id, "estado": "concluido"}, {"resultados": 1}).sort("n", 1)
+    async for bloco in cursor:
+        linhas = [json.dumps(r, ensure_ascii=False) for r in bloco["resultados"]
+                  if not somente_erros or r["status"] != "gravado"]
+        if linhas:
+            yield ("\n".join(linhas) + "\n").encode()
+
+
+async def listar(cliente: str = None, limite: int = 20) -> list:
+    filtro = {"cliente": cliente} if cliente else {}
+    cursor = db[JOBS].find(filtro, {"resumo.erros": 0}).sort("criado_em", -1).limit(limite)
+    return [job async for job in cursor]
+
+
+metricas.descrever("jobs_submetidos_total", "counter", "Jobs recebidos em POST /jobs")
+metricas.descrever("jobs_itens_recebidos_total", "counter", "Eventos recebidos em jobs")
+metricas.descrever("jobs_itens_total", "counter", "Itens de jobs processados, por status")
+metricas.descrever("jobs_blocos_total", "counter", "Blocos de jobs concluídos por este worker")
+metricas.descrever("jobs_blocos_falhas_total", "counter", "Blocos de jobs que falharam e serão retomados")
+metricas.descrever("jobs_concluidos_total", "counter", "Jobs concluídos")
+metricas.registrar_gauge("jobs_blocos_em_processamento", lambda: _em_processamento,
+                         "Blocos de jobs sendo processados neste worker")
+
+
+# ─── CLI ─────────────────────────────────────
+def main():
+    parser = argparse.ArgumentParser(description="Jobs assíncronos de validação em lote")
+    sub = parser.add_subparsers(dest="comando", required=True)
+
+    p_worker = sub.add_parser("worker", help="roda workers de jobs fora da API")
+    p_worker.add_argument("--workers", type=int, default=max(JOBS_WORKERS, 1))
+
+    p_status = sub.add_parser("status", help="estado e resumo de um job")
+    p_status.add_argument("job_id")
+
+    p_listar = sub.add_parser("listar", help="jobs mais recentes")
+    p_listar.add_argument("--cliente")
+    p_listar.add_argument("--limite", type=int, default=20)
+
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)   # os validadores ligam DEBUG no import
+
+    if args.comando == "worker":
+        logging.getLogger(__name__).setLevel(logging.INFO)
+        try:
+            asyncio.run(executar_workers(args.workers))
+        except KeyboardInterrupt:
+            pass
+    elif args.comando == "status":
+        estado = asyncio.run(consultar(args.job_id))
+        if estado is None:
+            raise SystemExit(f"Job {args.job_id} não encontrado.")
+        print(json.dumps(estado, default=str, ensure_ascii=False, indent=2))
+    else:
+        for job in asyncio.run(listar(args.cliente, args.limite)):
+            contagens = job.get("resumo", {}).get("contagens", {})
+            print(f"{job['_id']}  {job['cliente']}  {job['estado']:<11} {job['total'] or '-':>8}  "
+                  f"{job['criado_em']:%Y-%m-%d %H:%M:%S}  {contagens}")
+
+
+if __name__ == "__main__":
+    main()
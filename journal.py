@@ -0,0 +1,293 @@
+"""
+Journal local (outbox) para eventos validados quando o MongoDB está fora ou lento.
+
+ - Append-only em segmentos `<pid>-<instância>-<seq>.ativo` dentro de `JOURNAL_DIR`
+   (a instância — início do processo + sufixo aleatório — distingue um worker
+   reiniciado com o mesmo PID, comum em contêineres), criados com "xb"; cada
+   registro é `<tamanho u32><crc32 u32><BSON>` com {t: TpEvento, c: coleção,
+   ts: epoch, d: documento}.
+ - Fsync em lote (group commit): escritas que chegam dentro de
+   `JOURNAL_FSYNC_MS` compartilham um único `fsync`, e `anexar` só retorna
+   depois dele — o 200 ao cliente nunca precede a durabilidade.
+ - Recuperação segura contra escritas parciais: a leitura para no primeiro
+   registro truncado ou com CRC inválido (que nunca foi confirmado ao cliente).
+   Se uma escrita ou fsync falha, o segmento é truncado de volta e fechado, e
+   os lotes seguintes vão para um segmento novo.
+ - `loop_reprocessamento` fecha o segmento ativo, reivindica segmentos fechados
+   (rename atômico `.seg` → `.seg.<pid>`, então só um worker processa cada um),
+   grava em lote no Mongo e apaga o segmento. Duplicidades de `_id` são
+   descartadas como em `save_if_valid`. Segmentos de workers mortos voltam
+   para a fila, inclusive os de uma instância anterior com o mesmo PID.
+"""
+import asyncio
+import bson
+import glob
+import logging
+import os
+import secrets
+import struct
+import time
+import zlib
+import metricas
+
+logger = logging.getLogger(__name__)
+
+# ─── Configuração ────────────────────────────
+JOURNAL_HABILITADO = os.getenv("JOURNAL_HABILITADO", "1") == "1"               # desvia para o journal quando o Mongo falha
+JOURNAL_DIR = os.getenv("JOURNAL_DIR", "journal")                                # pasta dos segmentos
+JOURNAL_FSYNC_MS = float(os.getenv("JOURNAL_FSYNC_MS", 5))                       # janela de agrupamento de escritas por fsync
+JOURNAL_SEGMENTO_MAX_BYTES = int(os.getenv("JOURNAL_SEGMENTO_MAX_BYTES", 64 * 1024 * 1024))  # tamanho para rotacionar o segmento
+JOURNAL_DESVIO_MS = int(os.getenv("JOURNAL_DESVIO_MS", 1500))                    # insert mais lento que isso vai para o journal
+JOURNAL_REPLAY_LOTE = int(os.getenv("JOURNAL_REPLAY_LOTE", 500))                 # documentos por insert_many no reprocessamento
+JOURNAL_REPLAY_INTERVALO_S = float(os.getenv("JOURNAL_REPLAY_INTERVALO_S", 5))   # intervalo entre tentativas de reprocessar
+
+_CABECALHO = struct.Struct("<II")
+
+
+def codificar_registro(tipo: str, colecao: str, doc: dict) -> bytes:
+    corpo = bson.encode({"t": tipo, "c": colecao, "ts": time.time(), "d": doc})
+    return _CABECALHO.pack(len(corpo), zlib.crc32(corpo)) + corpo
+
+
+def ler_segmento(caminho: str):
+    """
+    Gera os registros íntegros de um segmento. Para no primeiro registro
+    incompleto ou corrompido (cauda de uma escrita interrompida).
+    """
+    with open(caminho, "rb") as f:
+        while True:
+            cabecalho = f.read(_CABECALHO.size)
+            if len(cabecalho) < _CABECALHO.size:
+                return
+            tamanho, crc = _CABECALHO.unpack(cabecalho)
+            corpo = f.read(tamanho)
+            if len(corpo) < tamanho or zlib.crc32(corpo) != crc:
+                logger.warning(f"[journal] Registro truncado/corrompido em {caminho}, ignorando o restante")
+                return
+            yield bson.decode(corpo)
+
+
+def _pid_vivo(pid: int) -> bool:
+    import psutil
+    return psutil.pid_exists(pid)
+
+
+class Journal:
+    """Journal de um worker: escrita com group commit e reprocessamento em lote."""
+
+    def __init__(self, diretorio: str = JOURNAL_DIR):
+        self.diretorio = diretorio
+        self.pid = os.getpid()
+        self.instancia = f"{int(time.time()):x}{secrets.token_hex(3)}"   # única por início do processo
+        self.seq = 0
+        self._arquivo = None
+        self._caminho = None
+        self._pendentes = []          # (frame, futuro)
+        self._descarga = None         # task do próximo fsync
+        self._lock_io = asyncio.Lock()
+        self.desviando = False        # True enquanto houver registros deste worker a reprocessar
+        self.ultima_taxa = 0.0
+
+    # ─── escrita ─────────────────────────────
+    def _abrir_segmento(self):
+        os.makedirs(self.diretorio, exist_ok=True)
+        self.seq += 1
+        self._caminho = os.path.join(self.diretorio, f"{self.pid}-{self.instancia}-{self.seq:06d}.ativo")
+        self._arquivo = open(self._caminho, "xb", buffering=0)     # nunca continua um segmento alheio
+
+    def _fechar_segmento(self):
+        """Fecha o segmento ativo e o disponibiliza para reprocessamento."""
+        if self._arquivo is None:
+            return
+        self._arquivo.close()
+        if os.path.getsize(self._caminho):
+            os.replace(self._caminho, self._caminho[:-len(".ativo")] + ".seg")
+        else:
+            os.remove(self._caminho)
+        self._arquivo = None
+
+    def _gravar(self, frames: list) -> None:
+        if self._arquivo is None:
+            self._abrir_segmento()
+        dados = b"".join(frames)
+        inicio = self._arquivo.tell()
+        try:
+            escritos = self._arquivo.write(dados)     # sem buffer: a escrita pode ser parcial
+            if escritos != len(dados):
+                raise OSError(f"escrita parcial no journal ({escritos} de {len(dados)} bytes)")
+            os.fsync(self._arquivo.fileno())
+        except BaseException:
+            self._descartar_cauda(inicio)
+            raise
+        if self._arquivo.tell() >= JOURNAL_SEGMENTO_MAX_BYTES:
+            self._fechar_segmento()
+
+    def _descartar_cauda(self, inicio: int) -> None:
+        """
+        Após falha de escrita/fsync: corta o segmento de volta ao fim do último lote
+        confirmado e o fecha. Lotes seguintes vão para um segmento novo, nunca depois
+        de um registro rasgado (a leitura para nele e perderia os seguintes).
+        """
+        try:
+            self._arquivo.truncate(inicio)
+            os.fsync(self._arquivo.fileno())
+        except OSError as e:
+            logger.error(f"[journal] Não foi possível truncar {self._caminho} após falha de escrita: {e!r}")
+        try:
+            self._fechar_segmento()
+        except OSError as e:
+            logger.error(f"[journal] Falha ao fechar {self._caminho}: {e!r}")
+            self._arquivo = None
+
+    async def anexar(self, tipo: str, colecao: str, doc: dict) -> None:
+        """Grava o documento no journal; retorna só depois do fsync do lote."""
+        futuro = asyncio.get_running_loop().create_future()
+        self._pendentes.append((codificar_registro(tipo, colecao, doc), futuro))
+        self.desviando = True
+        if self._descarga is None:
+            self._descarga = asyncio.create_task(self._descarregar())
+        await futuro
+        metricas.incrementar("journal_anexados_total", evento=tipo)
+
+    async def _descarregar(self):
+        await asyncio.sleep(JOURNAL_FSYNC_MS / 1000)
+        async with self._lock_io:
+            lote, self._pendentes = self._pendentes, []
+            self._descarga = None
+            try:
+                await asyncio.to_thread(self._gravar, [frame for frame, _ in lote])
+            except Exception as e:
+                # nenhum cliente do lote recebe 200: o erro sobe para save_if_valid
+                logger.error(f"[journal] Falha ao gravar lote de {len(lote)} registro(s): {e!r}")
+                for _, futuro in lote:
+                    if not futuro.done():
+                        futuro.set_exception(e)
+                return
+            for _, futuro in lote:
+                if not futuro.done():
+                    futuro.set_result(None)
+
+    # ─── reprocessamento ─────────────────────
+    def _recuperar_orfaos(self):
+        """
+        Devolve à fila segmentos de workers que morreram (ativos ou em reprocessamento).
+        Um `.ativo` com o PID deste processo mas de outra instância é de um worker
+        anterior que teve o mesmo PID: também está morto.
+        """
+        for caminho in glob.glob(os.path.join(self.diretorio, "*.ativo")):
+            pid, instancia = os.path.basename(caminho).split("-", 2)[:2]
+            if int(pid) == self.pid:
+                if instancia != self.instancia:
+                    os.replace(caminho, caminho[:-len(".ativo")] + ".seg")
+            elif not _pid_vivo(int(pid)):
+                os.replace(caminho, caminho[:-len(".ativo")] + ".seg")
+        for caminho in glob.glob(os.path.join(self.diretorio, "*.seg.*")):
+            pid = int(caminho.rsplit(".", 1)[1])
+            if pid != self.pid and not _pid_vivo(pid):
+                os.replace(caminho, caminho.rsplit(".", 1)[0])
+
+    def _reivindicar(self) -> list:
+        reivindicados = []
+        for caminho in sorted(glob.glob(os.path.join(self.diretorio, "*.seg"))):
+            destino = f"{caminho}.{self.pid}"
+            try:
+                os.rename(caminho, destino)
+            except OSError:
+                continue      # outro worker levou primeiro
+            reivindicados.append(destino)
+        # inclui os que este worker já tinha reivindicado e não terminou
+        reivindicados += [c for c in glob.glob(os.path.join(self.diretorio, f"*.seg.{self.pid}"))
+                          if c not in reivindicados]
+        return sorted(reivindicados)
+
+    async def reprocessar(self, inserir_lote) -> int:
+        """
+        Reenvia ao Mongo todos os segmentos disponíveis. `inserir_lote(itens)` recebe
+        [(tipo, coleção, doc)] e retorna (inseridos, duplicados). Retorna o nº de registros lidos.
+        """
+        async with self._lock_io:
+            await asyncio.to_thread(self._fechar_segmento)
+        await asyncio.to_thread(self._recuperar_orfaos)
+
+        total = 0
+        inicio = time.perf_counter()
+        for caminho in await asyncio.to_thread(self._reivindicar):
+            lote = []
+            for reg in ler_segmento(caminho):
+                lote.append((reg["t"], reg["c"], reg["d"]))
+                if len(lote) >= JOURNAL_REPLAY_LOTE:
+                    total += await self._enviar(inserir_lote, lote)
+                    lote = []
+            if lote:
+                total += await self._enviar(inserir_lote, lote)
+            os.remove(caminho)
+            logger.info(f"[journal] Segmento {os.path.basename(caminho)} reprocessado")
+
+        if total:
+            self.ultima_taxa = total / (time.perf_counter() - inicio)
+            logger.info(f"[journal] {total} registros reprocessados ({self.ultima_taxa:.0f}/s)")
+        return total
+
+    @staticmethod
+    async def _enviar(inserir_lote, lote: list) -> int:
+        inseridos, duplicados = await inserir_lote(lote)
+        metricas.incrementar("journal_reprocessados_total", inseridos, resultado="inserido")
+        metricas.incrementar("journal_reprocessados_total", duplicados, resultado="duplicado")
+        if duplicados:
+            logger.warning(f"[journal] {duplicados} registros já existiam no Mongo e foram descartados")
+        return len(lote)
+
+    async def loop_reprocessamento(self, inserir_lote, verificar_conexao):
+        """
+        Tarefa de fundo: a cada intervalo, se houver algo no journal e o Mongo
+        responder, reprocessa tudo e volta a gravar direto no banco.
+        """
+        while True:
+            await asyncio.sleep(JOURNAL_REPLAY_INTERVALO_S)
+            if not self.tem_pendencias():
+                self.desviando = False
+                continue
+            try:
+                await verificar_conexao()
+                await self.reprocessar(inserir_lote)
+                if not self._pendentes and not self.tem_pendencias():
+                    self.desviando = False
+            except Exception as e:
+                logger.warning(f"[journal] Reprocessamento adiado: {e!r}")
+
+    # ─── observabilidade ─────────────────────
+    def _segmentos(self) -> list:
+        if not os.path.isdir(self.diretorio):
+            return []
+        return [os.path.join(self.diretorio, n) for n in os.listdir(self.diretorio)
+                if n.endswith((".ativo", ".seg")) or ".seg." in n]
+
+    def tem_pendencias(self) -> bool:
+        return bool(self._pendentes) or any(os.path.getsize(c) for c in self._segmentos())
+
+    def tamanho_bytes(self) -> int:
+        return sum(os.path.getsize(c) for c in self._segmentos())
+
+    def atraso_s(self) -> float:
+        """Idade do registro pendente mais antigo (lag de reprocessamento)."""
+        mais_antigo = None
+        for caminho in self._segmentos():
+            try:
+                reg = next(ler_segmento(caminho), None)
+            except OSError:
+                continue
+            if reg and (mais_antigo is None or reg["ts"] < mais_antigo):
+                mais_antigo = reg["ts"]
+        return time.time() - mais_antigo if mais_antigo else 0.0
+
+
+journal = Journal()
+
+metricas.descrever("journal_anexados_total", "counter", "Eventos gravados no journal local")
+metricas.descrever("journal_reprocessados_total", "counter", "Registros do journal reenviados ao Mongo")
+metricas.registrar_gauge("journal_bytes", journal.tamanho_bytes, "Tamanho dos segmentos pendentes no journal")
+metricas.registrar_gauge("journal_atraso_s", journal.atraso_s, "Idade do registro mais antigo ainda não reprocessado")
+metricas.registrar_gauge("journal_reprocessamento_por_s", lambda: round(journal.ultima_taxa, 1),
+                         "Vazão do último reprocessamento (registros/s)")
+metricas.registrar_gauge("journal_desviando", lambda: int(journal.desviando),
+                         "1 enquanto novos eventos deste worker vão direto para o journal")
@@ -0,0 +1,323 @@
+"""
+Limite de taxa e de concorrência por cliente (claim `cnpj` do JWT).
+
+Cada cliente tem um balde de tokens do seu plano (`LIMITE_TAXA_PLANOS`):
+`taxa` tokens por segundo, até `rajada` acumulados; cada requisição consome
+um token, e sem token a resposta é 429 com `Retry-After` (o tempo até o
+próximo token). Além disso, no máximo `concorrencia` requisições do mesmo
+cliente ficam em andamento em cada worker (429 com `Retry-After` de
+`LIMITE_TAXA_RETRY_CONCORRENCIA_S`).
+
+ - Custo O(1) por requisição: um dict lookup e a recarga do balde
+   (`tokens + decorrido * taxa`), sem tarefas de fundo nem I/O.
+ - Modo local (padrão): cada worker tem seus baldes, com taxa e rajada
+   divididas por `LIMITE_TAXA_WORKERS` para que a soma dos workers respeite
+   o plano.
+ - `LIMITE_TAXA_COMPARTILHADO=1`: os baldes ficam numa tabela de
+   `LIMITE_TAXA_SLOTS` posições mapeada em memória compartilhada
+   (`LIMITE_TAXA_ARQUIVO`, em /dev/shm), com trava de intervalo de bytes
+   (`fcntl.lockf`) por posição, então os workers da máquina dividem o mesmo
+   balde. A concorrência continua por worker: um worker morto não deixa vagas
+   presas para os outros.
+
+Planos: `LIMITE_TAXA_PLANOS="padrao=20/100/10,grande=200/1000/50"`
+(`nome=taxa/rajada/concorrencia`); `LIMITE_TAXA_CLIENTES="09524519000143=grande"`
+escolhe o plano de cada CNPJ, os demais usam `padrao`.
+
+Uso (CLI):
+    python limite_taxa.py planos
+    python limite_taxa.py bench --compartilhado
+"""
+from dataclasses import dataclass
+import argparse
+import logging
+import math
+import mmap
+import os
+import struct
+import tempfile
+import time
+import zlib
+import metricas
+
+try:
+    import fcntl
+except ImportError:         # Windows: sem lockf, só o modo local
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# ─── Configuração ────────────────────────────
+LIMITE_TAXA_HABILITADO = os.getenv("LIMITE_TAXA_HABILITADO", "0") == "1"           # aplica os limites por cliente
+LIMITE_TAXA_PLANOS = os.getenv("LIMITE_TAXA_PLANOS", "padrao=20/100/10")           # nome=taxa/rajada/concorrencia, separados por vírgula
+LIMITE_TAXA_CLIENTES = os.getenv("LIMITE_TAXA_CLIENTES", "")                       # cnpj=plano, separados por vírgula
+LIMITE_TAXA_WORKERS = int(os.getenv("LIMITE_TAXA_WORKERS", 1))                     # workers da API (divide o plano no modo local)
+LIMITE_TAXA_COMPARTILHADO = os.getenv("LIMITE_TAXA_COMPARTILHADO", "0") == "1"     # baldes em memória compartilhada entre workers
+LIMITE_TAXA_ARQUIVO = os.getenv(
+    "LIMITE_TAXA_ARQUIVO",
+    os.path.join("/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir(), "validador_limite_taxa"),
+)
+LIMITE_TAXA_SLOTS = int(os.getenv("LIMITE_TAXA_SLOTS", 4096))                      # clientes distintos na tabela compartilhada
+LIMITE_TAXA_RETRY_CONCORRENCIA_S = int(os.getenv("LIMITE_TAXA_RETRY_CONCORRENCIA_S", 1))  # Retry-After do 429 por concorrência
+
+PLANO_PADRAO = "padrao"
+
+
+@dataclass(frozen=True)
+class Plano:
+    nome: str
+    taxa: float           # tokens por segundo
+    rajada: float         # máximo acumulado
+    concorrencia: int     # requisições simultâneas por worker
+
+
+def carregar_planos(texto: str = LIMITE_TAXA_PLANOS) -> dict:
+    """'padrao=20/100/10,grande=200/1000/50' → {nome: Plano}; exige o plano `padrao`."""
+    planos = {}
+    for item in filter(None, (p.strip() for p in texto.split(","))):
+        nome, _, valores = item.partition("=")
+        try:
+            taxa, rajada, concorrencia = valores.split("/")
+            planos[nome] = Plano(nome, float(taxa), float(rajada), int(concorrencia))
+        except ValueError:
+            raise ValueError(f"Plano inválido em LIMITE_TAXA_PLANOS: {item!r} (use nome=taxa/rajada/concorrencia)")
+        if planos[nome].taxa <= 0 or planos[nome].rajada < 1 or planos[nome].concorrencia < 1:
+            raise ValueError(f"Plano {nome!r}: taxa > 0, rajada >= 1 e concorrencia >= 1")
+    if PLANO_PADRAO not in planos:
+        raise ValueError(f"LIMITE_TAXA_PLANOS precisa definir o plano {PLANO_PADRAO!r}")
+    return planos
+
+
+def carregar_clientes(texto: str, planos: dict) -> dict:
+    """'cnpj=plano,...' → {cnpj: nome do plano}."""
+    clientes = {}
+    for item in filter(None, (p.strip() for p in texto.split(","))):
+        cnpj, _, plano = item.partition("=")
+        if plano not in planos:
+            raise ValueError(f"LIMITE_TAXA_CLIENTES: plano {plano!r} do cliente {cnpj} não existe")
+        clientes[cnpj] = plano
+    return clientes
+
+
+# ─── Tabela compartilhada ────────────────────
+class TabelaCompartilhada:
+    """
+    Baldes de todos os workers num arquivo mapeado em memória: LIMITE_TAXA_SLOTS
+    posições de (cnpj, tokens, atualizado), endereçamento aberto por crc32 do
+    CNPJ (o `hash()` do Python muda entre processos). Cada acesso trava só os
+    bytes da posição com `fcntl.lockf`; as posições nunca são liberadas.
+    """
+    _SLOT = struct.Struct("<16sdd")
+
+    def __init__(self, caminho: str = LIMITE_TAXA_ARQUIVO, slots: int = LIMITE_TAXA_SLOTS):
+        if fcntl is None:
+            raise RuntimeError("LIMITE_TAXA_COMPARTILHADO exige fcntl (Linux/macOS)")
+        self.slots = slots
+        tamanho = slots * self._SLOT.size
+        self._fd = os.open(caminho, os.O_RDWR | os.O_CREAT, 0o600)
+        if os.fstat(self._fd).st_size < tamanho:
+            os.ftruncate(self._fd, tamanho)
+        self._mm = mmap.mmap(self._fd, tamanho)
+        self._indices = {}      # cnpj → posição, cache do processo
+
+    def _travar(self, i: int) -> None:
+        fcntl.lockf(self._fd, fcntl.LOCK_EX, self._SLOT.size, i * self._SLOT.size, os.SEEK_SET)
+
+    def _destravar(self, i: int) -> None:
+        fcntl.lockf(self._fd, fcntl.LOCK_UN, self._SLOT.size, i * self._SLOT.size, os.SEEK_SET)
+
+    def _indice(self, cnpj: str, rajada: float):
+        """Posição do cliente, ocupando uma livre (balde cheio) na primeira vez; None com a tabela lotada."""
+        i = self._indices.get(cnpj)
+        if i is not None:
+            return i
+        chave = cnpj.encode()[:16]
+        inicio = zlib.crc32(chave) % self.slots
+        for passo in range(self.slots):
+            i = (inicio + passo) % self.slots
+            self._travar(i)
+            try:
+                atual = self._mm[i * self._SLOT.size:i * self._SLOT.size + 16].rstrip(b"\0")
+                if not atual:
+                    self._SLOT.pack_into(self._mm, i * self._SLOT.size, chave, rajada, time.monotonic())
+                elif atual != chave:
+                    continue
+            finally:
+                self._destravar(i)
+            self._indices[cnpj] = i
+            return i
+        return None
+
+    def consumir(self, cnpj: str, taxa: float, rajada: float):
+        """Consome um token; retorna 0 se conseguiu, a espera em s até o próximo, ou None se não há posição livre."""
+        i = self._indice(cnpj, rajada)
+        if i is None:
+            return None
+        deslocamento = i * self._SLOT.size + 16
+        self._travar(i)
+        try:
+            tokens, atualizado = struct.unpack_from("<dd", self._mm, deslocamento)
+            agora = time.monotonic()        # CLOCK_MONOTONIC é o mesmo para todos os processos
+            tokens = min(rajada, tokens + max(0.0, agora - atualizado) * taxa)
+            espera = 0.0
+            if tokens >= 1:
+                tokens -= 1
+            else:
+                espera = (1 - tokens) / taxa
+            struct.pack_into("<dd", self._mm, deslocamento, tokens, agora)
+        finally:
+            self._destravar(i)
+        return espera
+
+    def tokens(self, cnpj: str) -> float:
+        i = self._indices.get(cnpj)
+        if i is None:
+            return float("nan")
+        return struct.unpack_from("<d", self._mm, i * self._SLOT.size + 16)[0]
+
+
+# ─── Limitador por cliente ───────────────────
+class _Cliente:
+    __slots__ = ("plano", "tokens", "atualizado", "em_voo")
+
+    def __init__(self, plano: Plano, rajada: float):
+        self.plano = plano
+        self.tokens = rajada
+        self.atualizado = time.monotonic()
+        self.em_voo = 0
+
+
+class LimitadorClientes:
+    def __init__(self, planos: dict, clientes: dict, workers: int = LIMITE_TAXA_WORKERS,
+                 tabela: TabelaCompartilhada = None):
+        self.planos = planos
+        self.clientes = clientes
+        self.tabela = tabela
+        # no modo local cada worker fica com a sua fração do plano
+        self._fracao = 1.0 if tabela is not None else 1.0 / max(1, workers)
+        self._estados = {}
+
+    def _estado(self, cnpj: str) -> _Cliente:
+        estado = self._estados.get(cnpj)
+        if estado is None:
+            plano = self.planos[self.clientes.get(cnpj, PLANO_PADRAO)]
+            estado = self._estados[cnpj] = _Cliente(plano, self._rajada(plano))
+        return estado
+
+    def _rajada(self, plano: Plano) -> float:
+        return max(1.0, plano.rajada * self._fracao)
+
+    def _consumir_local(self, estado: _Cliente) -> float:
+        agora = time.monotonic()
+        taxa = estado.plano.taxa * self._fracao
+        estado.tokens = min(self._rajada(estado.plano), estado.tokens + (agora - estado.atualizado) * taxa)
+        estado.atualizado = agora
+        if estado.tokens >= 1:
+            estado.tokens -= 1
+            return 0.0
+        return (1 - estado.tokens) / taxa
+
+    def adquirir(self, cnpj: str):
+        """
+        Reserva uma requisição do cliente. Retorna None se pode seguir (chamar
+        `liberar` ao terminar) ou os segundos do Retry-After do 429.
+        """
+        estado = self._estado(cnpj)
+        plano = estado.plano
+        if estado.em_voo >= plano.concorrencia:
+            metricas.incrementar("limite_taxa_recusas_total", cliente=cnpj, motivo="concorrencia")
+            return LIMITE_TAXA_RETRY_CONCORRENCIA_S
+
+        espera = None
+        if self.tabela is not None:
+            espera = self.tabela.consumir(cnpj, plano.taxa, plano.rajada)
+        if espera is None:
+            # modo local, ou tabela compartilhada lotada: balde deste worker
+            espera = self._consumir_local(estado)
+        if espera:
+            metricas.incrementar("limite_taxa_recusas_total", cliente=cnpj, motivo="taxa")
+            return max(1, math.ceil(espera))
+
+        estado.em_voo += 1
+        metricas.incrementar("limite_taxa_permitidas_total", cliente=cnpj)
+        return None
+
+    def liberar(self, cnpj: str) -> None:
+        self._estados[cnpj].em_voo -= 1
+
+    def em_voo(self) -> dict:
+        return {(("cliente", cnpj),): e.em_voo for cnpj, e in self._estados.items()}
+
+    def tokens(self) -> dict:
+        if self.tabela is not None:
+            return {(("cliente", cnpj),): round(self.tabela.tokens(cnpj), 2) for cnpj in self._estados}
+        return {(("cliente", cnpj),): round(e.tokens, 2) for cnpj, e in self._estados.items()}
+
+
+def _criar_limitador() -> LimitadorClientes:
+    planos = carregar_planos()
+    tabela = None
+    if LIMITE_TAXA_HABILITADO and LIMITE_TAXA_COMPARTILHADO:
+        try:
+            tabela = TabelaCompartilhada()
+        except (OSError, RuntimeError) as e:
+            logger.warning(f"[limite_taxa] Memória compartilhada indisponível ({e!r}); usando baldes por worker")
+    return LimitadorClientes(planos, carregar_clientes(LIMITE_TAXA_CLIENTES, planos), tabela=tabela)
+
+
+limitador_clientes = _criar_limitador()
+
+metricas.descrever("limite_taxa_permitidas_total", "counter", "Requisições admitidas pelo limite por cliente")
+metricas.descrever("limite_taxa_recusas_total", "counter", "Requisições recusadas com 429, por cliente e motivo (taxa/concorrencia)")
+metricas.registrar_gauge("limite_taxa_em_voo", limitador_clientes.em_voo, "Requisições em andamento por cliente neste worker")
+metricas.registrar_gauge("limite_taxa_tokens", limitador_clientes.tokens, "Tokens disponíveis no balde de cada cliente")
+
+
+# ─── CLI ─────────────────────────────────────
+def _bench(limitador: LimitadorClientes, quantidade: int, clientes: int) -> None:
+    cnpjs = [f"{i:014d}" for i in range(clientes)]
+    for cnpj in cnpjs:
+        limitador._estado(cnpj)
+    inicio = time.perf_counter()
+    for i in range(quantidade):
+        cnpj = cnpjs[i % clientes]
+        if limitador.adquirir(cnpj) is None:
+            limitador.liberar(cnpj)
+    decorrido = time.perf_counter() - inicio
+    print(f"{quantidade / decorrido:>12,.0f} adquirir+liberar/s  {decorrido / quantidade * 1e9:>7.0f} ns cada "
+          f"({clientes} clientes)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Limite de taxa/concorrência por cliente")
+    sub = parser.add_subparsers(dest="comando", required=True)
+    sub.add_parser("planos", help="mostra os planos e os clientes configurados")
+    p_bench = sub.add_parser("bench", help="custo por requisição do limitador")
+    p_bench.add_argument("--quantidade", type=int, default=1_000_000)
+    p_bench.add_argument("--clientes", type=int, default=100)
+    p_bench.add_argument("--compartilhado", action="store_true", help="usa a tabela em memória compartilhada")
+    args = parser.parse_args()
+
+    planos = carregar_planos()
+    if args.comando == "planos":
+        for plano in planos.values():
+            print(f"{plano.nome:<12} taxa={plano.taxa:g}/s rajada={plano.rajada:g} concorrencia={plano.concorrencia}")
+        for cnpj, nome in carregar_clientes(LIMITE_TAXA_CLIENTES, planos).items():
+            print(f"{cnpj} → {nome}")
+        return
+
+    # plano sem limite efetivo: mede só o custo do caminho feliz
+    ilimitado = {PLANO_PADRAO: Plano(PLANO_PADRAO, 1e12, 1e12, 1 << 30)}
+    tabela = None
+    if args.compartilhado:
+        caminho = os.path.join(tempfile.gettempdir(), f"limite_taxa_bench_{os.getpid()}")
+        tabela = TabelaCompartilhada(caminho, max(LIMITE_TAXA_SLOTS, args.clientes * 2))
+    try:
+        _bench(LimitadorClientes(ilimitado, {}, tabela=tabela), args.quantidade, args.clientes)
+    finally:
+        if tabela is not None:
+            os.remove(caminho)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,9 +1,13 @@
 from httpx import Limits, Timeout
+from collections import Counter
+from gerador_eventos import GeradorEventos
 import asyncio
 import httpx
+import logging
 import jwt
 import os
 import time
+import math
 import argparse
 from itertools import cycle
 
@@ -67,8 +71,32 @@ async def send_event(client, url, token, payload):
     return await client.post(url, json=payload, headers=headers)
 
 
-async def run_load(count, concurrency):
-    url = "http://127.0.0.1:8000/validar"
+def percentil(valores, p):
+    """Percentil p (0-100) por nearest-rank de uma lista de latências."""
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    k = max(0, min(len(ordenados) - 1, math.ceil(p / 100 * len(ordenados)) - 1))
+    return ordenados[k]
+
+
+async def wait_ready(client, base_url, timeout=120.0):
+    """Aguarda `/ready` responder 200 e retorna o tempo de espera em segundos."""
+    start = time.time()
+    while time.time() - start < timeout:
+        try:
+            r = await client.get(f"{base_url}/ready")
+            if r.status_code == 200:
+                return time.time() - start
+        except httpx.HTTPError:
+            pass
+        await asyncio.sleep(0.2)
+    raise TimeoutError("API não ficou pronta a tempo")
+
+
+async def run_load(count, concurrency, esperar_pronto=False, gerador=None):
+    base_url = "http://127.0.0.1:8000"
+    url = f"{base_url}/validar"
     print("Iniciando validação…")
     secret = os.getenv('JWT_SECRET', 'mysecret')
     token = jwt.encode({'cnpj': '09524519000143'}, secret, algorithm='HS256')
@@ -77,18 +105,33 @@ async def run_load(count, concurrency):
     limits = Limits(max_connections=concurrency, max_keepalive_connections=concurrency//2)
     timeout = Timeout(connect=10.0, read=30.0, write=30.0, pool=60.0)
 
+    latencias = []
+    # regra injetada pelo gerador (None = evento válido), para conferir os 422
+    esperados = {}
+
     async with httpx.AsyncClient(limits=limits, timeout=timeout) as client:
+        if esperar_pronto:
+            espera = await wait_ready(client, base_url)
+            print(f"API pronta após {espera:.2f}s")
+            start = time.time()
+
         sem = asyncio.Semaphore(concurrency)
         event_cycle = cycle(['R2010', 'R4010', 'R4020'])
 
         async def bounded_send(i):
             async with sem:
                 evt = next(event_cycle)
-                payload = generate_payload(evt, i)
+                if gerador is None:
+                    payload = generate_payload(evt, i)
+                else:
+                    payload, esperados[i] = gerador.evento(evt)
+                t0 = time.perf_counter()
                 try:
                     return await send_event(client, url, token, payload)
                 except Exception:
                     return None
+                finally:
+                    latencias.append((time.perf_counter() - t0) * 1000)
 
         tasks = [asyncio.create_task(bounded_send(i)) for i in range(count)]
         responses = await asyncio.gather(*tasks)
@@ -97,7 +140,16 @@ async def run_load(count, concurrency):
     succ = sum(1 for r in responses if getattr(r, 'status_code', 0) == 200)
     fail = count - succ
     print(f"Total: {count} | Sucessos: {succ} | Falhas: {fail}")
+    status = Counter(getattr(r, 'status_code', 'erro') for r in responses)
+    print("Status: " + ", ".join(f"{k}={v}" for k, v in sorted(status.items(), key=str)))
+    if gerador is not None:
+        invalidos = [i for i, regra in esperados.items() if regra]
+        acertos = sum(1 for i in invalidos if getattr(responses[i], 'status_code', 0) == 422)
+        print(f"Inválidos injetados: {len(invalidos)} | rejeitados com 422: {acertos} | semente={gerador.semente}")
     print(f"Tempo: {duration:.2f}s | {count/duration:.2f} req/s")
+    print(f"Latência (ms): p50={percentil(latencias, 50):.1f} "
+          f"p95={percentil(latencias, 95):.1f} p99={percentil(latencias, 99):.1f} "
+          f"máx={max(latencias, default=0):.1f}")
 
 
 def main():
@@ -106,8 +158,18 @@ def main():
                         help="Total de eventos a enviar")
     parser.add_argument('--concurrency', type=int, default=10,
                         help="Número de requisições paralelas")
+    parser.add_argument('--esperar-pronto', action='store_true',
+                        help="Aguarda /ready antes de iniciar (mede o cold-start após deploy)")
+    parser.add_argument('--templates', action='store_true',
+                        help="Usa os templates fixos (NumDoc repetido entre execuções) em vez do gerador_eventos")
+    parser.add_argument('--semente', type=int,
+                        help="Semente do gerador (padrão: aleatória, então cada execução gera eventos novos)")
+    parser.add_argument('--taxa-invalidos', type=float, default=0.0,
+                        help="Fração de eventos com uma regra violada (espera-se 422)")
     args = parser.parse_args()
-    asyncio.run(run_load(args.count, args.concurrency))
+    logging.getLogger().setLevel(logging.WARNING)   # os validadores ligam DEBUG no import
+    gerador = None if args.templates else GeradorEventos(args.semente, args.taxa_invalidos)
+    asyncio.run(run_load(args.count, args.concurrency, args.esperar_pronto, gerador))
 
 
 if __name__ == "__main__":
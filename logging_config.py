@@ -1,7 +1,417 @@
-import os
-import logging
-from logging.handlers import TimedRotatingFileHandler
+"""
+Configuração dos logs de auditoria (`audit.log`) e de erros (`errors.log`).
+
+ - Rotação por tempo (meia-noite) e também por tamanho (`LOG_MAX_BYTES`): num
+   dia movimentado o arquivo vira `audit.log.2025-04-29.1`, `.2`, … em vez de
+   crescer até gigabytes. A retenção (`backup_count`) conta dias, não arquivos.
+ - Vários workers (`uvicorn --workers N`) escrevem no mesmo arquivo, cada um com
+   o seu handler. A rotação é decidida sob `flock` em `.<arquivo>.lock`, que
+   guarda até que período já se rotacionou: só um worker renomeia, os demais
+   veem o arquivo já trocado e apenas o reabrem. Antes de cada registro o
+   handler compara o inode do seu arquivo aberto com o do caminho e reabre se
+   outro worker rotacionou; a compressão espera `LOG_COMPRIMIR_ATRASO_S` para
+   que escritas em voo no arquivo renomeado terminem antes do gzip.
+ - Arquivos rotacionados são comprimidos com gzip por uma thread de fundo
+   (`CompactadorLogs`), nunca na thread que grava o log. Ao rotacionar, o
+   handler cria `<arquivo>.pendente.<pid>` ao lado do rotacionado, apagado
+   quando o `.gz` fica pronto; no startup só os arquivos com essa marca
+   (deixados por um processo que morreu) são retomados, por um único worker,
+   que renomeia a marca para o seu pid. Rotacionados por outras ferramentas ou
+   copiados para a pasta ficam como estão.
+ - Com `LOG_ASSINCRONO=1` (padrão), as requisições só enfileiram o registro
+   (`QueueHandler`); formatação e escrita em disco ficam numa thread
+   (`QueueListener`). O `trace_id` é lido antes de enfileirar.
+ - `LOG_AUDITORIA_FORMATO=colunar` troca o `audit.log` JSON por `audit.col`:
+   blocos de até `LOG_BLOCO_REGISTROS` registros, com cada campo numa coluna
+   (tempos em delta, níveis, nomes, mensagens, trace_id) e o bloco comprimido
+   com zlib. Um bloco ainda em memória se perde se o processo morrer; leia
+   os arquivos com `python logging_config.py ler logs/audit.col*`, que emite
+   as mesmas linhas JSON do formato padrão.
+"""
+from logging.handlers import QueueHandler, QueueListener, TimedRotatingFileHandler
 from pythonjsonlogger.json import JsonFormatter
+from tracing import TraceIdFilter
+from array import array
+from datetime import datetime
+import argparse
+import atexit
+import fcntl
+import glob
+import gzip
+import json
+import logging
+import os
+import queue
+import re
+import shutil
+import struct
+import sys
+import threading
+import time
+import zlib
+
+# ─── Configuração ────────────────────────────
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", 256 * 1024 * 1024))          # rotaciona antes da meia-noite acima disso (0 desliga)
+LOG_COMPRIMIR = os.getenv("LOG_COMPRIMIR", "1") == "1"                        # gzip dos arquivos rotacionados, em segundo plano
+LOG_GZIP_NIVEL = int(os.getenv("LOG_GZIP_NIVEL", 6))
+LOG_COMPRIMIR_ATRASO_S = float(os.getenv("LOG_COMPRIMIR_ATRASO_S", 2))       # espera após rotacionar antes do gzip
+LOG_ASSINCRONO = os.getenv("LOG_ASSINCRONO", "1") == "1"                      # escrita em disco numa thread (QueueListener)
+LOG_AUDITORIA_FORMATO = os.getenv("LOG_AUDITORIA_FORMATO", "json")           # "json" ou "colunar"
+LOG_BLOCO_REGISTROS = int(os.getenv("LOG_BLOCO_REGISTROS", 4096))             # registros por bloco do formato colunar
+LOG_BLOCO_MAX_S = float(os.getenv("LOG_BLOCO_MAX_S", 5))                      # idade máxima de um bloco colunar antes de gravar
+
+_MAGICO_COLUNAR = b"AUDCOL1\n"
+_CABECALHO_BLOCO = struct.Struct("<II")      # nº de registros, bytes comprimidos
+
+
+# ─── Compressão em segundo plano ─────────────
+class CompactadorLogs:
+    """Thread única que comprime (gzip) os arquivos rotacionados enfileirados."""
+
+    def __init__(self, nivel: int = LOG_GZIP_NIVEL, atraso_s: float = LOG_COMPRIMIR_ATRASO_S):
+        self.nivel = nivel
+        self.atraso_s = atraso_s
+        self._fila = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def enfileirar(self, caminho: str) -> None:
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name="compactador-logs", daemon=True)
+                self._thread.start()
+        self._fila.put((time.monotonic() + self.atraso_s, caminho))
+
+    def aguardar(self) -> None:
+        """Bloqueia até esvaziar a fila (testes, benchmark e encerramento)."""
+        self._fila.join()
+
+    def _loop(self) -> None:
+        while True:
+            quando, caminho = self._fila.get()
+            espera = quando - time.monotonic()
+            if espera > 0:
+                time.sleep(espera)     # outros workers ainda podem ter uma escrita em voo no arquivo renomeado
+            try:
+                self.comprimir(caminho)
+            except OSError as e:
+                print(f"[logging] Falha ao comprimir {caminho}: {e!r}", file=sys.stderr)
+            finally:
+                self._fila.task_done()
+
+    def comprimir(self, caminho: str) -> None:
+        if os.path.exists(caminho):
+            temporario = caminho + ".gz.tmp"
+            with open(caminho, "rb") as origem, gzip.open(temporario, "wb", compresslevel=self.nivel) as destino:
+                shutil.copyfileobj(origem, destino, 1024 * 1024)
+            os.replace(temporario, caminho + ".gz")
+            os.remove(caminho)
+        _remover_marca(caminho)
+
+
+_SUFIXO_PENDENTE = ".pendente"     # marca de arquivo rotacionado por este handler e ainda não comprimido
+
+
+def _marca(caminho: str) -> str:
+    """Marca `.pendente.<pid>`: o arquivo é deste processo até virar `.gz`."""
+    return f"{caminho}{_SUFIXO_PENDENTE}.{os.getpid()}"
+
+
+def _remover_marca(caminho: str) -> None:
+    for marca in glob.glob(glob.escape(caminho + _SUFIXO_PENDENTE) + "*"):
+        try:
+            os.remove(marca)
+        except FileNotFoundError:
+            pass
+
+
+def _reivindicar_marca(caminho: str) -> bool:
+    """Assume a compressão pendente de `caminho` se o processo que a marcou morreu."""
+    import psutil
+    for marca in glob.glob(glob.escape(caminho + _SUFIXO_PENDENTE) + "*"):
+        pid = marca[len(caminho + _SUFIXO_PENDENTE) + 1:]      # vazio: marca sem dono
+        if pid and (not pid.isdigit() or int(pid) == os.getpid() or psutil.pid_exists(int(pid))):
+            continue
+        try:
+            os.rename(marca, _marca(caminho))
+        except FileNotFoundError:
+            continue      # outro worker reivindicou primeiro
+        return True
+    return False
+
+
+compactador = CompactadorLogs()
+
+
+# ─── Rotação por tempo e tamanho ─────────────
+class RotacaoTempoTamanhoHandler(TimedRotatingFileHandler):
+    """
+    TimedRotatingFileHandler que também rotaciona ao passar de `max_bytes`.
+    Nomes: `<arquivo>.<período>` e, nas rotações extras do mesmo período,
+    `<arquivo>.<período>.<n>`; `.gz` quando comprimidos.
+    """
+
+    def __init__(self, filename, when="midnight", interval=1, backupCount=0, encoding=None,
+                 max_bytes: int = LOG_MAX_BYTES, comprimir: bool = LOG_COMPRIMIR):
+        self.max_bytes = max_bytes
+        self.comprimir = comprimir
+        super().__init__(filename, when=when, interval=interval, backupCount=backupCount, encoding=encoding)
+        self._re_rotacionado = re.compile(rf"^{re.escape(os.path.basename(self.baseFilename))}\.([^.]+)(?:\.(\d+))?(\.gz)?$")
+        # oculto, para não ser confundido com um rotacionado `<arquivo>.<período>`
+        self._caminho_trava = os.path.join(os.path.dirname(self.baseFilename),
+                                           f".{os.path.basename(self.baseFilename)}.lock")
+        if comprimir:
+            # só o que um handler rotacionou e não chegou a comprimir (marca de um processo morto)
+            for caminho, _ in self._rotacionados():
+                if not caminho.endswith(".gz") and _reivindicar_marca(caminho):
+                    compactador.enfileirar(caminho)
+
+    def _trocado(self) -> bool:
+        """True se outro worker rotacionou: o caminho não é mais o arquivo que este handler tem aberto."""
+        try:
+            return os.stat(self.baseFilename).st_ino != os.fstat(self.stream.fileno()).st_ino
+        except FileNotFoundError:
+            return True
+
+    def _reabrir(self) -> None:
+        self.stream.close()
+        self.stream = self._open()
+
+    def shouldRollover(self, record) -> bool:
+        if self.stream is None:
+            self.stream = self._open()
+        elif self._trocado():
+            self._reabrir()
+        if int(time.time()) >= self.rolloverAt:
+            return True
+        if self.max_bytes > 0:
+            # fstat em vez de tell(): o tell() de arquivo texto é caro, e o StreamHandler dá flush a cada registro
+            return os.fstat(self.stream.fileno()).st_size >= self.max_bytes
+        return False
+
+    def _rotacionados(self) -> list:
+        """[(caminho, período)] dos arquivos rotacionados deste log."""
+        diretorio = os.path.dirname(self.baseFilename)
+        encontrados = []
+        for nome in os.listdir(diretorio):
+            m = self._re_rotacionado.match(nome)
+            if m:
+                encontrados.append((os.path.join(diretorio, nome), m.group(1)))
+        return encontrados
+
+    def _rotacionar(self, trava, agora: int) -> None:
+        """
+        Sob a trava entre workers: renomeia o arquivo só se nenhum outro worker já o
+        fez — por tempo, se o período ainda não consta na trava; por tamanho, se o
+        arquivo no caminho ainda está acima de `max_bytes`.
+        """
+        trava.seek(0)
+        conteudo = trava.read().strip()
+        rotacionado_ate = int(conteudo) if conteudo.isdigit() else 0
+        if agora >= self.rolloverAt:
+            rotacionar = rotacionado_ate < self.rolloverAt
+        else:
+            rotacionar = self.max_bytes > 0 and os.path.exists(self.baseFilename) \
+                and os.path.getsize(self.baseFilename) >= self.max_bytes
+        if not rotacionar:
+            return
+
+        inicio_periodo = self.rolloverAt - self.interval
+        periodo = time.strftime(self.suffix, time.gmtime(inicio_periodo) if self.utc else time.localtime(inicio_periodo))
+        if os.path.exists(self.baseFilename) and os.path.getsize(self.baseFilename) > 0:
+            destino = self._destino(periodo)
+            os.rename(self.baseFilename, destino)
+            if self.comprimir:
+                open(_marca(destino), "w").close()
+                compactador.enfileirar(destino)
+        if agora >= self.rolloverAt:
+            trava.seek(0)
+            trava.truncate()
+            trava.write(str(self.rolloverAt))
+            trava.flush()
+
+        if self.backupCount > 0:
+            periodos = sorted({p for _, p in self._rotacionados()})
+            antigos = set(periodos[:-self.backupCount]) if len(periodos) > self.backupCount else set()
+            for caminho, p in self._rotacionados():
+                if p in antigos:
+                    os.remove(caminho)
+                    _remover_marca(caminho)
+
+    def _destino(self, periodo: str) -> str:
+        n = 0
+        while True:
+            destino = f"{self.baseFilename}.{periodo}" + (f".{n}" if n else "")
+            if not os.path.exists(destino) and not os.path.exists(destino + ".gz"):
+                return destino
+            n += 1
+
+    def doRollover(self) -> None:
+        if self.stream:
+            self.stream.close()
+            self.stream = None
+        agora = int(time.time())
+        with open(self._caminho_trava, "a+") as trava:
+            fcntl.flock(trava, fcntl.LOCK_EX)       # liberado ao fechar
+            self._rotacionar(trava, agora)
+
+        if agora >= self.rolloverAt:
+            proximo = self.computeRollover(agora)
+            while proximo <= agora:
+                proximo += self.interval
+            self.rolloverAt = proximo
+        if not self.delay:
+            self.stream = self._open()
+
+
+# ─── Formato colunar da auditoria ────────────
+def _coluna_textos(textos: list) -> bytes:
+    dados = [t.encode("utf-8") for t in textos]
+    return array("I", map(len, dados)).tobytes() + b"".join(dados)
+
+
+def _ler_coluna_textos(buffer: memoryview, pos: int, n: int):
+    tamanhos = array("I")
+    tamanhos.frombytes(buffer[pos:pos + 4 * n])
+    pos += 4 * n
+    textos = []
+    for t in tamanhos:
+        textos.append(bytes(buffer[pos:pos + t]).decode("utf-8"))
+        pos += t
+    return textos, pos
+
+
+class AuditoriaColunarHandler(RotacaoTempoTamanhoHandler):
+    """
+    Grava os registros em blocos colunares comprimidos (ver docstring do módulo).
+    Bloco: cabeçalho (n, bytes) + zlib(tempos int64 em ms: o 1º absoluto, os
+    demais em delta | níveis u8 | nomes | mensagens | trace_ids), textos como
+    tamanhos u32 seguidos dos bytes UTF-8.
+    """
+
+    def __init__(self, filename, registros_bloco: int = LOG_BLOCO_REGISTROS, max_idade_s: float = LOG_BLOCO_MAX_S,
+                 **kwargs):
+        kwargs["comprimir"] = False    # os blocos já saem comprimidos
+        self.registros_bloco = registros_bloco
+        self.max_idade_s = max_idade_s
+        self._bloco = []
+        self._bloco_inicio = 0.0
+        super().__init__(filename, **kwargs)
+
+    def _open(self):
+        stream = open(self.baseFilename, "ab")
+        if stream.tell() == 0:
+            stream.write(_MAGICO_COLUNAR)
+        return stream
+
+    def emit(self, record) -> None:
+        try:
+            if not self._bloco:
+                self._bloco_inicio = time.monotonic()
+            self._bloco.append((int(record.created * 1000), record.levelno, record.name,
+                                record.getMessage(), getattr(record, "trace_id", None) or ""))
+            if len(self._bloco) >= self.registros_bloco or time.monotonic() - self._bloco_inicio >= self.max_idade_s:
+                self._gravar_bloco()
+        except Exception:
+            self.handleError(record)
+
+    def handle(self, record):
+        # a rotação só acontece entre blocos: o bloco pendente vai para o arquivo que está fechando
+        rv = self.filter(record)
+        if rv:
+            self.acquire()
+            try:
+                if self.shouldRollover(record):
+                    self._gravar_bloco()
+                    self.doRollover()
+                self.emit(record)
+            finally:
+                self.release()
+        return rv
+
+    def _gravar_bloco(self) -> None:
+        if not self._bloco:
+            return
+        tempos, niveis, nomes, mensagens, traces = zip(*self._bloco)
+        deltas = array("q", [tempos[0]] + [b - a for a, b in zip(tempos, tempos[1:])])
+        corpo = zlib.compress(
+            deltas.tobytes() + bytes(niveis) + _coluna_textos(nomes) + _coluna_textos(mensagens)
+            + _coluna_textos(traces),
+            6,
+        )
+        if self.stream is None:
+            self.stream = self._open()
+        self.stream.write(_CABECALHO_BLOCO.pack(len(self._bloco), len(corpo)) + corpo)
+        self.stream.flush()
+        self._bloco = []
+
+    def flush(self) -> None:
+        self.acquire()
+        try:
+            self._gravar_bloco()
+        finally:
+            self.release()
+
+    def close(self) -> None:
+        self.flush()
+        super().close()
+
+
+def ler_auditoria_colunar(caminho: str):
+    """Gera os registros de um arquivo colunar (aceita `.gz`) como dicts no formato do JSON padrão."""
+    abrir = gzip.open if caminho.endswith(".gz") else open
+    ultimo_segundo = texto_segundo = None
+    with abrir(caminho, "rb") as f:
+        if f.read(len(_MAGICO_COLUNAR)) != _MAGICO_COLUNAR:
+            raise ValueError(f"{caminho} não é um log de auditoria colunar")
+        while True:
+            cabecalho = f.read(_CABECALHO_BLOCO.size)
+            if len(cabecalho) < _CABECALHO_BLOCO.size:
+                return
+            n, tamanho = _CABECALHO_BLOCO.unpack(cabecalho)
+            comprimido = f.read(tamanho)
+            if len(comprimido) < tamanho:
+                return          # bloco truncado (processo interrompido durante a escrita)
+            buffer = memoryview(zlib.decompress(comprimido))
+            deltas = array("q")
+            deltas.frombytes(buffer[:8 * n])
+            pos = 8 * n
+            niveis = buffer[pos:pos + n]
+            nomes, pos = _ler_coluna_textos(buffer, pos + n, n)
+            mensagens, pos = _ler_coluna_textos(buffer, pos, n)
+            traces, pos = _ler_coluna_textos(buffer, pos, n)
+            ms = 0
+            for i in range(n):
+                ms += deltas[i]
+                segundo = ms // 1000
+                if segundo != ultimo_segundo:
+                    ultimo_segundo = segundo
+                    texto_segundo = datetime.fromtimestamp(segundo).strftime("%Y-%m-%d %H:%M:%S")
+                yield {
+                    "asctime": f"{texto_segundo},{ms % 1000:03d}",
+                    "levelname": logging.getLevelName(niveis[i]),
+                    "name": nomes[i],
+                    "message": mensagens[i],
+                    "trace_id": traces[i] or None,
+                }
+
+
+class _FilaHandler(QueueHandler):
+    """QueueHandler que só resolve a mensagem (sem formatar nem copiar o registro) antes de enfileirar."""
+
+    def prepare(self, record):
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            # o traceback não atravessa a fila: vira texto aqui, como no QueueHandler padrão
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+def _parar_listener(listener: QueueListener) -> None:
+    if listener._thread is not None:
+        listener.stop()
 
 
 def configure_logging(
@@ -9,13 +419,19 @@ def configure_logging(
     audit_filename: str = "audit.log",
     error_filename: str = "errors.log",
     backup_count: int = 30,
-    log_level: str = "INFO"
+    log_level: str = "INFO",
+    max_bytes: int = LOG_MAX_BYTES,
+    assincrono: bool = LOG_ASSINCRONO,
+    formato_auditoria: str = LOG_AUDITORIA_FORMATO,
 ):
     """
     Prepara o logger raiz para:
-      - gravar logs INFO em `logs/audit.log` (rotaciona à meia-noite, guarda 30 dias)
+      - gravar logs INFO em `logs/audit.log` (rotaciona à meia-noite ou ao passar de `max_bytes`, guarda 30 dias)
       - gravar logs WARNING+ em `logs/errors.log` (idem)
-      - usar formato JSON com timestamps e acentuação
+      - usar formato JSON com timestamps e acentuação (ou colunar na auditoria, ver `formato_auditoria`)
+      - incluir o `trace_id` da requisição em cada registro (ver tracing.py)
+      - comprimir os arquivos rotacionados e, com `assincrono`, escrever em disco fora da thread da requisição
+    Retorna o QueueListener (ou None no modo síncrono).
     """
 
     # 1) garante que a pasta de logs exista
@@ -28,14 +444,21 @@ def configure_logging(
     )
 
     # 3) handler de auditoria (só INFO)
-    audit_path = os.path.join(log_dir, audit_filename)
-    audit_handler = TimedRotatingFileHandler(
-        filename=audit_path,
-        when="midnight",
-        interval=1,
-        backupCount=backup_count,
-        encoding="utf-8"
-    )
+    if formato_auditoria == "colunar":
+        audit_handler = AuditoriaColunarHandler(
+            filename=os.path.join(log_dir, os.path.splitext(audit_filename)[0] + ".col"),
+            backupCount=backup_count,
+            max_bytes=max_bytes,
+        )
+    else:
+        audit_handler = RotacaoTempoTamanhoHandler(
+            filename=os.path.join(log_dir, audit_filename),
+            when="midnight",
+            interval=1,
+            backupCount=backup_count,
+            encoding="utf-8",
+            max_bytes=max_bytes,
+        )
     audit_handler.setLevel(logging.INFO)
     # só deixa passar exatamente INFO
     audit_handler.addFilter(lambda record: record.levelno == logging.INFO)
@@ -43,12 +466,13 @@ def configure_logging(
 
     # 4) handler de erros (WARNING ou superior)
     error_path = os.path.join(log_dir, error_filename)
-    error_handler = TimedRotatingFileHandler(
+    error_handler = RotacaoTempoTamanhoHandler(
         filename=error_path,
         when="midnight",
         interval=1,
         backupCount=backup_count,
-        encoding="utf-8"
+        encoding="utf-8",
+        max_bytes=max_bytes,
     )
     error_handler.setLevel(logging.WARNING)
     error_handler.setFormatter(formatter)
@@ -56,5 +480,45 @@ def configure_logging(
     # 5) configura o logger raiz
     root = logging.getLogger()
     root.setLevel(log_level.upper())
-    root.addHandler(audit_handler)
-    root.addHandler(error_handler)
+    trace_filter = TraceIdFilter()
+    if not assincrono:
+        audit_handler.addFilter(trace_filter)
+        error_handler.addFilter(trace_filter)
+        root.addHandler(audit_handler)
+        root.addHandler(error_handler)
+        return None
+
+    # 6) modo assíncrono: a requisição só enfileira; o trace_id (contextvar) é lido aqui, antes da fila
+    fila = queue.SimpleQueue()
+    fila_handler = _FilaHandler(fila)
+    fila_handler.setLevel(logging.INFO)
+    fila_handler.addFilter(trace_filter)
+    listener = QueueListener(fila, audit_handler, error_handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(_parar_listener, listener)
+    root.addHandler(fila_handler)
+    return listener
+
+
+# ─── CLI ─────────────────────────────────────
+def main():
+    parser = argparse.ArgumentParser(description="Leitura dos logs de auditoria colunares (audit.col)")
+    sub = parser.add_subparsers(dest="comando", required=True)
+    p = sub.add_parser("ler", help="Converte arquivos .col (ou .col.*.gz) em linhas JSON")
+    p.add_argument("arquivos", nargs="+")
+    p.add_argument("--filtro", help="Só mensagens que contêm este texto")
+    args = parser.parse_args()
+
+    saida = sys.stdout
+    try:
+        for caminho in args.arquivos:
+            for reg in ler_auditoria_colunar(caminho):
+                if args.filtro and args.filtro not in reg["message"]:
+                    continue
+                saida.write(json.dumps(reg, ensure_ascii=False) + "\n")
+    except BrokenPipeError:
+        pass
+
+
+if __name__ == "__main__":
+    main()
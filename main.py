@@ -1,15 +1,33 @@
 from fastapi import FastAPI, HTTPException, Request, Depends, Header
 from starlette.middleware.cors import CORSMiddleware
+from starlette.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from contextlib import asynccontextmanager
 from pymongo.errors import DuplicateKeyError
 from logging_config import configure_logging
 from starlette.middleware import Middleware
-from eventos.validador_4020 import Evt4020
-from eventos.validador_2010 import Evt2010
-from eventos.validador_4010 import Evt4010
+from warmup import executar_aquecimento, preparar_registro
+from admissao import AdmissaoMiddleware
+from tracing import TracingMiddleware, TRACE_HABILITADO
+from profiler import PerfiladorMiddleware, PerfiladorOcupado, perfilar
+from compressao import CompressaoRespostaMiddleware, DescompressaoMiddleware
+from clientes import registro, CLIENTES_HABILITADO, EstabelecimentoNaoAutorizado
+from replay_trafego import captura
+from agregador_erros import agregador, campo_do_erro, principais_regras
+from limite_taxa import limitador_clientes, LIMITE_TAXA_HABILITADO
+import jobs
 from jwt.exceptions import PyJWTError
 from pydantic import ValidationError
-from database import save_if_valid
+from eventos.modelos import MODELOS
+from database import save_if_valid, inserir_lote, verificar_conexao
+from circuit_breaker import CircuitoAbertoError
+from exportacao import FORMATOS, exportar_eventos, periodo_para_int
+from journal import journal
+import metricas
+import tracing
+import asyncio
 import logging
+import hmac
+import math
 import jwt
 import os
 
@@ -36,17 +54,72 @@ middleware = [
         allow_origins=["*"],
         allow_methods=["POST", "GET"],
         allow_headers=["*"],
-    )
+    ),
+    # gzip/zstd negociado nas respostas grandes (exportações, resultados em lote)
+    Middleware(CompressaoRespostaMiddleware),
+    # controle de admissão: 503 + Retry-After quando o worker já está no limite
+    Middleware(AdmissaoMiddleware),
+    # corpos gzip/zstd descomprimidos em streaming, com limite contra zip bomb (413)
+    Middleware(DescompressaoMiddleware),
+    # depois da admissão: requisições descartadas não geram trace
+    Middleware(TracingMiddleware),
+    # só conta requisições enquanto houver uma sessão de /admin/profiler
+    Middleware(PerfiladorMiddleware),
 ]
 
+if TRACE_HABILITADO:
+    for _modelo in MODELOS.values():
+        tracing.instrumentar_validadores(_modelo)
+
+
+@asynccontextmanager
+async def lifespan(app_: FastAPI):
+    """
+        Dispara o aquecimento do worker em segundo plano: `/health` responde
+        imediatamente, `/ready` só depois que o aquecimento terminar. O índice de
+        CNPJ é aberto antes, de forma síncrona: se falhar, a inicialização falha.
+        Também inicia o reprocessamento do journal local (eventos gravados com o Mongo fora)
+        e, com CLIENTES_HABILITADO, a atualização do registro de clientes.
+        A descarga periódica dos erros de validação agregados roda em todos os workers,
+        assim como os `JOBS_WORKERS` workers de jobs assíncronos (ver jobs.py).
+    """
+    app_.state.prontidao = {"pronto": False, "etapas": {}}
+    preparar_registro(app_.state.prontidao)
+    tarefas = [
+        asyncio.create_task(executar_aquecimento(app_.state.prontidao)),
+        asyncio.create_task(journal.loop_reprocessamento(inserir_lote, verificar_conexao)),
+        asyncio.create_task(agregador.loop_descarga()),
+        asyncio.create_task(jobs.executar_workers()),
+    ]
+    if CLIENTES_HABILITADO:
+        tarefas.append(asyncio.create_task(registro.loop_atualizacao()))
+    yield
+    for tarefa in tarefas:
+        tarefa.cancel()
+
+
 app = FastAPI(
     title="API de Validação EFD‑Reinf",
     version="1.0",
     description="Endpoints para validar eventos R4020, R2010 e R4010",
     middleware=middleware,
+    lifespan=lifespan,
 )
 
 
+@app.exception_handler(CircuitoAbertoError)
+async def circuito_aberto_handler(request: Request, exc: CircuitoAbertoError):
+    """
+        Banco indisponível e sem fallback: 503 imediato com o tempo até a próxima sonda.
+    """
+    logger.warning(f"{exc}, respondendo 503")
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Banco de dados indisponível, tente novamente."},
+        headers={"Retry-After": str(max(1, math.ceil(exc.retry_after)))},
+    )
+
+
 @app.get("/health", tags=["Health"])
 async def health_check():
     """
@@ -55,6 +128,25 @@ async def health_check():
     return {"status": "ok"}
 
 
+@app.get("/ready", tags=["Health"])
+async def readiness_check(request: Request):
+    """
+        Prontidão do worker: 503 até o aquecimento (tabelas, validadores e pool) terminar.
+    """
+    prontidao = request.app.state.prontidao
+    if not prontidao["pronto"]:
+        return JSONResponse(status_code=503, content={"status": "aquecendo", "etapas": prontidao["etapas"]})
+    return {"status": "pronto", "etapas": prontidao["etapas"], "duracao_ms": prontidao["duracao_ms"]}
+
+
+@app.get("/metrics", tags=["Health"], response_class=PlainTextResponse)
+async def metrics():
+    """
+        Métricas deste worker no formato texto do Prometheus.
+    """
+    return PlainTextResponse(metricas.exportar(), media_type="text/plain; version=0.0.4")
+
+
 def get_client_cnpj_from_jwt(authorization: str = Header(..., description="Bearer <token JWT>")) -> str:
     """
         Extrai e valida o JWT do header, retorna o claim 'cnpj'
@@ -68,12 +160,13 @@ def get_client_cnpj_from_jwt(authorization: str = Header(..., description="Beare
     try:
         secret = os.getenv("JWT_SECRET")
         logger.debug("Usando secret=%s", secret)
-        decoded = jwt.decode(
-            token,
-            secret,
-            algorithms=["HS256"],
-            options={"verify_aud": False}
-        )
+        with tracing.span("auth"):
+            decoded = jwt.decode(
+                token,
+                secret,
+                algorithms=["HS256"],
+                options={"verify_aud": False}
+            )
         logger.debug("Token decodificado: %s", decoded)
     except PyJWTError:
         raise HTTPException(401, "Falha ao decodificar JWT")
@@ -84,13 +177,77 @@ def get_client_cnpj_from_jwt(authorization: str = Header(..., description="Beare
     return cnpj
 
 
+async def cliente_com_limite(request: Request, client_cnpj: str = Depends(get_client_cnpj_from_jwt)):
+    """
+        Cliente do JWT passando pelo limite de taxa e de concorrência do seu plano
+        (limite_taxa.py): 429 com Retry-After quando estoura. A vaga é devolvida
+        ao fim da dependência; nas respostas em streaming (`streaming_com_limite`)
+        ela passa para a resposta e só volta quando ela termina, porque no FastAPI
+        0.106–0.117 a saída das dependências com yield roda antes do corpo ser enviado.
+    """
+    if not LIMITE_TAXA_HABILITADO:
+        yield client_cnpj
+        return
+    espera = limitador_clientes.adquirir(client_cnpj)
+    if espera is not None:
+        logger.debug(f"[limite_taxa] 429 para o cliente {client_cnpj} (Retry-After {espera}s)")
+        raise HTTPException(429, "Limite de requisições do cliente excedido, tente novamente.",
+                            headers={"Retry-After": str(espera)})
+    request.state.vaga_limite = client_cnpj
+    try:
+        yield client_cnpj
+    finally:
+        if request.state.vaga_limite is not None:
+            limitador_clientes.liberar(client_cnpj)
+
+
+class _StreamingComVaga(StreamingResponse):
+    """
+        StreamingResponse que devolve a vaga do limitador quando a resposta ASGI
+        termina, tenha o corpo começado ou não (cliente que desconecta antes do
+        `http.response.start`, `send` que falha).
+    """
+
+    def __init__(self, corpo, cliente: str, **kwargs):
+        super().__init__(corpo, **kwargs)
+        self.cliente = cliente
+
+    async def __call__(self, scope, receive, send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            limitador_clientes.liberar(self.cliente)
+
+
+def streaming_com_limite(request: Request, corpo, **kwargs) -> StreamingResponse:
+    """StreamingResponse que assume a vaga de `cliente_com_limite` e a devolve quando a resposta termina."""
+    cliente = getattr(request.state, "vaga_limite", None)
+    if cliente is None:
+        return StreamingResponse(corpo, **kwargs)
+    request.state.vaga_limite = None
+    return _StreamingComVaga(corpo, cliente, **kwargs)
+
+
+def verificar_token_admin(x_admin_token: str = Header(..., description="Token de administração (ADMIN_TOKEN)")) -> None:
+    """
+        Libera as rotas /admin apenas com o token de ADMIN_TOKEN; sem ADMIN_TOKEN configurado, elas ficam desligadas.
+    """
+    esperado = os.getenv("ADMIN_TOKEN")
+    if not esperado:
+        raise HTTPException(404, "Not Found")
+    if not hmac.compare_digest(x_admin_token.encode(), esperado.encode()):
+        logger.warning("Tentativa de acesso a rota admin com token inválido")
+        raise HTTPException(403, "Token de administração inválido")
+
+
 @app.post("/validar", tags=["Validação Única"])
-async def validar_evento(request: Request, client_cnpj: str = Depends(get_client_cnpj_from_jwt)):
+async def validar_evento(request: Request, client_cnpj: str = Depends(cliente_com_limite)):
     """
     Rota que identifica e valida o evento EFD‑Reinf.
     Espera um JSON com a chave "evento" para determinar o tipo.
     """
-    body = await request.json()
+    with tracing.span("parse"):
+        body = await request.json()
     tipo_evento = body.get("TpEvento")
 
     if not tipo_evento:
@@ -99,28 +256,43 @@ async def validar_evento(request: Request, client_cnpj: str = Depends(get_client
         raise HTTPException(status_code=400, detail=mensagem)
 
     logger.info(f"Recebido evento {tipo_evento} para validação.")
+    if captura is not None:
+        # amostra anonimizada para o replay_trafego.py
+        captura.registrar(body, client_cnpj)
+
+    modelo = MODELOS.get(tipo_evento)
+    if modelo is None:
+        mensagem = f"Evento '{tipo_evento}' não reconhecido."
+        logger.warning(mensagem)
+        raise HTTPException(status_code=400, detail=mensagem)
+
+    if CLIENTES_HABILITADO and "nrInscEstab" in body:
+        # lookup no CLIENTS_MAP em memória; só estabelecimentos desconhecidos vão ao banco
+        try:
+            with tracing.span("clientes"):
+                await registro.verificar(body["nrInscEstab"], client_cnpj)
+        except EstabelecimentoNaoAutorizado as e:
+            logger.warning(str(e))
+            raise HTTPException(status_code=403, detail=str(e))
 
     try:
-        if tipo_evento == "R4020":
-            Evt4020(**body)
-        elif tipo_evento == "R2010":
-            Evt2010(**body)
-        elif tipo_evento == "R4010":
-            Evt4010(**body)
-        else:
-            mensagem = f"Evento '{tipo_evento}' não reconhecido."
-            logger.warning(mensagem)
-            raise HTTPException(status_code=400, detail=mensagem)
+        with tracing.span("validacao", evento=tipo_evento):
+            modelo(**body)
 
     except ValidationError as e:
-        logger.error(f"Evento {tipo_evento} contém erros de validação:")
-        mensagens = []
+        erros = e.errors()
+        mensagens = [f"Campo: {campo_do_erro(err)} | Erro: {err['msg']}" for err in erros]
 
-        for err in e.errors():
-            campo = "geral" if not err["loc"] else " -> ".join(str(loc) for loc in err["loc"])
-            mensagem = f"Campo: {campo} | Erro: {err['msg']}"
-            logger.error(f"    {mensagem}")
-            mensagens.append(mensagem)
+        if agregador.detalhado(client_cnpj):
+            # ERROS_LOG_DETALHADO_CNPJ: log linha a linha só para este cliente
+            logger.error(f"Evento {tipo_evento} contém erros de validação:")
+            for mensagem in mensagens:
+                logger.error(f"    {mensagem}")
+        else:
+            # contagem agregada, descarregada no errors.log a cada ERROS_FLUSH_INTERVALO_S
+            agregador.registrar(client_cnpj, tipo_evento, erros, body)
+            logger.info(f"Evento {tipo_evento} rejeitado na validação ({len(erros)} erro(s)): "
+                        f"{', '.join(dict.fromkeys(campo_do_erro(err) for err in erros))}")
 
         raise HTTPException(status_code=422, detail=mensagens)
 
@@ -142,6 +314,136 @@ async def validar_evento(request: Request, client_cnpj: str = Depends(get_client
     return resposta
 
 
+@app.get("/exportar", tags=["Exportação"])
+async def exportar(
+    request: Request,
+    evento: str,
+    de: str = None,
+    ate: str = None,
+    formato: str = "ndjson",
+    gzip: bool = False,
+    client_cnpj: str = Depends(cliente_com_limite),
+):
+    """
+    Exporta em streaming todos os eventos `evento` do cliente do token,
+    opcionalmente entre os períodos `de` e `ate` (AAAA-MM), em NDJSON ou CSV,
+    com gzip opcional. A memória usada não depende do tamanho da exportação.
+    """
+    if evento not in MODELOS:
+        raise HTTPException(status_code=400, detail=f"Evento '{evento}' não reconhecido.")
+    if formato not in FORMATOS:
+        raise HTTPException(status_code=400, detail=f"Formato '{formato}' inválido. Use: {sorted(FORMATOS)}")
+    try:
+        periodo_de, periodo_ate = periodo_para_int(de), periodo_para_int(ate)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Períodos devem estar no formato AAAA-MM.")
+
+    logger.info(f"Exportando {evento} do cliente {client_cnpj} ({de or '-'} a {ate or '-'}, {formato})")
+    nome = f"{evento}_{client_cnpj}.{formato}" + (".gz" if gzip else "")
+    return streaming_com_limite(
+        request,
+        exportar_eventos(evento, client_cnpj, periodo_de, periodo_ate, formato, gzip),
+        media_type="application/gzip" if gzip else FORMATOS[formato],
+        headers={"Content-Disposition": f'attachment; filename="{nome}"'},
+    )
+
+
+@app.post("/jobs", tags=["Jobs"], status_code=202)
+async def criar_job(request: Request, client_cnpj: str = Depends(cliente_com_limite)):
+    """
+    Recebe um lote grande de eventos e responde 202 com o id do job assim que
+    eles estiverem gravados em blocos; validação e gravação rodam em segundo
+    plano. Corpo: NDJSON (`Content-Type: application/x-ndjson`, lido em
+    streaming), uma lista JSON ou `{"eventos": [...]}`.
+    """
+    tipo = request.headers.get("content-type", "").split(";")[0].strip().lower()
+    try:
+        if tipo in ("application/x-ndjson", "application/ndjson", "application/jsonl"):
+            itens = jobs.linhas_ndjson(request.stream())
+        else:
+            body = await request.json()
+            itens = body.get("eventos") if isinstance(body, dict) else body
+            if not isinstance(itens, list):
+                raise jobs.JobInvalido("Envie uma lista de eventos, {\"eventos\": [...]} ou NDJSON.")
+        job = await jobs.submeter(client_cnpj, itens)
+    except jobs.JobInvalido as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return JSONResponse(status_code=202, content=job, headers={"Location": f"/jobs/{job['job_id']}"})
+
+
+async def _job_do_cliente(job_id: str, client_cnpj: str) -> dict:
+    job = await jobs.consultar(job_id, client_cnpj)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Job {job_id} não encontrado.")
+    return job
+
+
+@app.get("/jobs/{job_id}", tags=["Jobs"])
+async def status_job(job_id: str, client_cnpj: str = Depends(cliente_com_limite)):
+    """Estado, progresso (contagens por status) e erros mais frequentes do job."""
+    return await _job_do_cliente(job_id, client_cnpj)
+
+
+@app.get("/jobs/{job_id}/progresso", tags=["Jobs"])
+async def progresso_job(request: Request, job_id: str, client_cnpj: str = Depends(cliente_com_limite)):
+    """
+    Progresso em Server-Sent Events (um evento a cada JOBS_PROGRESSO_S) até o job terminar.
+    Cada conexão consome um token do cliente e ocupa uma vaga de concorrência enquanto dura.
+    """
+    await _job_do_cliente(job_id, client_cnpj)
+    return streaming_com_limite(request, jobs.progresso(job_id), media_type="text/event-stream",
+                                headers={"Cache-Control": "no-cache"})
+
+
+@app.get("/jobs/{job_id}/resultados", tags=["Jobs"])
+async def resultados_job(request: Request, job_id: str, somente_erros: bool = False,
+                         client_cnpj: str = Depends(cliente_com_limite)):
+    """
+    Resultado de cada item (NDJSON, na ordem do envio) dos blocos já concluídos:
+    `{"i", "status", "evento", "_id" | "erros"}`. `somente_erros` omite os gravados.
+    """
+    await _job_do_cliente(job_id, client_cnpj)
+    return streaming_com_limite(request, jobs.resultados(job_id, somente_erros), media_type="application/x-ndjson")
+
+
+@app.get("/admin/erros", tags=["Admin"], dependencies=[Depends(verificar_token_admin)])
+async def admin_erros(cliente: str = None, dias: int = 7, limite: int = 10):
+    """
+    Regras de validação que mais falharam nos últimos `dias`, por cliente
+    (ou só de `cliente`), somando todos os workers até a última descarga.
+    """
+    if dias <= 0 or limite <= 0:
+        raise HTTPException(status_code=400, detail="dias e limite devem ser positivos.")
+    return await principais_regras(cliente, dias, limite)
+
+
+@app.post("/admin/profiler", tags=["Admin"], dependencies=[Depends(verificar_token_admin)])
+async def admin_profiler(
+    segundos: float = 10,
+    requisicoes: int = None,
+    formato: str = "json",
+    ociosos: bool = False,
+):
+    """
+    Perfila este worker por `segundos` ou até `requisicoes` requisições concluídas
+    (o que vier antes) e devolve as pilhas amostradas em formato collapsed
+    (flamegraph) junto dos maiores alocadores de memória do período.
+    Com `formato=colapsado`, devolve só o texto das pilhas.
+    """
+    if segundos <= 0 or (requisicoes is not None and requisicoes <= 0):
+        raise HTTPException(status_code=400, detail="segundos e requisicoes devem ser positivos.")
+    if formato not in ("json", "colapsado"):
+        raise HTTPException(status_code=400, detail="formato deve ser 'json' ou 'colapsado'.")
+    try:
+        sessao = await perfilar(segundos, requisicoes, incluir_ociosos=ociosos)
+    except PerfiladorOcupado as e:
+        raise HTTPException(status_code=409, detail=str(e))
+
+    if formato == "colapsado":
+        return PlainTextResponse(sessao.colapsado())
+    return sessao.relatorio()
+
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run("main:app", host="0.0.0.0", port=8000,  workers=4, log_level=os.getenv("LOG_LEVEL", "info"))
@@ -0,0 +1,87 @@
+"""
+Registro de métricas em memória, por worker, exportado em `/metrics` no
+formato texto do Prometheus:
+ - contadores: `incrementar(nome, valor, **labels)`
+ - gauges: `definir(nome, valor, **labels)` ou `registrar_gauge(nome, fn)`,
+   lido no momento da exportação
+ - `exportar()` monta o texto; toda série recebe o label `worker=<pid>`,
+   já que cada worker do uvicorn tem o seu próprio registro.
+"""
+from collections import defaultdict
+import os
+import threading
+
+_lock = threading.Lock()
+_TIPOS = {}                       # nome → ("counter" | "gauge", descrição)
+_VALORES = defaultdict(float)     # (nome, labels ordenados) → valor
+_CALLBACKS = {}                   # nome → fn() que retorna float ou {labels_tuple: float}
+
+
+def _chave_labels(labels: dict) -> tuple:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def descrever(nome: str, tipo: str, descricao: str) -> None:
+    """Declara tipo e texto de ajuda de uma métrica (opcional, só afeta # HELP/# TYPE)."""
+    _TIPOS[nome] = (tipo, descricao)
+
+
+def incrementar(nome: str, valor: float = 1, /, **labels) -> None:
+    """Soma `valor` ao contador `nome` com os labels informados."""
+    _TIPOS.setdefault(nome, ("counter", ""))
+    with _lock:
+        _VALORES[(nome, _chave_labels(labels))] += valor
+
+
+def definir(nome: str, valor: float, /, **labels) -> None:
+    """Atribui o valor atual do gauge `nome`."""
+    _TIPOS.setdefault(nome, ("gauge", ""))
+    with _lock:
+        _VALORES[(nome, _chave_labels(labels))] = valor
+
+
+def registrar_gauge(nome: str, fn, descricao: str = "") -> None:
+    """
+    Registra um gauge calculado na exportação. `fn()` pode retornar um número
+    ou um dict {tupla de (label, valor): número} para várias séries.
+    """
+    _TIPOS[nome] = ("gauge", descricao)
+    _CALLBACKS[nome] = fn
+
+
+def valor(nome: str, /, **labels) -> float:
+    """Valor atual de um contador/gauge armazenado (0 se nunca registrado)."""
+    return _VALORES.get((nome, _chave_labels(labels)), 0.0)
+
+
+def _formatar(nome: str, labels: tuple, v: float) -> str:
+    todos = (("worker", str(os.getpid())),) + tuple(labels)
+    texto = ",".join(f'{k}="{str(val).replace(chr(34), chr(39))}"' for k, val in todos)
+    return f"{nome}{{{texto}}} {v:g}"
+
+
+def exportar() -> str:
+    """Texto no formato de exposição do Prometheus com todas as séries deste worker."""
+    series = defaultdict(list)
+    with _lock:
+        for (nome, labels), v in _VALORES.items():
+            series[nome].append((labels, v))
+
+    for nome, fn in list(_CALLBACKS.items()):
+        try:
+            resultado = fn()
+        except Exception:
+            continue
+        if isinstance(resultado, dict):
+            series[nome].extend((_chave_labels(dict(k)), v) for k, v in resultado.items())
+        else:
+            series[nome].append(((), resultado))
+
+    linhas = []
+    for nome in sorted(series):
+        tipo, descricao = _TIPOS.get(nome, ("gauge", ""))
+        if descricao:
+            linhas.append(f"# HELP {nome} {descricao}")
+        linhas.append(f"# TYPE {nome} {tipo}")
+        linhas.extend(_formatar(nome, labels, v) for labels, v in series[nome])
+    return "\n".join(linhas) + "\n"
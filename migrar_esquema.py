@@ -0,0 +1,104 @@
+"""
+Migração em streaming dos documentos legados (v1) para o formato compacto (v2).
+
+Percorre cada coleção em ordem de `_id` com cursor em lotes, converte com
+`esquema.compactar` e grava com `bulk_write` de `ReplaceOne` condicionado a
+`_v` ainda ausente (reexecutar é seguro). A memória usada é a de um lote.
+
+Uso:
+    python migrar_esquema.py --tipo R4010 --lote 1000
+    python migrar_esquema.py --tipo R4010 --colecao "<coleção>" --apos "<_id>"   # retoma de onde parou
+
+Os `_id` só são ordenados dentro de cada coleção, então `--apos` vale para uma
+única coleção (`--colecao`, o nome mostrado no progresso) e exige `--tipo`;
+as demais coleções já migradas são puladas pelo filtro de `_v`.
+    python migrar_esquema.py --dry-run           # só conta e mede a economia
+"""
+from pymongo import ReplaceOne
+from database import EVENT_CONFIG, build_id, colecoes_evento, periodo_evento
+import argparse
+import asyncio
+import time
+import bson
+import esquema
+
+
+def documento_legado_para_compacto(doc: dict, tipo: str) -> dict:
+    """
+    Converte um documento v1 em v2. O CNPJ do cliente não está no payload;
+    ele é o que sobra do `_id` depois do prefixo montado com os próprios campos.
+    """
+    cfg = EVENT_CONFIG[tipo]
+    payload = {k: v for k, v in doc.items() if k not in ("_id", "_cli", "_per", "evento", "status", "mensagem")}
+    payload.setdefault("TpEvento", tipo)
+    novo = esquema.compactar(payload, doc["_id"], cfg)
+    prefixo = build_id(payload, "")
+    novo["_cli"] = doc.get("_cli", doc["_id"][len(prefixo):])
+    novo["_per"] = doc.get("_per", periodo_evento(payload))
+    return novo
+
+
+async def migrar_colecao(col, tipo: str, lote: int, apos: str = None, dry_run: bool = False) -> dict:
+    filtro = {"_v": {"$exists": False}}
+    if apos:
+        filtro["_id"] = {"$gt": apos}
+
+    stats = {"lidos": 0, "migrados": 0, "bytes_antes": 0, "bytes_depois": 0, "ultimo_id": apos}
+    operacoes = []
+    inicio = time.perf_counter()
+
+    async def descarregar():
+        if operacoes and not dry_run:
+            resultado = await col.bulk_write(operacoes, ordered=False)
+            stats["migrados"] += resultado.modified_count
+        operacoes.clear()
+
+    cursor = col.find(filtro, batch_size=lote).sort("_id", 1)
+    async for doc in cursor:
+        novo = documento_legado_para_compacto(doc, tipo)
+        stats["lidos"] += 1
+        stats["bytes_antes"] += len(bson.encode(doc))
+        stats["bytes_depois"] += len(bson.encode(novo))
+        stats["ultimo_id"] = doc["_id"]
+        operacoes.append(ReplaceOne({"_id": doc["_id"], "_v": {"$exists": False}}, novo))
+
+        if len(operacoes) >= lote:
+            await descarregar()
+            decorrido = time.perf_counter() - inicio
+            print(f"[{col.name}] {stats['lidos']} lidos ({stats['lidos'] / decorrido:.0f} docs/s), "
+                  f"último _id={stats['ultimo_id']}")
+    await descarregar()
+    return stats
+
+
+async def executar(tipos, lote, apos, dry_run, colecao=None):
+    encontrada = False
+    for tipo in tipos:
+        for col in await colecoes_evento(tipo):
+            if colecao and col.name != colecao:
+                continue
+            encontrada = True
+            stats = await migrar_colecao(col, tipo, lote, apos, dry_run)
+            economia = 1 - stats["bytes_depois"] / stats["bytes_antes"] if stats["bytes_antes"] else 0
+            print(f"[{col.name}] lidos={stats['lidos']} migrados={stats['migrados']} "
+                  f"BSON {stats['bytes_antes']} → {stats['bytes_depois']} bytes ({economia:.1%} menor)")
+    if colecao and not encontrada:
+        raise SystemExit(f"Coleção {colecao!r} não encontrada para {', '.join(tipos)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migra documentos v1 (legado) para o esquema compacto v2")
+    parser.add_argument('--tipo', choices=sorted(EVENT_CONFIG), action='append',
+                        help="Evento a migrar (pode repetir); padrão: todos")
+    parser.add_argument('--lote', type=int, default=1000, help="Documentos por lote de leitura/escrita")
+    parser.add_argument('--colecao', help="Migra só esta coleção (nome exibido no progresso)")
+    parser.add_argument('--apos', help="Retoma a partir do _id seguinte a este; exige --tipo e --colecao")
+    parser.add_argument('--dry-run', action='store_true', help="Não grava, só mede")
+    args = parser.parse_args()
+    if args.apos and not (args.tipo and len(args.tipo) == 1 and args.colecao):
+        parser.error("--apos vale para uma única coleção: informe um --tipo e a --colecao")
+    asyncio.run(executar(args.tipo or sorted(EVENT_CONFIG), args.lote, args.apos, args.dry_run, args.colecao))
+
+
+if __name__ == "__main__":
+    main()
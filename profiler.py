@@ -0,0 +1,193 @@
+"""
+Profiler estatístico sob demanda para um worker em execução.
+
+ - Uma thread amostra `sys._current_frames()` a cada `PROFILER_INTERVALO_MS`
+   e conta as pilhas de todas as threads do worker (loop do asyncio e
+   threadpool do Starlette). Pilhas paradas em espera (select/epoll,
+   `Condition.wait`) são descartadas por padrão, para o relatório mostrar só
+   onde há CPU.
+ - A saída é o formato "collapsed stacks" (`f1;f2;f3 <contagem>` por linha),
+   aceito por flamegraph.pl, speedscope e inferno.
+ - Em paralelo, `tracemalloc` compara um snapshot do início com um do fim e
+   lista os maiores alocadores do intervalo.
+ - A sessão termina após `segundos` ou após `requisicoes` requisições
+   concluídas (contadas por `PerfiladorMiddleware`), o que vier primeiro.
+   Só uma sessão por worker por vez; cada worker do uvicorn se perfila sozinho.
+"""
+from collections import Counter
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import tracemalloc
+
+logger = logging.getLogger(__name__)
+
+# ─── Configuração ────────────────────────────
+PROFILER_INTERVALO_MS = float(os.getenv("PROFILER_INTERVALO_MS", 5))   # período de amostragem
+PROFILER_MAX_S = float(os.getenv("PROFILER_MAX_S", 120))              # duração máxima de uma sessão
+PROFILER_FRAMES_ALOCACAO = int(os.getenv("PROFILER_FRAMES_ALOCACAO", 10))  # profundidade das pilhas do tracemalloc
+PROFILER_TOP_ALOCACOES = int(os.getenv("PROFILER_TOP_ALOCACOES", 25))  # nº de alocadores no relatório
+
+# (arquivo, função) no topo da pilha que indicam thread ociosa
+_OCIOSOS = {
+    ("selectors.py", "select"),
+    ("threading.py", "wait"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),
+}
+
+
+class PerfiladorOcupado(Exception):
+    """Já existe uma sessão de profiling em andamento neste worker."""
+
+
+def _rotulo(code, cache: dict) -> str:
+    rotulo = cache.get(code)
+    if rotulo is None:
+        arquivo = code.co_filename
+        for base in sys.path:
+            if base and arquivo.startswith(base):
+                arquivo = arquivo[len(base):].lstrip(os.sep)
+                break
+        rotulo = cache[code] = f"{code.co_name} ({arquivo}:{code.co_firstlineno})"
+    return rotulo
+
+
+class SessaoProfiler:
+    def __init__(self, segundos: float, requisicoes: int = None, intervalo_ms: float = PROFILER_INTERVALO_MS,
+                 incluir_ociosos: bool = False):
+        self.segundos = min(segundos, PROFILER_MAX_S)
+        self.requisicoes_alvo = requisicoes
+        self.intervalo_s = intervalo_ms / 1000
+        self.incluir_ociosos = incluir_ociosos
+        self.pilhas = Counter()
+        self.amostras = 0
+        self.requisicoes = 0
+        self._parar = threading.Event()
+        self._rotulos = {}
+        self._thread = None
+        self._tracemalloc_proprio = False
+        self._snapshot_inicio = None
+        self.inicio = None
+        self.duracao_s = None
+        self.alocacoes = []
+
+    # ─── amostragem ──────────────────────────
+    def _amostrar(self) -> None:
+        proprio = threading.get_ident()
+        nomes = {t.ident: t.name for t in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == proprio:
+                continue
+            code = frame.f_code
+            if not self.incluir_ociosos and (os.path.basename(code.co_filename), code.co_name) in _OCIOSOS:
+                continue
+            pilha = []
+            while frame is not None:
+                pilha.append(_rotulo(frame.f_code, self._rotulos))
+                frame = frame.f_back
+            pilha.append(nomes.get(ident, str(ident)))
+            pilha.reverse()
+            self.pilhas[";".join(pilha)] += 1
+        self.amostras += 1
+
+    def _loop(self) -> None:
+        while not self._parar.wait(self.intervalo_s):
+            self._amostrar()
+
+    # ─── ciclo de vida ───────────────────────
+    def iniciar(self) -> None:
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(PROFILER_FRAMES_ALOCACAO)
+            self._tracemalloc_proprio = True
+        self._snapshot_inicio = tracemalloc.take_snapshot()
+        self.inicio = time.perf_counter()
+        self._thread = threading.Thread(target=self._loop, name="profiler", daemon=True)
+        self._thread.start()
+
+    def encerrar(self) -> None:
+        self._parar.set()
+        self._thread.join()
+        self.duracao_s = time.perf_counter() - self.inicio
+        fim = tracemalloc.take_snapshot()
+        if self._tracemalloc_proprio:
+            tracemalloc.stop()
+        filtros = [tracemalloc.Filter(False, tracemalloc.__file__), tracemalloc.Filter(False, __file__)]
+        diferencas = fim.filter_traces(filtros).compare_to(self._snapshot_inicio.filter_traces(filtros), "traceback")
+        self.alocacoes = [
+            {
+                "bytes": d.size_diff,
+                "blocos": d.count_diff,
+                "bytes_vivos": d.size,
+                "pilha": [f"{f.filename}:{f.lineno}" for f in d.traceback],   # da mais antiga até o ponto da alocação
+            }
+            for d in diferencas[:PROFILER_TOP_ALOCACOES]
+        ]
+
+    def terminou(self) -> bool:
+        if time.perf_counter() - self.inicio >= self.segundos:
+            return True
+        return self.requisicoes_alvo is not None and self.requisicoes >= self.requisicoes_alvo
+
+    # ─── relatório ───────────────────────────
+    def colapsado(self) -> str:
+        """Pilhas no formato collapsed (uma por linha, `frames;separados;por;ponto-e-vírgula contagem`)."""
+        return "".join(f"{pilha} {n}\n" for pilha, n in self.pilhas.most_common())
+
+    def relatorio(self) -> dict:
+        return {
+            "pid": os.getpid(),
+            "duracao_s": round(self.duracao_s, 3),
+            "amostras": self.amostras,
+            "intervalo_ms": self.intervalo_s * 1000,
+            "requisicoes": self.requisicoes,
+            "colapsado": self.colapsado(),
+            "alocacoes": self.alocacoes,
+        }
+
+
+_sessao_atual = None
+
+
+async def perfilar(segundos: float, requisicoes: int = None, incluir_ociosos: bool = False) -> SessaoProfiler:
+    """Roda uma sessão neste worker e devolve-a encerrada. Lança PerfiladorOcupado se já houver uma."""
+    global _sessao_atual
+    if _sessao_atual is not None:
+        raise PerfiladorOcupado("Já existe uma sessão de profiling em andamento neste worker")
+    sessao = _sessao_atual = SessaoProfiler(segundos, requisicoes, incluir_ociosos=incluir_ociosos)
+    logger.warning(f"[profiler] Iniciando sessão: até {sessao.segundos}s"
+                   + (f" ou {requisicoes} requisições" if requisicoes else ""))
+    try:
+        await asyncio.to_thread(sessao.iniciar)
+    except BaseException:
+        _sessao_atual = None
+        raise
+    try:
+        while not sessao.terminou():
+            await asyncio.sleep(0.05)
+    finally:
+        _sessao_atual = None
+        await asyncio.to_thread(sessao.encerrar)
+    logger.warning(f"[profiler] Sessão encerrada: {sessao.amostras} amostras, "
+                   f"{sessao.requisicoes} requisições em {sessao.duracao_s:.1f}s")
+    return sessao
+
+
+class PerfiladorMiddleware:
+    """Conta as requisições concluídas enquanto há uma sessão ativa (critério `requisicoes`)."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or _sessao_atual is None or scope["path"].startswith("/admin"):
+            await self.app(scope, receive, send)
+            return
+        sessao = _sessao_atual
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            sessao.requisicoes += 1
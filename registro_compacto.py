@@ -0,0 +1,294 @@
+"""
+Representação compacta de eventos já validados, para rotinas em lote que
+precisam manter milhões de eventos em memória (conferências cruzadas,
+exportação, ingestão com `--reter`).
+
+Uma instância Pydantic por evento carrega `__dict__`, `__pydantic_fields_set__`
+e o maquinário do modelo; aqui os valores validados ficam em colunas:
+
+ - `BlocoColunar(tipo)`: uma `array` por campo do modelo — `float` em `'d'`,
+   inteiros em `'q'` (ou `'b'` para os `Literal` de inteiros), datas como
+   ordinal em `'i'` e textos (CNPJ/CPF/CNO) em largura fixa num `bytearray`;
+   o `TpEvento` é o próprio bloco. Um R-4020 ocupa ~80 bytes.
+ - `bloco[i]` devolve um registro da classe de `__slots__` do evento
+   (`classe_registro`), sem `__dict__`, só quando alguém precisa da linha.
+ - Conversão sob demanda: `para_modelo()` (via `model_construct`, sem revalidar),
+   `para_payload()` (formato do `/validar`) e `para_documento(cliente)`
+   (o `(tipo, coleção, documento)` de `database.preparar_documento`).
+
+Os valores são os do modelo validado, já normalizados pelos validadores
+(CNPJ/CPF sem máscara, valores como float).
+
+Uso (CLI, memória por milhão de eventos e custo das conversões):
+    python registro_compacto.py --evento R4020 --quantidade 200000
+"""
+from array import array
+from datetime import date
+from functools import lru_cache
+from typing import Literal, get_args, get_origin
+from database import preparar_documento
+from eventos.modelos import MODELOS
+import argparse
+import gc
+import logging
+import time
+import tracemalloc
+
+logger = logging.getLogger(__name__)
+
+_LARGURA_TEXTO = 14        # CNPJ (numérico ou alfanumérico); CPF e raiz do CNPJ ocupam menos
+_VAZIO = b"\0"
+_LIMITES_INT = {"q": (-2 ** 63, 2 ** 63 - 1), "b": (-128, 127)}
+
+
+@lru_cache(maxsize=None)
+def colunas(tipo: str) -> tuple:
+    """((campo, código), ...) dos campos do modelo; código 'd', 'q', 'b', 'i' (data) ou 's' (texto)."""
+    resultado = []
+    for campo, info in MODELOS[tipo].model_fields.items():
+        anotacao = info.annotation
+        if get_origin(anotacao) is Literal:
+            valores = get_args(anotacao)
+            if all(isinstance(v, str) for v in valores):
+                continue        # TpEvento: constante do bloco
+            resultado.append((campo, "b"))
+        elif anotacao is float:
+            resultado.append((campo, "d"))
+        elif anotacao is date:
+            resultado.append((campo, "i"))
+        elif anotacao is str:
+            resultado.append((campo, "s"))
+        else:
+            resultado.append((campo, "q"))      # int / StrictInt
+    return tuple(resultado)
+
+
+# ─── Registro com __slots__ ──────────────────
+class RegistroBase:
+    """Base das classes de registro geradas por `classe_registro`; `tipo` é atributo de classe."""
+    __slots__ = ()
+    tipo = None
+
+    def __repr__(self):
+        campos = ", ".join(f"{c}={getattr(self, c)!r}" for c in self.__slots__)
+        return f"{type(self).__name__}({campos})"
+
+    def __eq__(self, outro):
+        return (type(self) is type(outro)
+                and all(getattr(self, c) == getattr(outro, c) for c in self.__slots__))
+
+    def valores(self) -> dict:
+        return {c: getattr(self, c) for c in self.__slots__}
+
+    def para_modelo(self):
+        """Instância do modelo Pydantic sem revalidar (`model_construct`)."""
+        return MODELOS[self.tipo].model_construct(TpEvento=self.tipo, **self.valores())
+
+    def para_payload(self) -> dict:
+        """Payload no formato do `/validar` (datas em ISO)."""
+        payload = {"TpEvento": self.tipo}
+        for campo in self.__slots__:
+            valor = getattr(self, campo)
+            payload[campo] = valor.isoformat() if isinstance(valor, date) else valor
+        return payload
+
+    def para_documento(self, client_cnpj: str) -> tuple:
+        """(tipo, coleção, documento) prontos para `database.inserir_lote`."""
+        resultado = {"evento": self.tipo, "status": "valido", "mensagem": f"Evento {self.tipo} validado com sucesso!"}
+        return preparar_documento(resultado, self.para_payload(), client_cnpj)
+
+
+@lru_cache(maxsize=None)
+def classe_registro(tipo: str) -> type:
+    """
+    Classe com `__slots__` = campos do modelo do evento (exceto `TpEvento`), ex.: `RegistroR4020`.
+    O `__init__` posicional é gerado por campo, como no `namedtuple`: um laço de `setattr`
+    custaria mais que a própria leitura das colunas.
+    """
+    campos = tuple(campo for campo, _ in colunas(tipo))
+    codigo = (f"def __init__(self, {', '.join(campos)}):\n"
+              + "".join(f"    self.{c} = {c}\n" for c in campos))
+    namespace = {}
+    exec(codigo, namespace)
+    return type(f"Registro{tipo}", (RegistroBase,),
+                {"__slots__": campos, "tipo": tipo, "__init__": namespace["__init__"]})
+
+
+def do_modelo(modelo) -> RegistroBase:
+    """Registro a partir de uma instância validada do modelo (que pode então ser descartada)."""
+    classe = classe_registro(modelo.TpEvento)
+    return classe(*(getattr(modelo, campo) for campo in classe.__slots__))
+
+
+# ─── Bloco colunar ───────────────────────────
+class BlocoColunar:
+    """
+    Eventos validados de um tipo em colunas `array`. `anexar` recebe o modelo
+    validado (ou um registro); `bloco[i]` e a iteração devolvem registros.
+    Textos acima de `_LARGURA_TEXTO` bytes (ou não ASCII) e inteiros fora da
+    faixa da coluna (ex.: `NumDoc` acima de int64) vão para `_extras`.
+    """
+
+    def __init__(self, tipo: str):
+        self.tipo = tipo
+        self._colunas = colunas(tipo)
+        self._classe = classe_registro(tipo)
+        self._dados = {campo: bytearray() if codigo == "s" else array("i" if codigo == "i" else codigo)
+                       for campo, codigo in self._colunas}
+        self._extras = {}       # (campo, índice) → texto que não coube na largura fixa
+        self._n = 0
+        self._leitores = tuple(self._leitor(campo, codigo) for campo, codigo in self._colunas)
+
+    def __len__(self) -> int:
+        return self._n
+
+    def anexar(self, evento) -> None:
+        # a linha inteira é convertida antes de tocar nas colunas: uma falha no meio
+        # não pode deixar umas colunas com uma linha a mais que as outras
+        linha = []
+        extras = {}
+        for campo, codigo in self._colunas:
+            valor = getattr(evento, campo)
+            if codigo == "s":
+                dado = valor.encode("ascii", "replace")
+                if len(dado) > _LARGURA_TEXTO or not valor.isascii() or _VAZIO in dado:
+                    extras[(campo, self._n)] = valor
+                    dado = b""
+                dado = dado.ljust(_LARGURA_TEXTO, _VAZIO)
+            elif codigo == "i":
+                dado = valor.toordinal()
+            elif codigo == "d":
+                dado = float(valor)
+            else:
+                minimo, maximo = _LIMITES_INT[codigo]
+                if not minimo <= valor <= maximo:
+                    extras[(campo, self._n)] = valor
+                    valor = 0
+                dado = valor
+            linha.append(dado)
+        for (campo, codigo), dado in zip(self._colunas, linha):
+            if codigo == "s":
+                self._dados[campo] += dado
+            else:
+                self._dados[campo].append(dado)
+        self._extras.update(extras)
+        self._n += 1
+
+    def _leitor(self, campo: str, codigo: str):
+        """Função i → valor da coluna, montada uma vez por campo."""
+        coluna = self._dados[campo]
+        if codigo == "s":
+            extras = self._extras
+
+            def ler_texto(i):
+                if extras and (campo, i) in extras:
+                    return extras[(campo, i)]
+                return coluna[i * _LARGURA_TEXTO:(i + 1) * _LARGURA_TEXTO].rstrip(_VAZIO).decode("ascii")
+            return ler_texto
+        if codigo == "i":
+            return lambda i: date.fromordinal(coluna[i])
+        extras = self._extras
+
+        def ler_numero(i):
+            if extras and (campo, i) in extras:
+                return extras[(campo, i)]
+            return coluna[i]
+        return ler_numero
+
+    def __getitem__(self, i: int) -> RegistroBase:
+        if i < 0:
+            i += self._n
+        if not 0 <= i < self._n:
+            raise IndexError(i)
+        return self._classe(*[ler(i) for ler in self._leitores])
+
+    def __iter__(self):
+        for i in range(self._n):
+            yield self[i]
+
+    def coluna(self, campo: str) -> list:
+        """Uma coluna inteira decodificada (para agregações sem montar registros)."""
+        indice = [c for c, _ in self._colunas].index(campo)
+        if self._colunas[indice][1] in ("s", "i") or any(c == campo for c, _ in self._extras):
+            return list(map(self._leitores[indice], range(self._n)))
+        return self._dados[campo].tolist()
+
+    def nbytes(self) -> int:
+        """Bytes ocupados pelas colunas (sem a sobra de capacidade das arrays)."""
+        total = 0
+        for coluna in self._dados.values():
+            total += len(coluna) if isinstance(coluna, bytearray) else len(coluna) * coluna.itemsize
+        return total + sum(len(v) if isinstance(v, str) else 8 for v in self._extras.values())
+
+
+# ─── Medição ─────────────────────────────────
+def _memoria(construir) -> tuple:
+    """(objeto, bytes alocados) de `construir()` medidos com tracemalloc."""
+    gc.collect()
+    tracemalloc.start()
+    antes = tracemalloc.get_traced_memory()[0]
+    objeto = construir()
+    gc.collect()
+    depois = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return objeto, depois - antes
+
+
+def _tempo(nome: str, fn, itens) -> None:
+    inicio = time.perf_counter()
+    for item in itens:
+        fn(item)
+    decorrido = time.perf_counter() - inicio
+    print(f"{nome:>36}: {decorrido / len(itens) * 1e9:>7.0f} ns por evento")
+
+
+def main():
+    from gerador_eventos import GeradorEventos
+
+    parser = argparse.ArgumentParser(description="Memória e conversões: modelos Pydantic x registros compactos")
+    parser.add_argument("--evento", choices=sorted(MODELOS), default="R4020")
+    parser.add_argument("--quantidade", type=int, default=200_000)
+    parser.add_argument("--semente", type=int, default=42)
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)   # os validadores ligam DEBUG no import
+
+    gerador = GeradorEventos(semente=args.semente, tipos=[args.evento])
+    payloads = [gerador.evento(args.evento)[0] for _ in range(args.quantidade)]
+    modelo = MODELOS[args.evento]
+    por_milhao = 1_000_000 / args.quantidade
+
+    modelos, b_modelos = _memoria(lambda: [modelo(**p) for p in payloads])
+    bloco, b_bloco = _memoria(lambda: _bloco_de(args.evento, modelos))
+    # a partir do bloco: valores próprios, sem compartilhar objetos com os modelos
+    registros, b_registros = _memoria(lambda: list(bloco))
+    despejos, b_despejos = _memoria(lambda: [m.model_dump() for m in modelos])
+    del despejos
+
+    print(f"{args.quantidade} eventos {args.evento}; memória extrapolada para 1 milhão:")
+    for nome, b in (("modelos Pydantic", b_modelos), ("model_dump() (valores compartilhados)", b_despejos),
+                    ("registros __slots__", b_registros), ("bloco colunar", b_bloco)):
+        print(f"{nome:>36}: {b * por_milhao / 1e6:>8.0f} MB  ({b / args.quantidade:>5.0f} bytes/evento)")
+    print(f"{'colunas (nbytes)':>36}: {bloco.nbytes() * por_milhao / 1e6:>8.0f} MB")
+
+    confere = all(do_modelo(m) == r for m, r in zip(modelos, registros))
+    print(f"\nmodelos x registros do bloco idênticos: {confere}\n")
+    amostra = range(min(len(bloco), 50_000))
+    print("conversões")
+    _tempo("validação (modelo(**payload))", lambda i: modelo(**payloads[i]), amostra)
+    _tempo("modelo → registro", lambda i: do_modelo(modelos[i]), amostra)
+    _tempo("bloco → registro (bloco[i])", lambda i: bloco[i], amostra)
+    _tempo("registro → modelo (model_construct)", lambda i: registros[i].para_modelo(), amostra)
+    _tempo("registro → payload", lambda i: registros[i].para_payload(), amostra)
+    _tempo("registro → documento", lambda i: registros[i].para_documento("09524519000143"), amostra)
+    _tempo("modelo.model_dump()", lambda i: modelos[i].model_dump(), amostra)
+
+
+def _bloco_de(tipo: str, eventos) -> BlocoColunar:
+    bloco = BlocoColunar(tipo)
+    for evento in eventos:
+        bloco.anexar(evento)
+    return bloco
+
+
+if __name__ == "__main__":
+    main()
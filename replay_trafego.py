@@ -0,0 +1,455 @@
+"""
+Replay de tráfego de produção contra a API.
+
+O `load_test.py` envia sempre os mesmos três templates; aqui a carga segue o
+formato do tráfego real: mistura de eventos, taxa de erro, reenvios e rajadas.
+
+Modelo de carga, de uma de duas fontes:
+ - logs do `logging_config` (`audit.log*`/`audit.col*` e `errors.log*`,
+   inclusive os rotacionados e `.gz`): cada "Recebido evento X" é uma chegada no instante
+   original; o resultado vem das mensagens de erro de validação (com os
+   campos; tanto a linha "rejeitado na validação" do audit quanto o log
+   detalhado por erro), de `_id` já existente (reenvio) e de estabelecimento recusado.
+   As mensagens são ligadas à chegada pelo `trace_id` quando ele existe; sem
+   ele, pela chegada mais antiga ainda sem resultado (do mesmo tipo, no caso
+   de erro de validação). Os payloads são sintetizados a partir dos
+   templates do `load_test`, com uma mutação no campo que falhou.
+ - captura opcional (`CAPTURA_HABILITADA=1`): `/validar` grava em
+   `CAPTURA_ARQUIVO` uma amostra dos documentos recebidos, com CPF/CNPJ/CNO
+   trocados por valores derivados de HMAC (`CAPTURA_SEGREDO`). A troca é
+   determinística (o mesmo documento vira sempre o mesmo valor, então os
+   reenvios continuam reenvios) e preserva a validade dos dígitos
+   verificadores. Para reproduzir a captura, desligue na API de teste as
+   checagens contra bases reais (`CNPJ_REGISTRO_PATH`, `CLIENTES_HABILITADO`).
+
+O replay é em malha aberta: cada requisição sai no seu instante (original
+dividido por `--escala`), sem esperar as anteriores, e a latência é medida a
+partir do instante programado — fila do lado do cliente também conta.
+
+Uso:
+    python replay_trafego.py logs/audit.log* logs/errors.log* --somente-modelo
+    python replay_trafego.py logs/audit.log* logs/errors.log* --escala 2 --duracao 300
+    python replay_trafego.py --captura logs/captura.jsonl --url http://homolog:8000
+"""
+from collections import Counter, defaultdict, deque
+from datetime import datetime
+from utils.validadores_em_comum import calcular_dv_cnpj, calcular_dv_cpf, limpar_cnpj
+from logging_config import ler_auditoria_colunar
+import argparse
+import asyncio
+import gzip
+import hashlib
+import hmac
+import json
+import logging
+import os
+import random
+import re
+import time
+
+logger = logging.getLogger(__name__)
+
+# ─── Configuração da captura ─────────────────
+CAPTURA_HABILITADA = os.getenv("CAPTURA_HABILITADA", "0") == "1"              # grava amostra anonimizada dos documentos de /validar
+CAPTURA_ARQUIVO = os.getenv("CAPTURA_ARQUIVO", os.path.join("logs", "captura.jsonl"))
+CAPTURA_AMOSTRA = float(os.getenv("CAPTURA_AMOSTRA", 1.0))                     # fração das requisições capturadas
+CAPTURA_SEGREDO = os.getenv("CAPTURA_SEGREDO", "")                            # chave do HMAC; igual em todos os workers
+
+# ─── Anonimização ────────────────────────────
+_CAMPOS_DOCUMENTO = ("nrInsc", "nrInscEstab", "cnpjPrestador", "cnpjBenef", "cpfBenef")
+
+
+def _digitos_hmac(chave: bytes, valor: str, n: int) -> str:
+    resumo = hmac.new(chave, valor.encode(), hashlib.sha256).digest()
+    return str(int.from_bytes(resumo[:8], "big") % 10 ** n).zfill(n)
+
+
+def _trocar_dv(dv: str) -> str:
+    return dv[:-1] + str((int(dv[-1]) + 1) % 10)
+
+
+def anonimizar_documento(valor, chave: bytes) -> str:
+    """
+    CPF/CNPJ/CNO → valor de mesmo formato derivado por HMAC. A raiz do CNPJ é
+    trocada sozinha (a mesma em `nrInsc` e no CNPJ completo), e o DV é
+    recalculado: válido se o original era válido, errado se não era.
+    """
+    cnpj = limpar_cnpj(valor)
+    if len(cnpj) == 14:
+        # raiz numérica derivada; a ordem (que pode ser alfanumérica) é mantida
+        base = _digitos_hmac(chave, cnpj[:8], 8) + cnpj[8:12]
+        dv = calcular_dv_cnpj(base)
+        try:
+            valido = calcular_dv_cnpj(cnpj[:12]) == cnpj[12:]
+        except ValueError:
+            valido = False
+        return base + (dv if valido else _trocar_dv(dv))
+    digitos = "".join(filter(str.isdigit, str(valor)))
+    n = len(digitos)
+    if n == 11 and digitos != digitos[0] * 11:
+        base = _digitos_hmac(chave, digitos, 9)
+        dv = calcular_dv_cpf(base)
+        return base + (dv if calcular_dv_cpf(digitos[:9]) == digitos[9:] else _trocar_dv(dv))
+    if len(cnpj) == 8:
+        return _digitos_hmac(chave, cnpj, 8)
+    return _digitos_hmac(chave, digitos, n) if n else str(valor)
+
+
+def anonimizar(payload: dict, cliente: str, chave: bytes) -> tuple:
+    """Cópia do payload e cliente com os documentos anonimizados."""
+    anonimo = dict(payload)
+    for campo in _CAMPOS_DOCUMENTO:
+        if anonimo.get(campo) is not None:
+            anonimo[campo] = anonimizar_documento(anonimo[campo], chave)
+    return anonimo, anonimizar_documento(cliente, chave)
+
+
+class CapturaRequisicoes:
+    """Arquivo JSONL com os documentos anonimizados recebidos por este worker."""
+
+    def __init__(self, caminho: str = CAPTURA_ARQUIVO, amostra: float = CAPTURA_AMOSTRA, segredo: str = CAPTURA_SEGREDO):
+        self.caminho = caminho
+        self.amostra = amostra
+        if not segredo:
+            logger.warning("[captura] CAPTURA_SEGREDO não definido: chave aleatória por worker, "
+                           "reenvios entre workers não serão reconhecidos no replay")
+        self._chave = segredo.encode() if segredo else os.urandom(32)
+        self._arquivo = None
+
+    def registrar(self, payload: dict, cliente: str) -> None:
+        if self.amostra < 1 and random.random() >= self.amostra:
+            return
+        if self._arquivo is None:
+            os.makedirs(os.path.dirname(self.caminho) or ".", exist_ok=True)
+            self._arquivo = open(self.caminho, "a", encoding="utf-8", buffering=1)
+        evento, cliente = anonimizar(payload, cliente, self._chave)
+        self._arquivo.write(json.dumps({"ts": time.time(), "cliente": cliente, "evento": evento},
+                                       ensure_ascii=False, default=str) + "\n")
+
+
+captura = CapturaRequisicoes() if CAPTURA_HABILITADA else None
+
+
+# ─── Modelo de carga ─────────────────────────
+_RE_RECEBIDO = re.compile(r"^Recebido evento (\S+) para validação\.")
+_RE_INVALIDO = re.compile(r"^Evento (\S+) contém erros de validação:")
+_RE_CAMPO = re.compile(r"^\s+Campo: (.+?) \| Erro:")
+_RE_REJEITADO = re.compile(r"^Evento (\S+) rejeitado na validação \(\d+ erro\(s\)\): (.*)$")
+_RE_DUPLICADO = re.compile(r"^\[Mongo\] Registro \S+ já existe")
+_RE_RECUSADO = re.compile(r"^Estabelecimento \S+ não pertence ao cliente")
+
+
+def _abrir(caminho: str):
+    if caminho.endswith(".gz"):
+        return gzip.open(caminho, "rt", encoding="utf-8")
+    return open(caminho, encoding="utf-8")
+
+
+def _linhas_log(caminho: str):
+    """Registros (dicts) de um log JSON ou da auditoria colunar (`audit.col*`)."""
+    if ".col" in os.path.basename(caminho):
+        yield from ler_auditoria_colunar(caminho)
+        return
+    with _abrir(caminho) as f:
+        for linha in f:
+            try:
+                yield json.loads(linha)
+            except ValueError:
+                continue
+
+
+def _registros_log(caminhos: list):
+    """(epoch, mensagem, trace_id) de todos os arquivos, em ordem de tempo."""
+    segundos = {}
+    registros = []
+    for caminho in caminhos:
+        for reg in _linhas_log(caminho):
+            asctime = reg.get("asctime")
+            if asctime:
+                # "2025-04-29 16:37:09,552": o strptime só roda uma vez por segundo distinto
+                base = segundos.get(asctime[:19])
+                if base is None:
+                    base = segundos[asctime[:19]] = datetime.strptime(asctime[:19], "%Y-%m-%d %H:%M:%S").timestamp()
+                registros.append((base + int(asctime[20:23] or 0) / 1000, reg.get("message", ""), reg.get("trace_id")))
+    registros.sort(key=lambda r: r[0])
+    return registros
+
+
+def modelo_dos_logs(caminhos: list) -> dict:
+    """Chegadas [{t, tipo, resultado, campos}] reconstruídas dos logs de auditoria e de erros."""
+    chegadas = []
+    por_trace = {}
+    pendentes_tipo = defaultdict(deque)
+    pendentes = deque()
+    ultimo_invalido = None
+
+    def _primeira_pendente(fila):
+        while fila:
+            chegada = fila.popleft()
+            if chegada["resultado"] == "valido":
+                return chegada
+        return None
+
+    for ts, mensagem, trace_id in _registros_log(caminhos):
+        m = _RE_RECEBIDO.match(mensagem)
+        if m:
+            chegada = {"t": ts, "tipo": m.group(1), "resultado": "valido", "campos": []}
+            chegadas.append(chegada)
+            if trace_id:
+                por_trace[trace_id] = chegada
+            else:
+                pendentes_tipo[chegada["tipo"]].append(chegada)
+                pendentes.append(chegada)
+            continue
+
+        m = _RE_CAMPO.match(mensagem)
+        if m:
+            alvo = por_trace.get(trace_id) if trace_id else ultimo_invalido
+            if alvo is not None:
+                alvo["campos"].append(m.group(1))
+            continue
+
+        m = _RE_INVALIDO.match(mensagem) or _RE_REJEITADO.match(mensagem)
+        if m:
+            resultado = "invalido"
+        elif _RE_DUPLICADO.match(mensagem):
+            resultado = "duplicado"
+        elif _RE_RECUSADO.match(mensagem):
+            resultado = "recusado"
+        else:
+            continue
+        if trace_id:
+            alvo = por_trace.get(trace_id)
+        elif resultado == "invalido":
+            alvo = _primeira_pendente(pendentes_tipo[m.group(1)])
+        else:
+            alvo = _primeira_pendente(pendentes)
+        if alvo is not None:
+            alvo["resultado"] = resultado
+            if resultado == "invalido":
+                ultimo_invalido = alvo
+                if m.re is _RE_REJEITADO:
+                    # formato agregado: os campos vêm na própria linha de auditoria
+                    alvo["campos"].extend(m.group(2).split(", "))
+
+    inicio = chegadas[0]["t"] if chegadas else 0.0
+    for chegada in chegadas:
+        chegada["t"] = round(chegada["t"] - inicio, 3)
+    return {"origem": "logs", "inicio": inicio, "chegadas": chegadas}
+
+
+def modelo_da_captura(caminho: str) -> dict:
+    """Chegadas com os documentos (anonimizados) da captura; documento repetido conta como reenvio."""
+    chegadas = []
+    vistos = set()
+    with _abrir(caminho) as f:
+        for linha in f:
+            try:
+                reg = json.loads(linha)
+            except ValueError:
+                continue       # última linha incompleta
+            chave = (reg["cliente"], json.dumps(reg["evento"], sort_keys=True))
+            chegadas.append({"t": reg["ts"], "tipo": reg["evento"].get("TpEvento"),
+                             "resultado": "duplicado" if chave in vistos else None,
+                             "cliente": reg["cliente"], "payload": reg["evento"]})
+            vistos.add(chave)
+    chegadas.sort(key=lambda c: c["t"])
+    inicio = chegadas[0]["t"] if chegadas else 0.0
+    for chegada in chegadas:
+        chegada["t"] = round(chegada["t"] - inicio, 3)
+    return {"origem": "captura", "inicio": inicio, "chegadas": chegadas}
+
+
+def resumo_modelo(modelo: dict) -> str:
+    chegadas = modelo["chegadas"]
+    if not chegadas:
+        return "Modelo vazio."
+    duracao = max(chegadas[-1]["t"], 0.001)
+    por_segundo = Counter(int(c["t"]) for c in chegadas)
+    linhas = [
+        f"{len(chegadas)} requisições em {duracao:.1f}s ({len(chegadas) / duracao:.1f}/s média, "
+        f"pico {max(por_segundo.values())}/s) — origem: {modelo['origem']}",
+        f"{'evento':>8} {'qtd':>8} {'%':>6} {'inválidas':>10} {'reenvios':>9} {'recusadas':>10}",
+    ]
+    por_tipo = defaultdict(Counter)
+    campos = Counter()
+    for c in chegadas:
+        por_tipo[c["tipo"]][c["resultado"]] += 1
+        campos.update(c.get("campos", ()))
+    for tipo, cont in sorted(por_tipo.items(), key=lambda x: str(x[0])):
+        n = sum(cont.values())
+        if modelo["origem"] == "captura":   # o resultado de cada documento só se sabe ao reenviá-lo
+            invalidas = recusadas = "-"
+        else:
+            invalidas, recusadas = f"{cont['invalido'] / n:.1%}", f"{cont['recusado'] / n:.1%}"
+        linhas.append(f"{str(tipo):>8} {n:>8} {n / len(chegadas):>6.1%} {invalidas:>10} "
+                      f"{cont['duplicado'] / n:>9.1%} {recusadas:>10}")
+    if campos:
+        linhas.append("campos com erro: " + ", ".join(f"{c} ({n})" for c, n in campos.most_common(10)))
+    return "\n".join(linhas)
+
+
+# ─── Payloads sintéticos ─────────────────────
+def _trocar_ultimo_digito(p: dict, campo: str) -> None:
+    p[campo] = _trocar_dv(str(p[campo]))
+
+
+_MUTACOES = {
+    "cpfBenef": lambda p: _trocar_ultimo_digito(p, "cpfBenef"),
+    "cnpjBenef": lambda p: _trocar_ultimo_digito(p, "cnpjBenef"),
+    "cnpjPrestador": lambda p: _trocar_ultimo_digito(p, "cnpjPrestador"),
+    "nrInscEstab": lambda p: _trocar_ultimo_digito(p, "nrInscEstab"),
+    "nrInsc": lambda p: p.update(nrInsc="00000000"),
+    "natRend": lambda p: p.update(natRend=1),
+    "tpServico": lambda p: p.update(tpServico=1),
+    "dtFG": lambda p: p.update(dtFG="2025-13-40"),
+    "dtEmissaoNF": lambda p: p.update(dtEmissaoNF="2025-13-40"),
+}
+
+# erro "geral" (model_validator) ou campo sem mutação conhecida
+_MUTACAO_PADRAO = {
+    "R2010": lambda p: p.update(tpServico=1),
+    "R4010": lambda p: p.update(cpfBenef="11111111111"),
+    "R4020": lambda p: p.update(natRend=1),
+}
+
+_ESTAB_DE_OUTRO_CLIENTE = "999999990001" + calcular_dv_cnpj("999999990001")
+
+
+def payload_sintetico(chegada: dict, i: int, base_doc: int, ultimos: dict) -> dict:
+    """Payload do `load_test` com o resultado esperado da chegada (válido, inválido, reenvio, recusado)."""
+    from load_test import TEMPLATES, generate_payload
+
+    tipo = chegada["tipo"]
+    if tipo not in TEMPLATES:
+        return {"TpEvento": tipo}
+    if chegada["resultado"] == "duplicado" and tipo in ultimos:
+        return ultimos[tipo]
+
+    payload = generate_payload(tipo, i)
+    payload["numDocto" if tipo == "R2010" else "NumDoc"] = base_doc + i
+    if chegada["resultado"] == "invalido":
+        campo = next((c.split(" -> ")[0] for c in chegada["campos"] if c.split(" -> ")[0] in _MUTACOES), None)
+        (_MUTACOES[campo] if campo else _MUTACAO_PADRAO[tipo])(payload)
+    elif chegada["resultado"] == "recusado":
+        payload["nrInscEstab"] = _ESTAB_DE_OUTRO_CLIENTE
+    else:
+        ultimos[tipo] = payload
+    return payload
+
+
+# ─── Replay ──────────────────────────────────
+_STATUS_ESPERADO = {"valido": 200, "duplicado": 200, "invalido": 422, "recusado": 403}
+
+
+async def reproduzir(modelo: dict, base_url: str, escala: float = 1.0, duracao: float = None,
+                     conexoes: int = 100, cliente_padrao: str = "09524519000143") -> list:
+    """
+    Envia as chegadas no ritmo original dividido por `escala`. Retorna
+    [(tipo, resultado esperado, status ou None, latência ms desde o instante programado)].
+    """
+    import httpx
+    import jwt
+    from httpx import Limits, Timeout
+
+    segredo = os.getenv("JWT_SECRET", "mysecret")
+    tokens = {}
+    ultimos = {}
+    resultados = []
+    base_doc = int(time.time()) % 100_000 * 10_000   # documentos novos a cada execução
+    vagas = asyncio.Semaphore(conexoes)
+
+    def token(cliente):
+        if cliente not in tokens:
+            tokens[cliente] = jwt.encode({"cnpj": cliente}, segredo, algorithm="HS256")
+        return tokens[cliente]
+
+    limits = Limits(max_connections=conexoes, max_keepalive_connections=conexoes)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=Timeout(30.0, pool=None)) as client:
+
+        async def enviar(chegada, payload, alvo):
+            async with vagas:
+                try:
+                    r = await client.post("/validar", json=payload,
+                                          headers={"Authorization": f"Bearer {token(chegada.get('cliente', cliente_padrao))}"})
+                    status = r.status_code
+                except httpx.HTTPError:
+                    status = None
+            resultados.append((chegada["tipo"], chegada["resultado"], status, (time.perf_counter() - alvo) * 1000))
+
+        tarefas = []
+        inicio = time.perf_counter()
+        for i, chegada in enumerate(modelo["chegadas"]):
+            deslocamento = chegada["t"] / escala
+            if duracao is not None and deslocamento > duracao:
+                break
+            payload = chegada.get("payload") or payload_sintetico(chegada, i, base_doc, ultimos)
+            alvo = inicio + deslocamento
+            espera = alvo - time.perf_counter()
+            if espera > 0:
+                await asyncio.sleep(espera)
+            tarefas.append(asyncio.create_task(enviar(chegada, payload, alvo)))
+        await asyncio.gather(*tarefas)
+    return resultados
+
+
+def relatorio(resultados: list, decorrido: float) -> str:
+    from load_test import percentil
+
+    linhas = [
+        f"{len(resultados)} requisições em {decorrido:.1f}s ({len(resultados) / max(decorrido, 1e-9):.1f}/s)",
+        f"{'evento':>8} {'qtd':>7} {'2xx':>6} {'4xx':>6} {'5xx':>6} {'falha':>6} {'≠esper.':>8} "
+        f"{'p50':>8} {'p95':>8} {'p99':>8} {'máx':>8}",
+    ]
+    por_tipo = defaultdict(list)
+    for r in resultados:
+        por_tipo[r[0]].append(r)
+    por_tipo["total"] = resultados
+    for tipo, itens in sorted(por_tipo.items(), key=lambda x: (x[0] == "total", str(x[0]))):
+        classes = Counter((s // 100 if s else 0) for _, _, s, _ in itens)
+        divergentes = sum(1 for _, esperado, s, _ in itens if esperado in _STATUS_ESPERADO and s != _STATUS_ESPERADO[esperado])
+        lat = [r[3] for r in itens]
+        linhas.append(
+            f"{str(tipo):>8} {len(itens):>7} {classes[2]:>6} {classes[4]:>6} {classes[5]:>6} {classes[0]:>6} "
+            f"{divergentes:>8} {percentil(lat, 50):>8.1f} {percentil(lat, 95):>8.1f} "
+            f"{percentil(lat, 99):>8.1f} {max(lat, default=0):>8.1f}"
+        )
+    linhas.append("latências em ms, medidas a partir do instante programado de cada requisição")
+    return "\n".join(linhas)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay de tráfego de produção a partir dos logs ou da captura")
+    parser.add_argument("logs", nargs="*", help="audit.log*/errors.log* (JSON, aceita .gz)")
+    parser.add_argument("--captura", help="Arquivo da captura anonimizada (CAPTURA_ARQUIVO) no lugar dos logs")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--escala", type=float, default=1.0, help="Multiplicador da taxa original (2 = duas vezes mais rápido)")
+    parser.add_argument("--duracao", type=float, help="Segundos de replay (após a escala); padrão: o modelo inteiro")
+    parser.add_argument("--conexoes", type=int, default=100, help="Conexões HTTP simultâneas no máximo")
+    parser.add_argument("--cliente", default="09524519000143", help="CNPJ do JWT para o tráfego dos logs")
+    parser.add_argument("--salvar-modelo", help="Grava o modelo de carga em JSON")
+    parser.add_argument("--somente-modelo", action="store_true", help="Só mostra o resumo do modelo, sem enviar")
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)   # os validadores ligam DEBUG no import
+
+    if args.captura:
+        modelo = modelo_da_captura(args.captura)
+    elif args.logs:
+        modelo = modelo_dos_logs(args.logs)
+    else:
+        parser.error("informe os arquivos de log ou --captura")
+    print(resumo_modelo(modelo))
+    if args.salvar_modelo:
+        with open(args.salvar_modelo, "w", encoding="utf-8") as f:
+            json.dump(modelo, f, ensure_ascii=False, default=str)
+    if args.somente_modelo or not modelo["chegadas"]:
+        return
+
+    print(f"\nReproduzindo em {args.url} (escala {args.escala:g}x)…")
+    inicio = time.perf_counter()
+    resultados = asyncio.run(reproduzir(modelo, args.url, args.escala, args.duracao, args.conexoes, args.cliente))
+    print(relatorio(resultados, time.perf_counter() - inicio))
+
+
+if __name__ == "__main__":
+    main()
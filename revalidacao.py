@@ -0,0 +1,280 @@
+"""
+Revalidação em segundo plano dos eventos já gravados, para quando as tabelas
+de referência (`NatRendEnum`, `TpServicoEnum`) ou as regras/tolerâncias dos
+validadores mudam: encontra os documentos que hoje seriam rejeitados.
+
+ - Versão das regras: hash das tabelas (`tabelas.versao_tabelas`) + do código
+   dos validadores (`eventos/validador_*.py`, `utils/validadores_em_comum.py`,
+   onde ficam as tolerâncias). Cada execução trabalha numa versão.
+ - Leitura: cada coleção (inclusive partições) em ordem de `_id`, em lotes de
+   `REVALIDACAO_LOTE` (consultas `_id > último` pelo índice do `_id`), com
+   `esquema.expandir` para o formato da API.
+ - Validação: os lotes vão para um pool de processos (`--processos`), com até
+   `REVALIDACAO_LOTES_EM_VOO` lotes em andamento para sobrepor banco e CPU.
+ - Falhas: um documento por evento em `revalidacao_falhas`
+   (`{versao, evento, doc_id, colecao, _cli, _per, erros: [{campo, tipo, mensagem}]}`);
+   os eventos em si não são alterados.
+ - Checkpoint: `revalidacao_checkpoints` guarda, por versão e coleção, o
+   último `_id` com o lote concluído (os resultados são consumidos em ordem).
+   Rodar de novo com a mesma versão retoma dali; coleção concluída é pulada.
+ - Vazão: o job fica no banco no máximo `REVALIDACAO_FRACAO_BANCO` do tempo —
+   depois de cada ida ao banco que levou t segundos, dorme t·(1−f)/f. Com o
+   banco carregado pelo tráfego de produção as consultas ficam mais lentas e
+   as pausas crescem junto. `REVALIDACAO_MAX_DOCS_S` é um teto adicional.
+
+Uso:
+    python revalidacao.py executar [--tipo R4010] [--processos 4] [--fracao-banco 0.1]
+    python revalidacao.py relatorio [--versao <hash>]
+    python revalidacao.py versao
+"""
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from pydantic import ValidationError
+from pymongo import ReplaceOne
+from circuit_breaker import CircuitoAbertoError
+from database import EVENT_CONFIG, breaker_mongo, colecoes_evento, db
+from eventos.modelos import MODELOS
+from utils import tabelas
+from agregador_erros import campo_do_erro
+import argparse
+import asyncio
+import glob
+import hashlib
+import logging
+import os
+import time
+import esquema
+
+logger = logging.getLogger(__name__)
+
+# ─── Configuração ────────────────────────────
+REVALIDACAO_LOTE = int(os.getenv("REVALIDACAO_LOTE", 1000))                   # documentos por consulta/lote
+REVALIDACAO_LOTES_EM_VOO = int(os.getenv("REVALIDACAO_LOTES_EM_VOO", 8))      # lotes sendo validados ao mesmo tempo
+REVALIDACAO_FRACAO_BANCO = float(os.getenv("REVALIDACAO_FRACAO_BANCO", 0.1))  # fração do tempo que o job passa no banco
+REVALIDACAO_MAX_DOCS_S = float(os.getenv("REVALIDACAO_MAX_DOCS_S", 0))        # teto de documentos/s (0 = sem teto)
+
+COLECAO_FALHAS = "revalidacao_falhas"
+COLECAO_CHECKPOINTS = "revalidacao_checkpoints"
+
+_RAIZ = os.path.dirname(os.path.abspath(__file__))
+_FONTES_REGRAS = ("eventos/validador_*.py", "utils/validadores_em_comum.py")
+
+
+def versao_regras() -> str:
+    """Hash curto das tabelas de referência + código dos validadores."""
+    h = hashlib.sha256(tabelas.versao_tabelas().encode())
+    for padrao in _FONTES_REGRAS:
+        for caminho in sorted(glob.glob(os.path.join(_RAIZ, padrao))):
+            with open(caminho, "rb") as f:
+                h.update(f.read())
+    return h.hexdigest()[:12]
+
+
+# ─── Validação (roda nos processos) ──────────
+def _iniciar_processo():
+    logging.getLogger().setLevel(logging.WARNING)   # os validadores ligam DEBUG no import
+
+
+def validar_lote(tipo: str, itens: list) -> list:
+    """[(doc_id, payload)] → [(doc_id, [(campo, tipo_erro, mensagem), ...])] só dos que falharam."""
+    modelo = MODELOS[tipo]
+    falhas = []
+    for doc_id, payload in itens:
+        try:
+            modelo(**payload)
+        except ValidationError as e:
+            falhas.append((doc_id, [(campo_do_erro(err), err["type"], err["msg"]) for err in e.errors()]))
+    return falhas
+
+
+def _payload(doc: dict, tipo: str, cfg: dict) -> dict:
+    payload = esquema.expandir(doc, tipo, cfg)
+    for campo in ("_id", "evento", "status", "mensagem"):
+        payload.pop(campo, None)
+    payload.setdefault("TpEvento", tipo)
+    return payload
+
+
+# ─── Controle de vazão ───────────────────────
+class Regulador:
+    """Pausas proporcionais ao tempo gasto no banco, mais o teto de documentos/s."""
+
+    def __init__(self, fracao_banco: float = REVALIDACAO_FRACAO_BANCO, max_docs_s: float = REVALIDACAO_MAX_DOCS_S):
+        self.fracao_banco = min(max(fracao_banco, 0.001), 1.0)
+        self.max_docs_s = max_docs_s
+        self.inicio = time.monotonic()
+        self.documentos = 0
+        self.tempo_banco = 0.0
+        self.tempo_pausa = 0.0
+
+    async def apos_banco(self, segundos: float, documentos: int = 0) -> None:
+        self.tempo_banco += segundos
+        self.documentos += documentos
+        pausa = segundos * (1 - self.fracao_banco) / self.fracao_banco
+        if self.max_docs_s:
+            # adianta-se ao teto: espera até o ritmo médio voltar a ele
+            pausa = max(pausa, self.documentos / self.max_docs_s - (time.monotonic() - self.inicio))
+        if pausa > 0:
+            self.tempo_pausa += pausa
+            await asyncio.sleep(pausa)
+
+
+async def _no_banco(regulador: Regulador, operacao, documentos: int = 0):
+    """Executa `operacao()` (corrotina) protegida pelo breaker; com o circuito aberto, espera e tenta de novo."""
+    while True:
+        inicio = time.perf_counter()
+        try:
+            async with breaker_mongo.protegido():
+                resultado = await operacao()
+        except CircuitoAbertoError as e:
+            logger.warning(f"[revalidacao] {e}; aguardando {e.retry_after:.1f}s")
+            await asyncio.sleep(max(e.retry_after, 0.5))
+            continue
+        await regulador.apos_banco(time.perf_counter() - inicio, documentos)
+        return resultado
+
+
+# ─── Job ─────────────────────────────────────
+async def revalidar_colecao(col, tipo: str, versao: str, executor, regulador: Regulador,
+                            lote: int = REVALIDACAO_LOTE, em_voo: int = REVALIDACAO_LOTES_EM_VOO) -> dict:
+    """Revalida uma coleção a partir do checkpoint da versão. Retorna as contagens desta execução."""
+    cfg = EVENT_CONFIG[tipo]
+    em_voo = em_voo if executor is not None else 1   # sem pool não há o que sobrepor
+    chave = f"{versao}|{col.name}"
+    checkpoints, falhas_col = db[COLECAO_CHECKPOINTS], db[COLECAO_FALHAS]
+    ck = await _no_banco(regulador, lambda: checkpoints.find_one({"_id": chave})) or {}
+    if ck.get("concluido"):
+        return {"lidos": 0, "falhas": 0, "concluido": True}
+    ultimo = ck.get("ultimo_id")
+    stats = {"lidos": 0, "falhas": 0}
+    pendentes = deque()
+    loop = asyncio.get_running_loop()
+    inicio = time.perf_counter()
+
+    async def concluir():
+        futuro, ultimo_do_lote, n, origem = pendentes.popleft()
+        falhas = await futuro
+        agora = datetime.now(timezone.utc)
+        if falhas:
+            operacoes = [
+                ReplaceOne({"_id": f"{versao}|{tipo}|{doc_id}"}, {
+                    "versao": versao, "evento": tipo, "doc_id": doc_id, "colecao": col.name,
+                    "_cli": origem[doc_id][0], "_per": origem[doc_id][1], "em": agora,
+                    "erros": [{"campo": c, "tipo": t, "mensagem": m} for c, t, m in erros],
+                }, upsert=True)
+                for doc_id, erros in falhas
+            ]
+            await _no_banco(regulador, lambda: falhas_col.bulk_write(operacoes, ordered=False))
+        await _no_banco(regulador, lambda: checkpoints.update_one(
+            {"_id": chave},
+            {"$set": {"versao": versao, "colecao": col.name, "evento": tipo, "ultimo_id": ultimo_do_lote,
+                      "atualizado_em": agora},
+             "$inc": {"lidos": n, "falhas": len(falhas)}},
+            upsert=True,
+        ))
+        stats["lidos"] += n
+        stats["falhas"] += len(falhas)
+
+    while True:
+        filtro = {"_id": {"$gt": ultimo}} if ultimo is not None else {}
+        docs = await _no_banco(regulador, lambda: col.find(filtro).sort("_id", 1).limit(lote).to_list(lote), lote)
+        if not docs:
+            break
+        ultimo = docs[-1]["_id"]
+        itens = [(d["_id"], _payload(d, tipo, cfg)) for d in docs]
+        origem = {d["_id"]: (d.get("_cli"), d.get("_per")) for d in docs}
+        if executor is None:
+            futuro = loop.create_future()
+            futuro.set_result(validar_lote(tipo, itens))
+        else:
+            futuro = loop.run_in_executor(executor, validar_lote, tipo, itens)
+        pendentes.append((futuro, ultimo, len(docs), origem))
+        while len(pendentes) >= em_voo:
+            await concluir()
+        if stats["lidos"] and stats["lidos"] % (lote * 10) < lote:
+            decorrido = time.perf_counter() - inicio
+            print(f"[{col.name}] {stats['lidos']} revalidados ({stats['lidos'] / decorrido:.0f} docs/s), "
+                  f"{stats['falhas']} falhas, último _id={ultimo}")
+    while pendentes:
+        await concluir()
+
+    await _no_banco(regulador, lambda: checkpoints.update_one(
+        {"_id": chave}, {"$set": {"versao": versao, "colecao": col.name, "evento": tipo, "concluido": True,
+                                  "atualizado_em": datetime.now(timezone.utc)}}, upsert=True))
+    return {**stats, "concluido": True}
+
+
+async def executar(tipos, processos: int, fracao_banco: float, max_docs_s: float, lote: int, reiniciar: bool) -> str:
+    versao = versao_regras()
+    if reiniciar:
+        await db[COLECAO_CHECKPOINTS].delete_many({"versao": versao})
+        await db[COLECAO_FALHAS].delete_many({"versao": versao})
+    regulador = Regulador(fracao_banco, max_docs_s)
+    print(f"versão das regras {versao}, {processos or 'sem'} processos, "
+          f"fração do banco {regulador.fracao_banco:.0%}")
+    executor = ProcessPoolExecutor(processos, initializer=_iniciar_processo) if processos else None
+    try:
+        for tipo in tipos:
+            for col in await colecoes_evento(tipo):
+                inicio = time.perf_counter()
+                stats = await revalidar_colecao(col, tipo, versao, executor, regulador, lote)
+                print(f"[{col.name}] {stats['lidos']} revalidados, {stats['falhas']} falhas "
+                      f"em {time.perf_counter() - inicio:.1f}s")
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    total = time.monotonic() - regulador.inicio
+    print(f"tempo no banco {regulador.tempo_banco:.1f}s, em pausa {regulador.tempo_pausa:.1f}s, total {total:.1f}s")
+    return versao
+
+
+async def relatorio(versao: str = None, limite: int = 20) -> None:
+    versao = versao or versao_regras()
+    async for ck in db[COLECAO_CHECKPOINTS].find({"versao": versao}).sort("_id", 1):
+        estado = "concluída" if ck.get("concluido") else f"parada em _id={ck.get('ultimo_id')}"
+        print(f"[{ck['colecao']}] {ck.get('lidos', 0)} revalidados, {ck.get('falhas', 0)} falhas, {estado}")
+    pipeline = [
+        {"$match": {"versao": versao}},
+        {"$unwind": "$erros"},
+        {"$group": {"_id": {"evento": "$evento", "campo": "$erros.campo", "tipo": "$erros.tipo"},
+                    "total": {"$sum": 1}, "mensagem": {"$last": "$erros.mensagem"}}},
+        {"$sort": {"total": -1}},
+        {"$limit": limite},
+    ]
+    async for r in db[COLECAO_FALHAS].aggregate(pipeline):
+        print(f"{r['total']:>8}  {r['_id']['evento']} {r['_id']['campo']} ({r['_id']['tipo']}): {r['mensagem']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Revalida os eventos gravados com as regras/tabelas atuais")
+    sub = parser.add_subparsers(dest="comando", required=True)
+
+    p = sub.add_parser("executar", help="Revalida (retoma do checkpoint da versão atual)")
+    p.add_argument("--tipo", choices=sorted(EVENT_CONFIG), action="append", help="Evento (pode repetir); padrão: todos")
+    p.add_argument("--processos", type=int, default=os.cpu_count(), help="Processos de validação (0 = no próprio processo)")
+    p.add_argument("--fracao-banco", type=float, default=REVALIDACAO_FRACAO_BANCO,
+                   help="Fração do tempo que o job pode passar no banco")
+    p.add_argument("--max-docs-s", type=float, default=REVALIDACAO_MAX_DOCS_S, help="Teto de documentos/s (0 = sem)")
+    p.add_argument("--lote", type=int, default=REVALIDACAO_LOTE)
+    p.add_argument("--reiniciar", action="store_true", help="Descarta checkpoints e falhas da versão atual")
+
+    p = sub.add_parser("relatorio", help="Regras que mais falharam e progresso por coleção")
+    p.add_argument("--versao", help="Padrão: versão atual das regras")
+    p.add_argument("--limite", type=int, default=20)
+
+    sub.add_parser("versao", help="Mostra a versão atual das regras")
+
+    args = parser.parse_args()
+    logging.getLogger().setLevel(logging.WARNING)   # os validadores ligam DEBUG no import
+    if args.comando == "executar":
+        asyncio.run(executar(args.tipo or sorted(EVENT_CONFIG), args.processos, args.fracao_banco,
+                             args.max_docs_s, args.lote, args.reiniciar))
+    elif args.comando == "relatorio":
+        asyncio.run(relatorio(args.versao, args.limite))
+    else:
+        print(versao_regras())
+
+
+if __name__ == "__main__":
+    main()
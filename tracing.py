@@ -0,0 +1,262 @@
+"""
+Tracing leve em processo, por requisição, com amostragem na cauda.
+
+ - `TracingMiddleware` abre um trace por requisição (reaproveita o trace-id de
+   um header W3C `traceparent`, se vier) e devolve o id em `X-Trace-Id`.
+ - `span(nome, **atributos)` mede um trecho; spans aninham pelo contexto
+   (contextvars), então funcionam igual em código síncrono e assíncrono. Sem
+   trace ativo, `span` não faz nada.
+ - `instrumentar_validadores(modelo)` cria um span por validador do modelo
+   Pydantic (field/model validators), filhos do span de validação.
+ - `TraceIdFilter` põe `trace_id` em todo registro de log (ver logging_config).
+ - Amostragem na cauda: os spans ficam só em memória durante a requisição e
+   são exportados apenas se ela foi lenta (≥ `TRACE_LENTO_MS`), falhou
+   (status ≥ `TRACE_STATUS_ERRO` ou exceção) ou caiu na amostra aleatória
+   `TRACE_AMOSTRA`. O caminho rápido não escreve nada.
+ - Exportação: uma linha JSON por trace em `TRACE_ARQUIVO`, no formato OTLP/JSON
+   (ExportTraceServiceRequest), lido por collectors OpenTelemetry e Jaeger.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+import dataclasses
+import functools
+import json
+import logging
+import os
+import random
+import threading
+import time
+import metricas
+
+logger = logging.getLogger(__name__)
+
+# ─── Configuração ────────────────────────────
+TRACE_HABILITADO = os.getenv("TRACE_HABILITADO", "1") == "1"                    # liga/desliga o tracing
+TRACE_LENTO_MS = float(os.getenv("TRACE_LENTO_MS", 500))                         # requisições acima disso são exportadas
+TRACE_STATUS_ERRO = int(os.getenv("TRACE_STATUS_ERRO", 500))                     # status a partir do qual a requisição conta como falha
+TRACE_AMOSTRA = float(os.getenv("TRACE_AMOSTRA", 0.0))                           # fração das demais requisições exportada mesmo assim
+TRACE_ARQUIVO = os.getenv("TRACE_ARQUIVO", os.path.join("logs", "traces.jsonl"))  # destino OTLP/JSON
+TRACE_SERVICO = os.getenv("TRACE_SERVICO", "validador-reinf")                    # service.name no recurso OTLP
+
+_trace_atual = ContextVar("trace_atual", default=None)
+_span_atual = ContextVar("span_atual", default=None)
+
+
+class Trace:
+    """Spans de uma requisição, acumulados em memória até a decisão de amostragem."""
+
+    __slots__ = ("trace_id", "spans", "erro")
+
+    def __init__(self, trace_id: str = None):
+        self.trace_id = trace_id or f"{random.getrandbits(128):032x}"
+        self.spans = []
+        self.erro = False
+
+
+class Span:
+    __slots__ = ("span_id", "pai", "nome", "inicio", "fim", "atributos", "erro", "raiz")
+
+    def __init__(self, nome: str, pai, atributos: dict, raiz: bool = False):
+        self.span_id = f"{random.getrandbits(64):016x}"
+        self.pai = pai
+        self.nome = nome
+        self.atributos = atributos
+        self.erro = None
+        self.raiz = raiz
+        self.inicio = time.time_ns()
+        self.fim = None
+
+    def definir(self, **atributos) -> None:
+        self.atributos.update(atributos)
+
+    def otlp(self, trace_id: str) -> dict:
+        span = {
+            "traceId": trace_id,
+            "spanId": self.span_id,
+            "name": self.nome,
+            "kind": 2 if self.raiz else 1,      # SERVER / INTERNAL
+            "startTimeUnixNano": str(self.inicio),
+            "endTimeUnixNano": str(self.fim),
+            "attributes": [_atributo(k, v) for k, v in self.atributos.items()],
+            "status": {"code": 2, "message": self.erro} if self.erro else {"code": 1},
+        }
+        if self.pai:
+            span["parentSpanId"] = self.pai
+        return span
+
+
+def _atributo(chave: str, valor) -> dict:
+    if isinstance(valor, bool):
+        return {"key": chave, "value": {"boolValue": valor}}
+    if isinstance(valor, int):
+        return {"key": chave, "value": {"intValue": str(valor)}}
+    if isinstance(valor, float):
+        return {"key": chave, "value": {"doubleValue": valor}}
+    return {"key": chave, "value": {"stringValue": str(valor)}}
+
+
+def trace_id_atual() -> str:
+    trace = _trace_atual.get()
+    return trace.trace_id if trace else None
+
+
+@contextmanager
+def span(nome: str, **atributos):
+    """Mede o bloco como um span filho do span atual; no-op fora de um trace."""
+    trace = _trace_atual.get()
+    if trace is None:
+        yield None
+        return
+    s = Span(nome, _span_atual.get(), atributos)
+    token = _span_atual.set(s.span_id)
+    try:
+        yield s
+    except BaseException as e:
+        s.erro = f"{type(e).__name__}: {e}"[:500]
+        raise
+    finally:
+        s.fim = time.time_ns()
+        _span_atual.reset(token)
+        trace.spans.append(s)
+
+
+# ─── Validadores Pydantic ────────────────────
+def _rastrear_validador(fn, nome: str):
+    @functools.wraps(fn)
+    def envolvido(*args, **kwargs):
+        if _trace_atual.get() is None:
+            return fn(*args, **kwargs)
+        with span(f"validador.{nome}"):
+            return fn(*args, **kwargs)
+    return envolvido
+
+
+def instrumentar_validadores(modelo) -> bool:
+    """
+    Envolve cada field/model validator de `modelo` num span e reconstrói o schema.
+    Depende de `__pydantic_decorators__` (interno do Pydantic 2); se a estrutura
+    mudar, apenas registra um aviso e segue sem os spans por validador.
+    """
+    try:
+        decoradores = modelo.__pydantic_decorators__
+        for grupo in (decoradores.field_validators, decoradores.model_validators):
+            for nome, dec in list(grupo.items()):
+                grupo[nome] = dataclasses.replace(dec, func=_rastrear_validador(dec.func, nome))
+        modelo.model_rebuild(force=True)
+        return True
+    except Exception as e:
+        logger.warning(f"[tracing] Não foi possível instrumentar os validadores de {modelo.__name__}: {e!r}")
+        return False
+
+
+# ─── Logging ─────────────────────────────────
+class TraceIdFilter(logging.Filter):
+    """Acrescenta `trace_id` a todo registro (None fora de uma requisição)."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        trace = _trace_atual.get()
+        record.trace_id = trace.trace_id if trace else None
+        return True
+
+
+# ─── Exportação ──────────────────────────────
+class ExportadorArquivo:
+    """Grava cada trace amostrado como uma linha OTLP/JSON."""
+
+    def __init__(self, caminho: str = TRACE_ARQUIVO, servico: str = TRACE_SERVICO):
+        self.caminho = caminho
+        self.recurso = {"attributes": [_atributo("service.name", servico), _atributo("process.pid", os.getpid())]}
+        self._lock = threading.Lock()
+        self._arquivo = None
+
+    def exportar(self, trace: Trace) -> None:
+        linha = json.dumps({
+            "resourceSpans": [{
+                "resource": self.recurso,
+                "scopeSpans": [{
+                    "scope": {"name": "tracing"},
+                    "spans": [s.otlp(trace.trace_id) for s in trace.spans],
+                }],
+            }],
+        }, ensure_ascii=False)
+        with self._lock:
+            if self._arquivo is None:
+                os.makedirs(os.path.dirname(self.caminho) or ".", exist_ok=True)
+                self._arquivo = open(self.caminho, "a", encoding="utf-8")
+            self._arquivo.write(linha + "\n")
+            self._arquivo.flush()
+
+
+exportador = ExportadorArquivo()
+
+
+def _trace_id_do_header(headers: list):
+    """Trace-id de um `traceparent` W3C (00-<trace_id>-<span_id>-<flags>), se válido."""
+    for chave, valor in headers:
+        if chave == b"traceparent":
+            partes = valor.decode("latin-1").split("-")
+            if len(partes) == 4 and len(partes[1]) == 32 and partes[1] != "0" * 32:
+                return partes[1]
+    return None
+
+
+class TracingMiddleware:
+    """Middleware ASGI: um trace por requisição HTTP, exportado conforme a amostragem na cauda."""
+
+    def __init__(self, app, exportador_: ExportadorArquivo = None):
+        self.app = app
+        self.exportador = exportador_ or exportador
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not TRACE_HABILITADO:
+            await self.app(scope, receive, send)
+            return
+
+        trace = Trace(_trace_id_do_header(scope["headers"]))
+        token_trace = _trace_atual.set(trace)
+        raiz = Span(f"{scope['method']} {scope['path']}", None, {"http.method": scope["method"]}, raiz=True)
+        token_span = _span_atual.set(raiz.span_id)
+        status = 500
+
+        async def send_com_trace(mensagem):
+            nonlocal status
+            if mensagem["type"] == "http.response.start":
+                status = mensagem["status"]
+                mensagem["headers"] = list(mensagem.get("headers", [])) + [(b"x-trace-id", trace.trace_id.encode())]
+            await send(mensagem)
+
+        try:
+            await self.app(scope, receive, send_com_trace)
+        except BaseException as e:
+            raiz.erro = f"{type(e).__name__}: {e}"[:500]
+            raise
+        finally:
+            raiz.fim = time.time_ns()
+            _span_atual.reset(token_span)
+            _trace_atual.reset(token_trace)
+            raiz.definir(**{"http.route": scope["path"], "http.status_code": status})
+            if status >= TRACE_STATUS_ERRO and not raiz.erro:
+                raiz.erro = f"HTTP {status}"
+            trace.spans.append(raiz)
+            self._finalizar(trace, raiz)
+
+    def _finalizar(self, trace: Trace, raiz: Span) -> None:
+        duracao_ms = (raiz.fim - raiz.inicio) / 1e6
+        if raiz.erro:
+            motivo = "erro"
+        elif duracao_ms >= TRACE_LENTO_MS:
+            motivo = "lento"
+        elif TRACE_AMOSTRA and random.random() < TRACE_AMOSTRA:
+            motivo = "amostra"
+        else:
+            metricas.incrementar("traces_descartados_total")
+            return
+        try:
+            self.exportador.exportar(trace)
+            metricas.incrementar("traces_exportados_total", motivo=motivo)
+        except OSError as e:
+            logger.warning(f"[tracing] Falha ao exportar trace {trace.trace_id}: {e!r}")
+
+
+metricas.descrever("traces_exportados_total", "counter", "Traces gravados pela amostragem na cauda, por motivo")
+metricas.descrever("traces_descartados_total", "counter", "Traces rápidos e sem erro descartados")
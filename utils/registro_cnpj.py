@@ -0,0 +1,126 @@
+"""
+Consulta opcional à base pública de CNPJ (snapshot local da Receita).
+
+O índice é um arquivo binário ordenado gerado por `cnpj_registro.py`:
+ - cabeçalho de 16 bytes: `CNPJIDX1` + quantidade de registros (u64);
+ - registros de 16 bytes: CNPJ (14 caracteres ASCII) + situação cadastral
+   (1 byte) + flags (1 byte, bit 0 = matriz), em ordem crescente de CNPJ.
+
+O arquivo é mapeado com `mmap` somente-leitura: as páginas ficam no cache do
+sistema operacional e são compartilhadas por todos os workers do uvicorn, sem
+cópia por processo. Cada processo guarda só uma amostra esparsa das chaves
+(1 a cada `PASSO_AMOSTRA`, ~13 MB para 60 milhões de CNPJs): `bisect` nela
+acha o bloco e a busca binária termina dentro do bloco, direto no mapeamento.
+
+Ligado só quando `CNPJ_REGISTRO_PATH` aponta para um índice; sem ele,
+`verificar_cnpj_registro` não faz nada.
+"""
+from functools import lru_cache
+import bisect
+import logging
+import mmap
+import os
+import struct
+
+logger = logging.getLogger(__name__)
+
+CNPJ_REGISTRO_PATH = os.getenv("CNPJ_REGISTRO_PATH", "")                     # índice gerado por cnpj_registro.py
+CNPJ_REGISTRO_SITUACOES = frozenset(                                          # situações cadastrais aceitas
+    int(s) for s in os.getenv("CNPJ_REGISTRO_SITUACOES", "2").split(",") if s
+)
+CNPJ_REGISTRO_ACEITA_AUSENTE = os.getenv("CNPJ_REGISTRO_ACEITA_AUSENTE", "0") == "1"  # CNPJ fora do snapshot passa
+
+MAGICO = b"CNPJIDX1"
+CABECALHO = struct.Struct("<8sQ")
+TAMANHO_REGISTRO = 16
+TAMANHO_CHAVE = 14
+FLAG_MATRIZ = 0x01
+PASSO_AMOSTRA = 256
+
+SITUACOES = {1: "NULA", 2: "ATIVA", 3: "SUSPENSA", 4: "INAPTA", 8: "BAIXADA"}
+
+
+class IndiceCnpj:
+    """Índice CNPJ → (situação, flags) mapeado em memória."""
+
+    def __init__(self, caminho: str):
+        self.caminho = caminho
+        self._arquivo = open(caminho, "rb")
+        self._mm = mmap.mmap(self._arquivo.fileno(), 0, access=mmap.ACCESS_READ)
+        magico, self.quantidade = CABECALHO.unpack_from(self._mm, 0)
+        if magico != MAGICO:
+            raise ValueError(f"{caminho} não é um índice de CNPJ ({magico!r})")
+        esperado = CABECALHO.size + self.quantidade * TAMANHO_REGISTRO
+        if len(self._mm) != esperado:
+            raise ValueError(f"{caminho} truncado: {len(self._mm)} bytes, esperado {esperado}")
+        if hasattr(mmap, "MADV_RANDOM"):
+            self._mm.madvise(mmap.MADV_RANDOM)   # acesso por busca binária: sem leitura antecipada
+        self._amostra = [self._chave(i) for i in range(0, self.quantidade, PASSO_AMOSTRA)]
+
+    def _chave(self, i: int) -> bytes:
+        pos = CABECALHO.size + i * TAMANHO_REGISTRO
+        return self._mm[pos:pos + TAMANHO_CHAVE]
+
+    def consultar(self, cnpj: str):
+        """Retorna (situação, flags) ou None se o CNPJ não está no snapshot."""
+        chave = cnpj.encode("ascii")
+        if len(chave) != TAMANHO_CHAVE:
+            return None
+        bloco = bisect.bisect_right(self._amostra, chave) - 1
+        if bloco < 0:
+            return None
+        mm = self._mm
+        base = CABECALHO.size
+        lo = bloco * PASSO_AMOSTRA
+        hi = min(lo + PASSO_AMOSTRA, self.quantidade)
+        while lo < hi:
+            meio = (lo + hi) >> 1
+            pos = base + meio * TAMANHO_REGISTRO
+            atual = mm[pos:pos + TAMANHO_CHAVE]
+            if atual < chave:
+                lo = meio + 1
+            elif atual > chave:
+                hi = meio
+            else:
+                return mm[pos + TAMANHO_CHAVE], mm[pos + TAMANHO_CHAVE + 1]
+        return None
+
+    def fechar(self) -> None:
+        self._mm.close()
+        self._arquivo.close()
+
+
+@lru_cache(maxsize=None)
+def indice():
+    """Índice configurado em CNPJ_REGISTRO_PATH (aberto uma vez por processo), ou None."""
+    if not CNPJ_REGISTRO_PATH:
+        return None
+    idx = IndiceCnpj(CNPJ_REGISTRO_PATH)
+    logger.info(f"[registro_cnpj] Índice {CNPJ_REGISTRO_PATH} aberto com {idx.quantidade} CNPJs")
+    return idx
+
+
+def verificar_cnpj_registro(cnpj_digits: str) -> None:
+    """
+    Levanta ValueError se o CNPJ não existir no snapshot ou se a situação
+    cadastral não estiver em CNPJ_REGISTRO_SITUACOES. Sem índice configurado, não faz nada.
+    """
+    idx = indice()
+    if idx is None:
+        return
+    encontrado = idx.consultar(cnpj_digits)
+    if encontrado is None:
+        if CNPJ_REGISTRO_ACEITA_AUSENTE:
+            return
+        raise ValueError(f"CNPJ {cnpj_digits} não encontrado na base da Receita Federal.")
+    situacao, _ = encontrado
+    if situacao not in CNPJ_REGISTRO_SITUACOES:
+        raise ValueError(
+            f"CNPJ {cnpj_digits} com situação cadastral {SITUACOES.get(situacao, situacao)} na Receita Federal."
+        )
+
+
+def aquecer_registro() -> int:
+    """Abre o índice (se configurado) e retorna quantos CNPJs ele tem."""
+    idx = indice()
+    return idx.quantidade if idx else 0
@@ -0,0 +1,51 @@
+"""
+Índices pré-calculados das tabelas de referência de `dicionarios/`:
+ - tp_servico_validos, nat_rend_pf_validos, nat_rend_pj_validos
+ - aquecer_tabelas (usado no startup da API)
+ - versao_tabelas (hash do conteúdo, para a revalidação dos eventos gravados)
+
+As tabelas continuam sendo só constantes em `dicionarios/`; aqui elas são
+convertidas uma única vez em `frozenset`, para que cada validação seja um
+lookup O(1) em vez de montar e varrer uma lista a cada evento.
+"""
+from functools import lru_cache
+import hashlib
+from dicionarios import tp_servico, nat_rend_pf, nat_rend_pj
+
+
+@lru_cache(maxsize=None)
+def tp_servico_validos() -> frozenset:
+    """Códigos de tipo de serviço aceitos no R2010."""
+    return frozenset(tp_servico.TpServicoEnum.values())
+
+
+@lru_cache(maxsize=None)
+def nat_rend_pf_validos() -> frozenset:
+    """Naturezas de rendimento de pessoa física aceitas no R4010."""
+    return frozenset(nat_rend_pf.NatRendEnum.values())
+
+
+@lru_cache(maxsize=None)
+def nat_rend_pj_validos() -> frozenset:
+    """Naturezas de rendimento de pessoa jurídica aceitas no R4020."""
+    return frozenset(nat_rend_pj.NatRendEnum.values())
+
+
+def aquecer_tabelas() -> int:
+    """
+    Constrói todos os índices de referência e retorna o total de códigos carregados.
+    """
+    return len(tp_servico_validos()) + len(nat_rend_pf_validos()) + len(nat_rend_pj_validos())
+
+
+@lru_cache(maxsize=None)
+def versao_tabelas() -> str:
+    """
+    Hash curto do conteúdo das tabelas de referência: muda quando um código
+    entra ou sai de `dicionarios/` (usado para marcar revalidações).
+    """
+    h = hashlib.sha256()
+    for nome, codigos in (("tp_servico", tp_servico_validos()), ("nat_rend_pf", nat_rend_pf_validos()),
+                          ("nat_rend_pj", nat_rend_pj_validos())):
+        h.update(f"{nome}:{','.join(map(str, sorted(codigos)))};".encode())
+    return h.hexdigest()[:12]
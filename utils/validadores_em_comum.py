@@ -3,8 +3,8 @@ import logging
 """
 Coleção de funções de validação e limpeza:
  - validar_cnpj, validar_cno, validar_cpf
- - limpar_numeros
- - cálculo de dígitos verificadores de CNPJ
+ - limpar_numeros, limpar_cnpj
+ - cálculo de dígitos verificadores de CNPJ (numérico e alfanumérico) e CPF
 """
 
 
@@ -15,35 +15,80 @@ logging.basicConfig(
 logger = logging.getLogger(__name__)
 
 
+# ─── CNPJ numérico e alfanumérico ────────────
+# Desde o CNPJ alfanumérico, as 12 primeiras posições aceitam [0-9A-Z] e os 2 DVs
+# continuam numéricos. O valor de cada caractere no módulo 11 é ord(c) - 48
+# ('0'..'9' → 0..9, 'A' → 17 … 'Z' → 42), o que mantém o cálculo dos CNPJs numéricos.
+# Em vez de int() por caractere, cada posição tem uma tabela byte → valor × peso;
+# bytes fora de [0-9A-Z] valem None e fazem a soma falhar.
+_CARACTERES_CNPJ = b"0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZ"
+_PESOS_DV1 = (5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2)
+_PESOS_DV2 = (6, 5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2)
+
+
+def _tabelas_posicao(pesos: tuple) -> list:
+    tabelas = []
+    for peso in pesos:
+        tabela = [None] * 256
+        for c in _CARACTERES_CNPJ:
+            tabela[c] = (c - 48) * peso
+        tabelas.append(tabela)
+    return tabelas
+
+
+_PRODUTOS_DV1 = _tabelas_posicao(_PESOS_DV1)
+_PRODUTOS_DV2 = _tabelas_posicao(_PESOS_DV2)
+# resto da soma (mod 11) → dígito verificador
+_DV_POR_RESTO = [0 if resto < 2 else 11 - resto for resto in range(11)]
+_DIGITOS = b"0123456789"
+_ASCII_CNPJ = {c: c for c in _CARACTERES_CNPJ}
+_ASCII_CNPJ.update({c + 32: c for c in _CARACTERES_CNPJ[10:]})   # minúsculas → maiúsculas
+_LIMPEZA_CNPJ = bytes(_ASCII_CNPJ.get(i, 0) for i in range(256))
+
+
+def limpar_cnpj(valor: str) -> str:
+    """
+    Mantém só [0-9A-Z] (letras convertidas para maiúsculas), tirando a máscara
+    ('12.ABC.345/01DE-35' → '12ABC34501DE35'). Para CPF/CNO use `limpar_numeros`.
+    """
+    return str(valor).encode("ascii", "ignore").translate(_LIMPEZA_CNPJ).replace(b"\x00", b"").decode("ascii")
+
+
+def _dvs_cnpj(base: bytes) -> bytes:
+    """2 DVs (bytes ASCII) de uma base de 12 bytes; TypeError se houver caractere inválido."""
+    dv1 = _DV_POR_RESTO[sum(map(list.__getitem__, _PRODUTOS_DV1, base)) % 11]
+    dv2 = _DV_POR_RESTO[(sum(map(list.__getitem__, _PRODUTOS_DV2, base)) + 2 * dv1) % 11]
+    return bytes((_DIGITOS[dv1], _DIGITOS[dv2]))
+
+
 def calcular_dv_cnpj(cnpj_parcial: str) -> str:
-    """Retorna os 2 dígitos verificadores de um CNPJ base (12 dígitos)."""
-    logger.debug(f"Calculando DVs para CNPJ base de 12 dígitos: {cnpj_parcial}")
-
-    def _dv(cnpj_part, pesos):
-        soma = sum(int(d) * p for d, p in zip(cnpj_part, pesos))
-        resto = soma % 11
-        return '0' if resto < 2 else str(11 - resto)
-
-    dv1 = _dv(cnpj_parcial, [5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2])
-    dv2 = _dv(cnpj_parcial + dv1, [6, 5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2])
-    logger.debug(f"dv1={dv1}, dv2={dv2} (CNPJ)")
-    return dv1 + dv2
-
-
-def validar_cnpj(cnpj_digits: str) -> None:
-    """Checa se o CNPJ tem 14 dígitos e dígitos verificadores corretos."""
-    logger.debug(f"Validando CNPJ: {cnpj_digits}")
-    if len(cnpj_digits) != 14:
-        raise ValueError("CNPJ deve conter 14 dígitos numéricos.")
-
-    base = cnpj_digits[:12]
-    dv_esperado = calcular_dv_cnpj(base)
-    dv_informado = cnpj_digits[-2:]
-    logger.debug(f"dv_esperado={dv_esperado}, dv_informado={dv_informado}")
-    if dv_informado != dv_esperado:
+    """Retorna os 2 dígitos verificadores de um CNPJ base (12 caracteres, numérico ou alfanumérico)."""
+    base = cnpj_parcial.encode("ascii", "replace")
+    if len(base) != 12:
+        raise ValueError("A base do CNPJ deve ter 12 caracteres.")
+    try:
+        return _dvs_cnpj(base).decode("ascii")
+    except TypeError:
+        raise ValueError(f"CNPJ {cnpj_parcial} contém caracteres fora de [0-9A-Z].") from None
+
+
+def validar_cnpj(cnpj: str) -> None:
+    """
+    Checa se o CNPJ (numérico ou alfanumérico, já limpo por `limpar_cnpj`) tem
+    14 caracteres, 12 em [0-9A-Z] seguidos de 2 dígitos verificadores corretos.
+    """
+    logger.debug("Validando CNPJ: %s", cnpj)
+    bruto = cnpj.encode("ascii", "replace")
+    if len(bruto) != 14:
+        raise ValueError("CNPJ deve conter 14 caracteres (12 alfanuméricos e 2 dígitos verificadores).")
+    try:
+        dv_esperado = _dvs_cnpj(bruto[:12])
+    except TypeError:
+        raise ValueError("CNPJ deve conter apenas números e letras maiúsculas nas 12 primeiras posições.") from None
+    if bruto[12:] != dv_esperado:
         raise ValueError(
             f"CNPJ inválido: dígitos verificadores incorretos "
-            f"(Esperado={dv_esperado}, Recebido={dv_informado})."
+            f"(Esperado={dv_esperado.decode()}, Recebido={cnpj[12:]})."
         )
 
 
@@ -56,6 +101,17 @@ def validar_cno(cno_digits: str) -> None:
         raise ValueError("CNO deve conter 12 dígitos numéricos.")
 
 
+def calcular_dv_cpf(cpf_parcial: str) -> str:
+    """Retorna os 2 dígitos verificadores de um CPF base (9 dígitos)."""
+    def calc_dv(digs: str, peso_inicial: int) -> str:
+        soma = sum(int(d) * p for d, p in zip(digs, range(peso_inicial, 1, -1)))
+        resto = soma * 10 % 11
+        return '0' if resto == 10 else str(resto)
+
+    dv1 = calc_dv(cpf_parcial, 10)
+    return dv1 + calc_dv(cpf_parcial + dv1, 11)
+
+
 def validar_cpf(cpf: str) -> None:
     """
     Valida um CPF: deve ter 11 dígitos, não ser uma sequência repetida
@@ -68,15 +124,9 @@ def validar_cpf(cpf: str) -> None:
     if cpf == cpf[0] * 11:
         raise ValueError("CPF inválido: sequência repetida.")
 
-    def calc_dv(digs: str, peso_inicial: int) -> str:
-        soma = sum(int(d) * p for d, p in zip(digs, range(peso_inicial, 1, -1)))
-        resto = soma * 10 % 11
-        return '0' if resto == 10 else str(resto)
-
-    dv1 = calc_dv(cpf[:9], 10)
-    dv2 = calc_dv(cpf[:9] + dv1, 11)
-    if cpf[-2:] != dv1 + dv2:
-        raise ValueError(f"CPF inválido: dígitos verificadores incorretos (esperado {dv1+dv2}).")
+    dvs = calcular_dv_cpf(cpf[:9])
+    if cpf[-2:] != dvs:
+        raise ValueError(f"CPF inválido: dígitos verificadores incorretos (esperado {dvs}).")
 
     logger.debug(f"CPF {cpf} validado com sucesso.")
 
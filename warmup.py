@@ -0,0 +1,152 @@
+"""
+Aquecimento de cada worker antes de receber tráfego:
+ - índices das tabelas de referência (`utils.tabelas`) e, se configurado, o
+   índice de CNPJ da Receita (`utils.registro_cnpj`);
+ - caminhos de código dos validadores Pydantic, com um evento válido e um
+   inválido de cada tipo;
+ - conexões do pool do Motor (`database.aquecer_pool`) e índices de apoio
+   (`database.garantir_indices`);
+ - com `CLIENTES_HABILITADO`, a carga do registro de clientes (`clientes.CLIENTS_MAP`).
+
+`executar_aquecimento` é chamado no lifespan da API; `/ready` só responde
+200 depois que ele termina. O índice de CNPJ é aberto antes, ainda na
+inicialização (`preparar_registro`): um `CNPJ_REGISTRO_PATH` errado ou um
+índice corrompido derruba o worker em vez de deixar o `/ready` em 503.
+"""
+from pydantic import ValidationError
+from eventos.modelos import MODELOS
+from database import aquecer_pool, build_id, garantir_indices
+from utils import tabelas
+from utils.registro_cnpj import aquecer_registro
+from clientes import aquecer_clientes
+import asyncio
+import logging
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+WARMUP_ROUNDS = int(os.getenv("WARMUP_ROUNDS", 3))              # nº de passadas pelos validadores
+WARMUP_RETRY_S = float(os.getenv("WARMUP_RETRY_S", 2.0))        # espera inicial entre tentativas de aquecer o pool
+WARMUP_RETRY_MAX_S = float(os.getenv("WARMUP_RETRY_MAX_S", 30.0))
+
+# Eventos sintéticos válidos, um por tipo
+EVENTOS_VALIDOS = {
+    "R2010": {
+        "TpEvento": "R2010",
+        "nrInsc": "12287133",
+        "indObra": 0,
+        "nrInscEstab": "12287133000170",
+        "cnpjPrestador": "10490181000135",
+        "indCPRB": 0,
+        "numDocto": 1,
+        "serie": 1,
+        "dtEmissaoNF": "2025-04-10",
+        "vlrBruto": 10529.35,
+        "tpServico": 100000001,
+        "vlrBaseRet": 100,
+        "vlrRetencao": 11,
+    },
+    "R4010": {
+        "TpEvento": "R4010",
+        "nrInscEstab": "09524519000143",
+        "cpfBenef": "10551205997",
+        "NumDoc": 1,
+        "natRend": 13002,
+        "dtFG": "2025-01-15",
+        "vlrRendBruto": 1000,
+        "vlrRendTrib": 100,
+        "vlrIR": 10,
+    },
+    "R4020": {
+        "TpEvento": "R4020",
+        "nrInscEstab": "12287133000170",
+        "cnpjBenef": "49996377000131",
+        "NumDoc": 1,
+        "natRend": 12042,
+        "dtFG": "2025-01-15",
+        "vlrBruto": 200.0,
+        "vlrBaseIR": 100,
+        "vlrIR": 10,
+        "vlrBaseAgreg": 100,
+        "vlrAgreg": 100,
+    },
+}
+
+# Variações inválidas, para exercitar também o caminho de erro (ValidationError)
+EVENTOS_INVALIDOS = {
+    "R2010": {**EVENTOS_VALIDOS["R2010"], "cnpjPrestador": "10490181000100", "tpServico": 1},
+    "R4010": {**EVENTOS_VALIDOS["R4010"], "cpfBenef": "11111111111", "vlrIR": 500},
+    "R4020": {**EVENTOS_VALIDOS["R4020"], "natRend": 1, "vlrBaseIR": 300},
+}
+
+
+def aquecer_validadores(rodadas: int = WARMUP_ROUNDS) -> int:
+    """
+        Passa cada evento sintético pelo seu validador e retorna quantas validações rodaram.
+        Um evento inválido que passar (ou um válido que falhar) indica regra alterada
+        e é apenas registrado; não impede o startup.
+    """
+    total = 0
+    for _ in range(rodadas):
+        for tipo, modelo in MODELOS.items():
+            valido = EVENTOS_VALIDOS[tipo]
+            try:
+                modelo(**valido)
+                build_id(valido, "00000000000000")
+            except ValidationError as e:
+                logger.warning(f"[warmup] Evento sintético válido {tipo} foi rejeitado: {e.error_count()} erro(s)")
+
+            try:
+                modelo(**EVENTOS_INVALIDOS[tipo])
+                logger.warning(f"[warmup] Evento sintético inválido {tipo} foi aceito")
+            except ValidationError as e:
+                e.errors()
+            total += 2
+    return total
+
+
+def preparar_registro(estado: dict) -> None:
+    """
+        Abre o índice de CNPJ da Receita (se configurado). Falha aqui é erro de
+        configuração: registra no log e propaga, para o worker não subir validando
+        sem a consulta à Receita.
+    """
+    try:
+        estado["etapas"]["registro_cnpj"] = aquecer_registro()
+    except Exception:
+        logger.critical("[warmup] Falha ao abrir o índice de CNPJ (CNPJ_REGISTRO_PATH), "
+                        "abortando a inicialização", exc_info=True)
+        raise
+
+
+async def executar_aquecimento(estado: dict) -> None:
+    """
+        Executa todas as etapas de aquecimento e marca `estado["pronto"] = True` no fim.
+        O pool é re-tentado com backoff enquanto o Mongo estiver indisponível,
+        mantendo o worker fora do balanceamento até conseguir.
+    """
+    inicio = time.perf_counter()
+
+    codigos = tabelas.aquecer_tabelas()
+    estado["etapas"]["tabelas"] = codigos
+    if "registro_cnpj" not in estado["etapas"]:
+        preparar_registro(estado)
+
+    estado["etapas"]["validadores"] = aquecer_validadores()
+
+    espera = WARMUP_RETRY_S
+    while True:
+        try:
+            estado["etapas"]["pool"] = await aquecer_pool()
+            await garantir_indices()
+            estado["etapas"]["clientes"] = await aquecer_clientes()
+            break
+        except Exception as e:
+            logger.warning(f"[warmup] Falha ao aquecer pool do Mongo ({e!r}), nova tentativa em {espera:.1f}s")
+            await asyncio.sleep(espera)
+            espera = min(espera * 2, WARMUP_RETRY_MAX_S)
+
+    estado["duracao_ms"] = round((time.perf_counter() - inicio) * 1000, 1)
+    estado["pronto"] = True
+    logger.info(f"[warmup] Worker pronto em {estado['duracao_ms']} ms: {estado['etapas']}")
@@ -0,0 +1,359 @@
+"""
+Geração dos XMLs oficiais da EFD-Reinf (R-2010, R-4010, R-4020) e dos lotes
+de envio assíncrono a partir dos eventos validados.
+
+ - Cada tipo de evento tem um template de texto pré-compilado (`TEMPLATES`);
+   gerar um evento é só formatar valores e preencher o template, sem DOM.
+ - A Reinf identifica o evento por estabelecimento + prestador/beneficiário +
+   perApur (`chave_evento`): os documentos gravados com a mesma chave viram um
+   único evento, com uma `nfs` por nota e os totais somados no R-2010, e um
+   `idePgto` por natRend com um `infoPgto` por pagamento no R-4010/R-4020.
+ - `GeradorLotes` junta os documentos por chave e, em `fechar()`, escreve os
+   eventos nos lotes do contribuinte, fechando cada lote ao atingir
+   `REINF_EVENTOS_POR_LOTE` (50, máximo do envio assíncrono).
+ - O Id do evento segue "ID" + tpInsc + nrInsc (14, completado com zeros) +
+   AAAAMMDDHHMMSS + sequencial (5); o horário é um relógio lógico que avança
+   um segundo quando o sequencial estoura, então os Ids nunca se repetem.
+
+A assinatura XMLDSig de cada evento não é feita aqui; ela é aplicada pelo
+transmissor antes do envio.
+
+O número do documento (numDocto no R-2010) não tem campo próprio nos leiautes
+do R-4010/R-4020; ele vai em `observ` como "NumDoc <n>", o que permite a
+ingestão de volta (ver `ingestao_xml.py`).
+
+Uso (CLI):
+    python xml_reinf.py --evento R4010 --cliente 09524519000143 --de 2025-01 --ate 2025-01 --saida lotes/
+    python xml_reinf.py --bench 100000 --saida /tmp/lotes
+"""
+from xml.sax.saxutils import escape
+from datetime import date, datetime, timedelta
+import argparse
+import asyncio
+import logging
+import math
+import os
+import time
+
+logger = logging.getLogger(__name__)
+
+REINF_VERSAO_LEIAUTE = os.getenv("REINF_VERSAO_LEIAUTE", "v2_01_02")
+REINF_EVENTOS_POR_LOTE = int(os.getenv("REINF_EVENTOS_POR_LOTE", 50))   # máximo do envio assíncrono
+REINF_TP_AMB = int(os.getenv("REINF_TP_AMB", 2))                          # 1 = produção, 2 = produção restrita
+REINF_VER_PROC = os.getenv("REINF_VER_PROC", "validador-reinf-1.0")
+
+_NS_EVENTO = "http://www.reinf.esocial.gov.br/schemas/{}/" + REINF_VERSAO_LEIAUTE
+NAMESPACES = {
+    "R2010": _NS_EVENTO.format("evtTomadorServicos"),
+    "R4010": _NS_EVENTO.format("evt4010PagtoBeneficiarioPF"),
+    "R4020": _NS_EVENTO.format("evt4020PagtoBeneficiarioPJ"),
+}
+NS_LOTE = "http://www.reinf.esocial.gov.br/schemas/envioLoteEventosAssincrono/v1_00_00"
+
+# Elemento raiz de cada evento dentro de <Reinf>
+ELEMENTOS = {"R2010": "evtServTom", "R4010": "evtRetPF", "R4020": "evtRetPJ"}
+
+_IDE_EVENTO = (
+    "<ideEvento><indRetif>1</indRetif><perApur>{perApur}</perApur><tpAmb>{tpAmb}</tpAmb>"
+    "<procEmi>1</procEmi><verProc>{verProc}</verProc></ideEvento>"
+    "<ideContri><tpInsc>1</tpInsc><nrInsc>{nrInsc}</nrInsc></ideContri>"
+)
+
+# Cada evento é (abertura, item, fecho): a abertura leva a identificação do evento
+# (estabelecimento + prestador/beneficiário + perApur) e os totais, o item se
+# repete por documento (`nfs` no R-2010, `infoPgto` no R-4010/R-4020).
+TEMPLATES = {
+    "R2010": (
+        '<Reinf xmlns="' + NAMESPACES["R2010"] + '"><evtServTom id="{id}">' + _IDE_EVENTO +
+        "<infoServTom><ideEstabObra><tpInscEstab>{tpInscEstab}</tpInscEstab><nrInscEstab>{nrInscEstab}</nrInscEstab>"
+        "<indObra>{indObra}</indObra><idePrestServ><cnpjPrestador>{cnpjPrestador}</cnpjPrestador>"
+        "<vlrTotalBruto>{vlrTotalBruto}</vlrTotalBruto><vlrTotalBaseRet>{vlrTotalBaseRet}</vlrTotalBaseRet>"
+        "<vlrTotalRetPrinc>{vlrTotalRetPrinc}</vlrTotalRetPrinc><indCPRB>{indCPRB}</indCPRB>",
+        "<nfs><serie>{serie}</serie><numDocto>{numDocto}</numDocto><dtEmissaoNF>{dtEmissaoNF}</dtEmissaoNF>"
+        "<vlrBruto>{vlrBruto}</vlrBruto><infoTpServ><tpServico>{tpServico}</tpServico>"
+        "<vlrBaseRet>{vlrBaseRet}</vlrBaseRet><vlrRetencao>{vlrRetencao}</vlrRetencao></infoTpServ></nfs>",
+        "</idePrestServ></ideEstabObra></infoServTom></evtServTom></Reinf>",
+    ),
+    "R4010": (
+        '<Reinf xmlns="' + NAMESPACES["R4010"] + '"><evtRetPF id="{id}">' + _IDE_EVENTO +
+        "<ideEstab><tpInscEstab>1</tpInscEstab><nrInscEstab>{nrInscEstab}</nrInscEstab>"
+        "<ideBenef><cpfBenef>{cpfBenef}</cpfBenef>",
+        "<infoPgto><dtFG>{dtFG}</dtFG><vlrRendBruto>{vlrRendBruto}</vlrRendBruto>"
+        "<vlrRendTrib>{vlrRendTrib}</vlrRendTrib><vlrIR>{vlrIR}</vlrIR><observ>NumDoc {NumDoc}</observ></infoPgto>",
+        "</ideBenef></ideEstab></evtRetPF></Reinf>",
+    ),
+    "R4020": (
+        '<Reinf xmlns="' + NAMESPACES["R4020"] + '"><evtRetPJ id="{id}">' + _IDE_EVENTO +
+        "<ideEstab><tpInscEstab>1</tpInscEstab><nrInscEstab>{nrInscEstab}</nrInscEstab>"
+        "<ideBenef><cnpjBenef>{cnpjBenef}</cnpjBenef>",
+        "<infoPgto><dtFG>{dtFG}</dtFG><vlrBruto>{vlrBruto}</vlrBruto><observ>NumDoc {NumDoc}</observ>"
+        "<retencoes><vlrBaseIR>{vlrBaseIR}</vlrBaseIR><vlrIR>{vlrIR}</vlrIR>"
+        "<vlrBaseAgreg>{vlrBaseAgreg}</vlrBaseAgreg><vlrAgreg>{vlrAgreg}</vlrAgreg></retencoes></infoPgto>",
+        "</ideBenef></ideEstab></evtRetPJ></Reinf>",
+    ),
+}
+# `str.format` ligado de antemão: evita o lookup do método a cada evento/documento
+_FORMATADORES = {tipo: tuple(parte.format_map for parte in t) for tipo, t in TEMPLATES.items()}
+
+_CAMPOS_VALOR = {
+    "R2010": ("vlrBruto", "vlrBaseRet", "vlrRetencao"),
+    "R4010": ("vlrRendBruto", "vlrRendTrib", "vlrIR"),
+    "R4020": ("vlrBruto", "vlrBaseIR", "vlrIR", "vlrBaseAgreg", "vlrAgreg"),
+}
+_CAMPO_PERIODO = {"R2010": "dtEmissaoNF", "R4010": "dtFG", "R4020": "dtFG"}
+# Contraparte que, com o estabelecimento e o perApur, identifica o evento
+_CAMPO_CONTRAPARTE = {"R2010": "cnpjPrestador", "R4010": "cpfBenef", "R4020": "cnpjBenef"}
+# Totais do idePrestServ (R-2010): total ← valor somado das notas
+_TOTAIS_2010 = (("vlrTotalBruto", "vlrBruto"), ("vlrTotalBaseRet", "vlrBaseRet"), ("vlrTotalRetPrinc", "vlrRetencao"))
+
+
+def formatar_valor(v: float) -> str:
+    """Valor monetário no formato do leiaute: decimal com vírgula e 2 casas."""
+    return f"{v:.2f}".replace(".", ",")
+
+
+def nr_insc_contribuinte(tipo: str, dados: dict) -> str:
+    """Raiz do CNPJ (8 dígitos) do contribuinte declarante."""
+    if tipo == "R2010":
+        return str(dados["nrInsc"])[:8]
+    return str(dados["nrInscEstab"])[:8]
+
+
+def _data(tipo: str, dados: dict) -> date:
+    dt = dados[_CAMPO_PERIODO[tipo]]
+    return date.fromisoformat(dt) if isinstance(dt, str) else dt
+
+
+def chave_evento(tipo: str, dados: dict) -> tuple:
+    """
+    Identificação do evento a que o documento pertence: a Reinf aceita um único
+    evento por estabelecimento + prestador/beneficiário + perApur, então todos
+    os documentos com a mesma chave vão no mesmo evento.
+    """
+    estab = str(dados["nrInscEstab"])
+    if tipo == "R2010":
+        estab = (nr_insc_contribuinte(tipo, dados), dados["indObra"], estab)
+    return tipo, estab, str(dados[_CAMPO_CONTRAPARTE[tipo]]), f"{_data(tipo, dados):%Y-%m}"
+
+
+def _item(tipo: str, dados: dict) -> str:
+    """Trecho repetido de um documento (`nfs` ou `infoPgto`)."""
+    valores = dict(dados)
+    for campo in _CAMPOS_VALOR[tipo]:
+        valores[campo] = formatar_valor(valores[campo])
+    valores[_CAMPO_PERIODO[tipo]] = _data(tipo, dados).isoformat()
+    return _FORMATADORES[tipo][1](valores)
+
+
+def evento_xml(tipo: str, documentos: list, id_evento: str) -> str:
+    """
+    Gera o XML `<Reinf>` de um evento com todos os `documentos` (campos já
+    validados: `modelo.__dict__` ou dicts equivalentes) de uma mesma
+    `chave_evento`: uma `nfs` por nota no R-2010, com os totais somados no
+    `idePrestServ`; no R-4010/R-4020 um `idePgto` por natRend com um `infoPgto`
+    por pagamento. `ValueError` se as notas de um R-2010 divergem no indCPRB.
+    """
+    primeiro = documentos[0]
+    valores = {campo: escape(str(primeiro[campo])) for campo in ("nrInscEstab", _CAMPO_CONTRAPARTE[tipo])}
+    valores["perApur"] = f"{_data(tipo, primeiro):%Y-%m}"
+    valores["nrInsc"] = nr_insc_contribuinte(tipo, primeiro)
+    valores["tpAmb"] = REINF_TP_AMB
+    valores["verProc"] = REINF_VER_PROC
+    valores["id"] = id_evento
+    abertura, _, fecho = _FORMATADORES[tipo]
+    if tipo == "R2010":
+        valores["indObra"] = primeiro["indObra"]
+        valores["tpInscEstab"] = 1 if primeiro["indObra"] == 0 else 4
+        ind_cprb = {d["indCPRB"] for d in documentos}
+        if len(ind_cprb) > 1:
+            # o indCPRB é do prestador no período: notas divergentes não cabem num idePrestServ
+            raise ValueError(f"indCPRB divergente entre as notas do prestador {primeiro['cnpjPrestador']} "
+                             f"em {valores['perApur']}: {sorted(ind_cprb)}")
+        valores["indCPRB"] = primeiro["indCPRB"]
+        for total, campo in _TOTAIS_2010:
+            valores[total] = formatar_valor(math.fsum(d[campo] for d in documentos))
+        corpo = "".join(_item(tipo, d) for d in documentos)
+    else:
+        por_natureza = {}
+        for d in documentos:
+            por_natureza.setdefault(d["natRend"], []).append(d)
+        corpo = "".join(
+            f"<idePgto><natRend>{nat_rend}</natRend>" + "".join(_item(tipo, d) for d in pagamentos) + "</idePgto>"
+            for nat_rend, pagamentos in por_natureza.items()
+        )
+    return abertura(valores) + corpo + fecho(valores)
+
+
+class _Lote:
+    """Arquivo de um lote aberto, escrito evento a evento."""
+
+    def __init__(self, caminho: str, nr_insc: str):
+        self.caminho = caminho
+        self.qtd = 0
+        self.arquivo = open(caminho, "w", encoding="utf-8")
+        self.arquivo.write(
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            f'<Reinf xmlns="{NS_LOTE}"><envioLoteEventos>'
+            f"<ideContribuinte><tpInsc>1</tpInsc><nrInsc>{nr_insc}</nrInsc></ideContribuinte><eventos>"
+        )
+
+    def adicionar(self, id_evento: str, xml: str) -> None:
+        self.arquivo.write(f'<evento Id="{id_evento}">')
+        self.arquivo.write(xml)
+        self.arquivo.write("</evento>")
+        self.qtd += 1
+
+    def fechar(self) -> None:
+        self.arquivo.write("</eventos></envioLoteEventos></Reinf>")
+        self.arquivo.close()
+
+
+class GeradorLotes:
+    """
+    Junta os documentos em eventos por `chave_evento` e os eventos em lotes por
+    contribuinte, de até `por_lote` eventos, gravados em `diretorio`.
+
+    Um evento só fica completo quando todos os documentos da sua chave chegaram,
+    então os documentos ficam pendentes até `descarregar()` (ou `fechar()`);
+    a partir daí os eventos são escritos nos lotes em streaming.
+    """
+
+    def __init__(self, diretorio: str, por_lote: int = REINF_EVENTOS_POR_LOTE, inicio: datetime = None):
+        self.diretorio = diretorio
+        self.por_lote = por_lote
+        self._abertos = {}        # nrInsc → _Lote
+        self._pendentes = {}      # chave_evento → [documentos]
+        self._seq_lote = 0
+        self._relogio = (inicio or datetime.now()).replace(microsecond=0)
+        self._relogio_txt = f"{self._relogio:%Y%m%d%H%M%S}"
+        self._seq_evento = 0
+        self.lotes = []           # caminhos dos lotes fechados
+        self.eventos = 0
+        self.documentos = 0
+        self.rejeitados = []      # (chave_evento, motivo) dos eventos que não puderam ser montados
+        os.makedirs(diretorio, exist_ok=True)
+
+    def _proximo_id(self, nr_insc: str) -> str:
+        self._seq_evento += 1
+        if self._seq_evento > 99999:
+            self._seq_evento = 1
+            self._relogio += timedelta(seconds=1)
+            self._relogio_txt = f"{self._relogio:%Y%m%d%H%M%S}"
+        return f"ID1{nr_insc.ljust(14, '0')}{self._relogio_txt}{self._seq_evento:05d}"
+
+    def adicionar(self, tipo: str, dados: dict) -> None:
+        """Acrescenta um documento (dados validados) ao evento pendente da sua chave."""
+        self._pendentes.setdefault(chave_evento(tipo, dados), []).append(dados)
+        self.documentos += 1
+
+    def adicionar_modelo(self, modelo) -> None:
+        """Acrescenta uma instância validada de Evt2010/Evt4010/Evt4020."""
+        self.adicionar(modelo.TpEvento, modelo.__dict__)
+
+    def _escrever(self, tipo: str, documentos: list) -> str:
+        """Escreve um evento no lote do contribuinte; retorna o Id gerado."""
+        nr_insc = nr_insc_contribuinte(tipo, documentos[0])
+        id_evento = self._proximo_id(nr_insc)
+        xml = evento_xml(tipo, documentos, id_evento)
+        lote = self._abertos.get(nr_insc)
+        if lote is None:
+            self._seq_lote += 1
+            caminho = os.path.join(self.diretorio, f"lote_{nr_insc}_{self._seq_lote:06d}.xml")
+            lote = self._abertos[nr_insc] = _Lote(caminho, nr_insc)
+        lote.adicionar(id_evento, xml)
+        self.eventos += 1
+        if lote.qtd >= self.por_lote:
+            lote.fechar()
+            self.lotes.append(lote.caminho)
+            del self._abertos[nr_insc]
+        return id_evento
+
+    def descarregar(self) -> None:
+        """Escreve os eventos pendentes. Só chame quando nenhuma das chaves receberá mais documentos."""
+        for chave, documentos in self._pendentes.items():
+            try:
+                self._escrever(chave[0], documentos)
+            except ValueError as e:
+                logger.error(f"Evento {chave} não gerado ({len(documentos)} documentos): {e}")
+                self.rejeitados.append((chave, str(e)))
+        self._pendentes.clear()
+
+    def fechar(self) -> list:
+        """Escreve os eventos pendentes, fecha os lotes incompletos e retorna todos os arquivos gerados."""
+        self.descarregar()
+        for lote in self._abertos.values():
+            lote.fechar()
+            self.lotes.append(lote.caminho)
+        self._abertos.clear()
+        return self.lotes
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.fechar()
+
+
+async def _gerar_do_banco(args) -> GeradorLotes:
+    from eventos.modelos import MODELOS
+    from exportacao import documentos, periodo_para_int
+
+    modelo = MODELOS[args.evento]
+    with GeradorLotes(args.saida) as gerador:
+        async for doc in documentos(args.evento, args.cliente, periodo_para_int(args.de), periodo_para_int(args.ate)):
+            # revalida para normalizar os campos (CNPJ/CPF limpos, datas) como no momento do envio
+            gerador.adicionar_modelo(modelo(**doc))
+    return gerador
+
+
+def _instancias_bench(n: int) -> list:
+    """
+    N instâncias validadas dos três tipos, de poucos estabelecimentos e contrapartes
+    num único período, para que cada evento junte vários documentos.
+    """
+    from eventos.modelos import MODELOS
+    from gerador_eventos import GeradorEventos
+
+    gerador = GeradorEventos(semente=42, estabelecimentos=5, contrapartes=50,
+                             periodo_de="2025-01", periodo_ate="2025-01")
+    ind_cprb = {}       # o gerador sorteia o indCPRB por nota; aqui ele fica fixo por prestador
+    instancias = []
+    while len(instancias) < n:
+        payload, _ = gerador.evento()
+        if payload["TpEvento"] == "R2010" and \
+                ind_cprb.setdefault(payload["cnpjPrestador"], payload["indCPRB"]) != payload["indCPRB"]:
+            continue
+        instancias.append(MODELOS[payload["TpEvento"]](**payload))
+    return instancias
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Gera lotes XML da EFD-Reinf a partir dos eventos validados")
+    parser.add_argument('--evento', choices=["R2010", "R4010", "R4020"])
+    parser.add_argument('--cliente', help="CNPJ do cliente cujos eventos gravados serão exportados")
+    parser.add_argument('--de', help="Período inicial AAAA-MM")
+    parser.add_argument('--ate', help="Período final AAAA-MM")
+    parser.add_argument('--saida', required=True, help="Diretório dos lotes")
+    parser.add_argument('--bench', type=int, help="Gera N documentos sintéticos e mede a vazão")
+    args = parser.parse_args()
+
+    if args.bench:
+        instancias = _instancias_bench(args.bench)
+        inicio = time.perf_counter()
+        with GeradorLotes(args.saida) as gerador:
+            for m in instancias:
+                gerador.adicionar_modelo(m)
+    else:
+        if not (args.evento and args.cliente):
+            parser.error("--evento e --cliente são obrigatórios (ou use --bench)")
+        inicio = time.perf_counter()
+        gerador = asyncio.run(_gerar_do_banco(args))
+    decorrido = time.perf_counter() - inicio
+    print(f"{gerador.documentos} documentos em {gerador.eventos} eventos e {len(gerador.lotes)} lotes, "
+          f"{decorrido:.2f}s ({gerador.documentos / decorrido:.0f} documentos/s)")
+    if gerador.rejeitados:
+        print(f"{len(gerador.rejeitados)} eventos não gerados (ver log)")
+
+
+if __name__ == "__main__":
+    main()